@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import NamedTuple, Protocol
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import Connection, event, func, make_url, select
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+
+from buddy.auth.models import User
+from buddy.conf import settings
+from buddy.metrics import Counter
+from buddy.utils.cache_utils import TTLCache
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+USER_CACHE_INVALIDATION_CHANNEL = "buddy_user_cache"
+
+USER_CACHE_INVALIDATING_ATTRIBUTES = ("email", "password", "tier")
+
+INVALIDATED_USER_IDS_SESSION_KEY = "buddy_invalidated_user_ids"
+
+USER_CACHE_HITS = Counter(
+    "buddy_user_cache_hits", "Authenticated users served from cache"
+)
+USER_CACHE_MISSES = Counter(
+    "buddy_user_cache_misses", "Authenticated users loaded from the database"
+)
+
+
+class CachedUser(NamedTuple):
+    id: int
+    email: str
+    tier: str
+
+    @staticmethod
+    def from_user(user: User) -> CachedUser:
+        assert user.id is not None
+        tier = user.formatted_tier
+        assert tier is not None
+
+        return CachedUser(id=user.id, email=user.email, tier=tier.name)
+
+    def as_user(self) -> User:
+        # Transient and without a password, only what authorization needs.
+        return User(id=self.id, email=self.email, tier=self.tier)
+
+
+class UserCacheable(Protocol):
+    def get(self, user_id: int) -> CachedUser | None: ...
+
+    def set(self, user: CachedUser, ttl_seconds: float) -> None: ...
+
+    def invalidate(self, user_id: int) -> None:
+        """Drops the user from the cache of every worker."""
+        ...
+
+    def invalidate_locally(self, user_id: int) -> None: ...
+
+    def notify_invalidation(self, user_id: int, connection: Connection) -> None:
+        """Other workers drop the user once the transaction of `connection` commits."""
+        ...
+
+    def clear(self) -> None: ...
+
+
+class InMemoryUserCache(UserCacheable):
+    def __init__(self, max_size: int) -> None:
+        self.__entries: TTLCache[int, CachedUser] = TTLCache(max_size=max_size)
+
+    def get(self, user_id) -> CachedUser | None:
+        return self.__entries.get(user_id)
+
+    def set(self, user, ttl_seconds) -> None:
+        self.__entries.set(user.id, user, ttl_seconds=ttl_seconds)
+
+    def invalidate(self, user_id) -> None:
+        self.invalidate_locally(user_id)
+
+    def invalidate_locally(self, user_id) -> None:
+        self.__entries.delete(user_id)
+
+    def notify_invalidation(self, user_id, connection) -> None:
+        pass
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+
+class PostgresNotifyUserCache(InMemoryUserCache):
+    """
+    Caches per worker like `InMemoryUserCache`, invalidations are broadcast to every
+    worker through Postgres NOTIFY.
+    """
+
+    def __init__(self, max_size: int, database_url: str) -> None:
+        super().__init__(max_size=max_size)
+
+        self.__conninfo = (
+            make_url(database_url)
+            .set(drivername="postgresql")
+            .render_as_string(hide_password=False)
+        )
+        # Sent by the listener, so invalidating never waits on a connection.
+        self.__pending_notifications: queue.SimpleQueue[int] = queue.SimpleQueue()
+        self.__stopped = threading.Event()
+        self.__listening = threading.Event()
+        self.__listener = threading.Thread(
+            target=self.__listen, name="user-cache-listener", daemon=True
+        )
+        self.__listener.start()
+
+    def invalidate(self, user_id) -> None:
+        self.invalidate_locally(user_id)
+        self.__pending_notifications.put(user_id)
+
+    def notify_invalidation(self, user_id, connection) -> None:
+        # NOTIFY is transactional, rolled back updates don't invalidate anything.
+        connection.execute(
+            select(func.pg_notify(USER_CACHE_INVALIDATION_CHANNEL, str(user_id)))
+        )
+
+    def wait_until_listening(self, timeout: float | None = None) -> bool:
+        return self.__listening.wait(timeout)
+
+    def close(self) -> None:
+        self.__stopped.set()
+        self.__listener.join()
+
+    def __listen(self) -> None:
+        while not self.__stopped.is_set():
+            try:
+                with psycopg.connect(self.__conninfo, autocommit=True) as connection:
+                    connection.execute(
+                        sql.SQL("LISTEN {}").format(
+                            sql.Identifier(USER_CACHE_INVALIDATION_CHANNEL)
+                        )
+                    )
+                    # Invalidations sent while disconnected are lost.
+                    self.clear()
+                    self.__listening.set()
+                    while not self.__stopped.is_set():
+                        for notify in connection.notifies(timeout=1):
+                            self.__invalidate_notified(notify.payload)
+                        self.__send_pending_notifications(connection)
+            except psycopg.Error:
+                self.__listening.clear()
+                logger.warning("User cache listener disconnected, retrying")
+                self.__stopped.wait(5)
+
+    def __send_pending_notifications(self, connection: psycopg.Connection) -> None:
+        while not self.__pending_notifications.empty():
+            user_id = self.__pending_notifications.get()
+            try:
+                connection.execute(
+                    "SELECT pg_notify(%s, %s)",
+                    (USER_CACHE_INVALIDATION_CHANNEL, str(user_id)),
+                )
+            except psycopg.Error:
+                # Sent again once reconnected.
+                self.__pending_notifications.put(user_id)
+                raise
+
+    def __invalidate_notified(self, payload: str) -> None:
+        try:
+            user_id = int(payload)
+        except ValueError:
+            return
+
+        self.invalidate_locally(user_id)
+
+
+__user_cache: UserCacheable | None = None
+
+
+def get_user_cache() -> UserCacheable:
+    global __user_cache
+    if __user_cache is None:
+        if settings.user_cache_backend == "postgres":
+            __user_cache = PostgresNotifyUserCache(
+                max_size=settings.user_cache_max_size,
+                database_url=settings.database_url,
+            )
+        else:
+            __user_cache = InMemoryUserCache(max_size=settings.user_cache_max_size)
+
+    return __user_cache
+
+
+def get_cached_user(user_id: int) -> User | None:
+    cached_user = get_user_cache().get(user_id)
+    if cached_user is None:
+        USER_CACHE_MISSES.inc()
+        return None
+
+    USER_CACHE_HITS.inc()
+
+    return cached_user.as_user()
+
+
+def cache_user(user: User, token_expires_at: int) -> None:
+    ttl_seconds = min(settings.user_cache_ttl_seconds, token_expires_at - time.time())
+    get_user_cache().set(CachedUser.from_user(user), ttl_seconds=ttl_seconds)
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Needed after bulk updates of users, ORM updates are picked up on commit."""
+
+    get_user_cache().invalidate(user_id)
+
+
+@event.listens_for(User, "after_update")
+def __mark_updated_user(_mapper, connection: Connection, target: User) -> None:
+    if not any(
+        map(
+            lambda attribute: get_history(target, attribute).has_changes(),
+            USER_CACHE_INVALIDATING_ATTRIBUTES,
+        )
+    ):
+        return
+
+    session = object_session(target)
+    assert session is not None
+    assert target.id is not None
+
+    session.info.setdefault(INVALIDATED_USER_IDS_SESSION_KEY, set()).add(target.id)
+    get_user_cache().notify_invalidation(target.id, connection=connection)
+
+
+@event.listens_for(Session, "after_commit")
+def __invalidate_committed_users(session: Session) -> None:
+    # Other workers have been notified by the committed transaction.
+    for user_id in session.info.pop(INVALIDATED_USER_IDS_SESSION_KEY, set()):
+        get_user_cache().invalidate_locally(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def __forget_rolled_back_users(session: Session) -> None:
+    session.info.pop(INVALIDATED_USER_IDS_SESSION_KEY, None)
@@ -1,7 +1,6 @@
 from typing import Annotated, Protocol
 
 from fastapi import Depends
-from sqlmodel import Session
 
 from buddy.auth.exceptions import InvalidCredentials
 from buddy.auth.models import User, UserToken
@@ -15,45 +14,51 @@ from buddy.auth.schemas import (
 )
 from buddy.auth.utils.jwt_utils import encode_jwt
 from buddy.auth.utils.user import get_user_by_authorization_token
-from buddy.database import Databaseable, get_database
+from buddy.database import Databaseable, create_async_session, get_database
 from buddy.llm.providers import get_model_list_available_to_user
 
 
 class AuthControllable(Protocol):
     database: Databaseable
 
-    def register(self, email: str, password: str) -> RegisterResponse: ...
+    async def register(self, email: str, password: str) -> RegisterResponse: ...
 
-    def login(self, email: str, password: str) -> LoginResponse: ...
+    async def login(self, email: str, password: str) -> LoginResponse: ...
 
-    def session(self, user: User) -> SessionResponse: ...
+    async def session(self, user: User) -> SessionResponse: ...
 
-    def refresh(self, refresh_token: str, authorization: str) -> RefreshResponse: ...
+    async def refresh(
+        self, refresh_token: str, authorization: str
+    ) -> RefreshResponse: ...
 
 
 class AuthController(AuthControllable):
     def __init__(self, database: Databaseable) -> None:
         self.database = database
 
-    def register(self, email, password) -> RegisterResponse:
+    async def register(self, email, password) -> RegisterResponse:
         validated_payload = UserPayload(email=email, password=password)
-        with Session(self.database.engine) as session:
-            User.create(payload=validated_payload, session=session)
+        async with create_async_session(self.database) as session:
+            await User.create_async(payload=validated_payload, session=session)
 
             return RegisterResponse(detail="Created")
 
-    def login(self, email, password) -> LoginResponse:
+    async def login(self, email, password) -> LoginResponse:
         validated_payload = UserPayload(email=email, password=password)
-        with Session(self.database.engine) as session:
-            user = User.get_by_email(email=validated_payload.email, session=session)
+        async with create_async_session(self.database) as session:
+            user = await User.get_by_email_async(
+                email=validated_payload.email, session=session
+            )
             if user is None:
                 raise InvalidCredentials
 
-            if not user.verify_password(raw_password=validated_payload.password):
+            if not await user.verify_password_async(
+                raw_password=validated_payload.password
+            ):
                 raise InvalidCredentials
 
             token = encode_jwt(user)
-            refresh_token = UserToken.create(user=user, session=session)
+            refresh_token = await UserToken.create_async(user=user, session=session)
 
             return LoginResponse(
                 detail="OK",
@@ -63,7 +68,7 @@ class AuthController(AuthControllable):
                 expiry_timestamp=token.expiry_timestamp,
             )
 
-    def session(self, user) -> SessionResponse:
+    async def session(self, user) -> SessionResponse:
         assert user is not None
 
         user_tier = user.formatted_tier
@@ -79,21 +84,17 @@ class AuthController(AuthControllable):
 
         return response
 
-    def refresh(self, refresh_token, authorization) -> RefreshResponse:
-        user = get_user_by_authorization_token(
+    async def refresh(self, refresh_token, authorization) -> RefreshResponse:
+        user = await get_user_by_authorization_token(
             authorization=authorization, database=self.database, verify_exp=False
         )
         if user is None:
             raise InvalidCredentials
 
-        with Session(self.database.engine) as session:
-            user_tokens = UserToken.get_all_for_user(user=user, session=session)
-            found_user_token = None
-            for user_token in user_tokens:
-                if user_token.verify_key(refresh_token):
-                    found_user_token = user_token
-                    break
-
+        async with create_async_session(self.database) as session:
+            found_user_token = await UserToken.get_by_key_async(
+                user=user, raw_key=refresh_token, session=session
+            )
             if found_user_token is None:
                 raise InvalidCredentials
 
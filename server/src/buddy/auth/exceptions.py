@@ -20,3 +20,17 @@ class InvalidCredentials(BuddyError):
             [BuddyErrorDetail(msg="Invalid credentials", type="invalid_credentials")],
             headers,
         )
+
+
+class PasswordHashingUnavailable(BuddyError):
+    def __init__(self, headers: dict[str, str] | None = None) -> None:
+        super().__init__(
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            [
+                BuddyErrorDetail(
+                    msg="Too many requests, try again later",
+                    type="service_unavailable",
+                )
+            ],
+            headers if headers is not None else {"Retry-After": "1"},
+        )
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import bcrypt
+
+from buddy.auth.exceptions import PasswordHashingUnavailable
+from buddy.conf import settings
+from buddy.metrics import Histogram
+
+HASHING_ENCODING = "utf-8"
+
+PASSWORD_HASHING_QUEUE_WAIT = Histogram(
+    "buddy_password_hashing_queue_wait_seconds",
+    "Time password hashing work waited for a free hashing worker",
+)
+PASSWORD_HASHING_DURATION = Histogram(
+    "buddy_password_hashing_seconds",
+    "Time spent hashing or checking a password",
+    label_names=("operation",),
+)
+
+T = TypeVar("T")
+
+
+class HashingPool:
+    """
+    Runs bcrypt away from the threadpool that serves requests. At most `max_workers`
+    hashes run at once and `max_queue_size` more may wait, anything beyond that is
+    rejected straight away.
+    """
+
+    def __init__(
+        self, max_workers: int, max_queue_size: int, use_processes: bool = False
+    ) -> None:
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.__executor: Executor
+        if use_processes:
+            self.__executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix="password-hashing"
+            )
+        self.__pending = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self.__pending
+
+    async def run(self, operation: str, function: Callable[..., T], *args) -> T:
+        with self.__lock:
+            if self.__pending >= self.max_workers + self.max_queue_size:
+                raise PasswordHashingUnavailable
+
+            self.__pending += 1
+
+        submitted_at = time.monotonic()
+        try:
+            future = self.__executor.submit(timed_call, function, *args)
+        except BaseException:
+            self.__finish()
+            raise
+
+        # Work keeps running when the request gets cancelled, so it's only done once
+        # the executor is done with it.
+        future.add_done_callback(lambda _: self.__finish())
+        result, started_at, finished_at = await asyncio.wrap_future(future)
+
+        PASSWORD_HASHING_QUEUE_WAIT.observe(started_at - submitted_at)
+        PASSWORD_HASHING_DURATION.observe(finished_at - started_at, operation=operation)
+
+        return result
+
+    def __finish(self) -> None:
+        with self.__lock:
+            self.__pending -= 1
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown()
+
+
+def timed_call(function: Callable[..., T], *args) -> tuple[T, float, float]:
+    # The monotonic clock is shared between processes, so the caller can compare it.
+    started_at = time.monotonic()
+    result = function(*args)
+
+    return result, started_at, time.monotonic()
+
+
+__hashing_pool: HashingPool | None = None
+
+
+def get_hashing_pool() -> HashingPool:
+    global __hashing_pool
+    if __hashing_pool is None:
+        __hashing_pool = HashingPool(
+            max_workers=settings.password_hashing_max_workers,
+            max_queue_size=settings.password_hashing_max_queue_size,
+            use_processes=settings.password_hashing_use_processes,
+        )
+
+    return __hashing_pool
+
+
+def create_hash(raw: str) -> str:
+    salt = bcrypt.gensalt()
+
+    return bcrypt.hashpw(raw.encode(HASHING_ENCODING), salt).decode(HASHING_ENCODING)
+
+
+def check_hash(raw: str, hashed: str) -> bool:
+    return bcrypt.checkpw(raw.encode(HASHING_ENCODING), hashed.encode(HASHING_ENCODING))
+
+
+async def create_hash_async(raw: str) -> str:
+    return await get_hashing_pool().run("hash", create_hash, raw)
+
+
+async def check_hash_async(raw: str, hashed: str) -> bool:
+    return await get_hashing_pool().run("check", check_hash, raw, hashed)
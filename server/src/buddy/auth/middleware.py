@@ -16,7 +16,7 @@ async def get_request_user(
     authorization: Annotated[str, Header()],
     database: Annotated[Databaseable, Depends(get_database)],
 ) -> User:
-    user = get_user_by_authorization_token(
+    user = await get_user_by_authorization_token(
         authorization=authorization, database=database, verify_exp=True
     )
     if user is None:
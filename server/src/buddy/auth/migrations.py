@@ -0,0 +1,20 @@
+from sqlalchemy import Connection, text
+
+
+def add_user_token_selector(connection: Connection) -> None:
+    # Existing rows keep a NULL selector and are verified with bcrypt until they
+    # rotate out.
+    connection.execute(
+        text("ALTER TABLE user_token ADD COLUMN IF NOT EXISTS selector VARCHAR")
+    )
+    connection.execute(
+        text(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_user_token_selector
+            ON user_token (selector)
+            """
+        )
+    )
+
+
+MIGRATIONS = [add_user_token_selector]
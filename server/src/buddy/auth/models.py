@@ -1,17 +1,27 @@
 from __future__ import annotations
 
 import binascii
+import hashlib
+import hmac
 import os
 from datetime import datetime
 from typing import TYPE_CHECKING, Sequence
 
-import bcrypt
 from pydantic import EmailStr
 from sqlalchemy import Column, DateTime
 from sqlalchemy_utils.types.choice import ChoiceType  # type: ignore
 from sqlmodel import Field, SQLModel, Session, String, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
 from buddy.auth.exceptions import UserAlreadyExists
+from buddy.auth.hashing import (
+    HASHING_ENCODING,
+    check_hash,
+    check_hash_async,
+    create_hash,
+    create_hash_async,
+)
 from buddy.conf import settings
 from buddy.money.tiers import UserTiers
 from buddy.utils.datetime_utils import datetime_now_with_timezone
@@ -19,10 +29,14 @@ from buddy.utils.datetime_utils import datetime_now_with_timezone
 if TYPE_CHECKING:
     from buddy.auth.schemas import UserPayload
 
-HASHING_ENCODING = "utf-8"
-
 USERS_TIER_MAX_LENGTH = 20
 
+REFRESH_TOKEN_SEPARATOR = "."
+
+REFRESH_TOKEN_SELECTOR_BYTES = 12
+
+REFRESH_TOKEN_VERIFIER_BYTES = 20
+
 
 assert all(
     map(lambda tier: len(tier[0]) < USERS_TIER_MAX_LENGTH, UserTiers.get_choices())
@@ -63,22 +77,26 @@ class User(SQLModel, table=True):
         return tier
 
     def verify_password(self, raw_password: str) -> bool:
-        return bcrypt.checkpw(
-            raw_password.encode(HASHING_ENCODING),
-            self.password.encode(HASHING_ENCODING),
-        )
+        return check_hash(raw=raw_password, hashed=self.password)
+
+    async def verify_password_async(self, raw_password: str) -> bool:
+        return await check_hash_async(raw=raw_password, hashed=self.password)
 
     @staticmethod
     def get_by_email(email: str, session: Session) -> User | None:
-        query = select(User).where(User.email == email).limit(1)
+        return session.exec(User.__by_email_query(email)).first()
 
-        return session.exec(query).first()
+    @staticmethod
+    async def get_by_email_async(email: str, session: AsyncSession) -> User | None:
+        return (await session.exec(User.__by_email_query(email))).first()
 
     @staticmethod
     def get_by_id(id: int, session: Session) -> User | None:
-        query = select(User).where(User.id == id).limit(1)
+        return session.exec(User.__by_id_query(id)).first()
 
-        return session.exec(query).first()
+    @staticmethod
+    async def get_by_id_async(id: int, session: AsyncSession) -> User | None:
+        return (await session.exec(User.__by_id_query(id))).first()
 
     @classmethod
     def create(cls, payload: UserPayload, session: Session, commit=True) -> User:
@@ -86,11 +104,7 @@ class User(SQLModel, table=True):
         if existing_user is not None:
             raise UserAlreadyExists()
 
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(
-            payload.password.encode(HASHING_ENCODING), salt
-        ).decode(HASHING_ENCODING)
-        user = User(email=payload.email, password=hashed_password)
+        user = User(email=payload.email, password=create_hash(payload.password))
 
         session.add(user)
         if commit:
@@ -98,12 +112,46 @@ class User(SQLModel, table=True):
 
         return user
 
+    @classmethod
+    async def create_async(
+        cls, payload: UserPayload, session: AsyncSession, commit=True
+    ) -> User:
+        existing_user = await cls.get_by_email_async(
+            email=payload.email, session=session
+        )
+        if existing_user is not None:
+            raise UserAlreadyExists()
+
+        hashed_password = await create_hash_async(payload.password)
+        user = User(email=payload.email, password=hashed_password)
+
+        session.add(user)
+        if commit:
+            await session.commit()
+
+        return user
+
+    @staticmethod
+    def __by_email_query(email: str) -> SelectOfScalar[User]:
+        return select(User).where(User.email == email).limit(1)
+
+    @staticmethod
+    def __by_id_query(id: int) -> SelectOfScalar[User]:
+        return select(User).where(User.id == id).limit(1)
+
 
 class UserToken(SQLModel, table=True):
+    """
+    Refresh tokens are handed out as `<selector>.<verifier>`, the selector finds the
+    row through an index and only a keyed hash of the verifier is stored. Rows without
+    a selector were issued before that and store a bcrypt hash of the whole token.
+    """
+
     __tablename__: str = "user_token"  # type: ignore
 
     id: int | None = Field(default=None, primary_key=True)
     key: str = Field()
+    selector: str | None = Field(default=None, unique=True, index=True)
     user_id: int = Field(default=None, foreign_key=f"{User.__tablename__}.id")
     created_at: datetime = Field(
         sa_column=Column(
@@ -113,13 +161,13 @@ class UserToken(SQLModel, table=True):
 
     @staticmethod
     def get_all_for_user(user: User, session: Session) -> Sequence[UserToken]:
-        query = (
-            select(UserToken)
-            .where(UserToken.user_id == user.id)
-            .order_by(col(UserToken.created_at).asc())
-        )
+        return session.exec(UserToken.__all_for_user_query(user)).all()
 
-        return session.exec(query).all()
+    @staticmethod
+    async def get_all_for_user_async(
+        user: User, session: AsyncSession
+    ) -> Sequence[UserToken]:
+        return (await session.exec(UserToken.__all_for_user_query(user))).all()
 
     @staticmethod
     def get_last_created_token_for_user(
@@ -134,41 +182,131 @@ class UserToken(SQLModel, table=True):
 
         return session.exec(query).first()
 
+    @classmethod
+    async def get_by_key_async(
+        cls, user: User, raw_key: str, session: AsyncSession
+    ) -> UserToken | None:
+        selector = split_refresh_token(raw_key)
+        if selector is not None:
+            token = (
+                await session.exec(cls.__by_selector_query(user, selector))
+            ).first()
+            if token is None or not token.verify_key(raw_key):
+                return None
+
+            return token
+
+        legacy_tokens = (await session.exec(cls.__legacy_for_user_query(user))).all()
+        for token in legacy_tokens:
+            if await token.verify_key_async(raw_key):
+                return token
+
+        return None
+
     @classmethod
     def create(cls, user: User, session: Session) -> str:
         tokens_for_user = cls.get_all_for_user(user=user, session=session)
-        tokens_to_delete_amount = len(tokens_for_user) - (
-            settings.refresh_tokens_per_user - 1
-        )
+        for token_to_delete in cls.__tokens_to_rotate_out(tokens_for_user):
+            session.delete(token_to_delete)
 
-        assert len(tokens_for_user) <= settings.refresh_tokens_per_user, (
-            "Tokens should have been less then the amount allowed"
-        )
+        token, refresh_token = cls.__new_token(user)
+        session.add(token)
 
-        if tokens_to_delete_amount > 0:
-            tokens_to_delete = tokens_for_user[:tokens_to_delete_amount]
-            for token_to_delete in tokens_to_delete:
-                session.delete(token_to_delete)
+        session.commit()
 
-        refresh_token = cls.__generate_refresh_token()
-        salt = bcrypt.gensalt()
-        hashed_refresh_token = bcrypt.hashpw(
-            refresh_token.encode(HASHING_ENCODING), salt
-        ).decode(HASHING_ENCODING)
+        return refresh_token
 
-        token = UserToken(key=hashed_refresh_token, user_id=user.id)
+    @classmethod
+    async def create_async(cls, user: User, session: AsyncSession) -> str:
+        tokens_for_user = await cls.get_all_for_user_async(user=user, session=session)
+        for token_to_delete in cls.__tokens_to_rotate_out(tokens_for_user):
+            await session.delete(token_to_delete)
+
+        token, refresh_token = cls.__new_token(user)
         session.add(token)
 
-        session.commit()
+        await session.commit()
 
         return refresh_token
 
     def verify_key(self, raw_key: str) -> bool:
-        return bcrypt.checkpw(
-            raw_key.encode(HASHING_ENCODING),
-            self.key.encode(HASHING_ENCODING),
+        if self.selector is None:
+            return check_hash(raw=raw_key, hashed=self.key)
+
+        selector, _, verifier = raw_key.partition(REFRESH_TOKEN_SEPARATOR)
+        if not hmac.compare_digest(selector, self.selector):
+            return False
+
+        return hmac.compare_digest(create_keyed_hash(verifier), self.key)
+
+    async def verify_key_async(self, raw_key: str) -> bool:
+        if self.selector is not None:
+            return self.verify_key(raw_key)
+
+        return await check_hash_async(raw=raw_key, hashed=self.key)
+
+    @staticmethod
+    def __all_for_user_query(user: User) -> SelectOfScalar[UserToken]:
+        return (
+            select(UserToken)
+            .where(UserToken.user_id == user.id)
+            .order_by(col(UserToken.created_at).asc())
         )
 
     @staticmethod
-    def __generate_refresh_token() -> str:
-        return binascii.hexlify(os.urandom(20)).decode()
+    def __by_selector_query(user: User, selector: str) -> SelectOfScalar[UserToken]:
+        return (
+            select(UserToken)
+            .where(UserToken.selector == selector, UserToken.user_id == user.id)
+            .limit(1)
+        )
+
+    @staticmethod
+    def __legacy_for_user_query(user: User) -> SelectOfScalar[UserToken]:
+        return UserToken.__all_for_user_query(user).where(
+            col(UserToken.selector).is_(None)
+        )
+
+    @staticmethod
+    def __tokens_to_rotate_out(
+        tokens_for_user: Sequence[UserToken],
+    ) -> Sequence[UserToken]:
+        assert len(tokens_for_user) <= settings.refresh_tokens_per_user, (
+            "Tokens should have been less then the amount allowed"
+        )
+
+        tokens_to_delete_amount = len(tokens_for_user) - (
+            settings.refresh_tokens_per_user - 1
+        )
+        if tokens_to_delete_amount <= 0:
+            return []
+
+        return tokens_for_user[:tokens_to_delete_amount]
+
+    @staticmethod
+    def __new_token(user: User) -> tuple[UserToken, str]:
+        selector = binascii.hexlify(os.urandom(REFRESH_TOKEN_SELECTOR_BYTES)).decode()
+        verifier = binascii.hexlify(os.urandom(REFRESH_TOKEN_VERIFIER_BYTES)).decode()
+        token = UserToken(
+            key=create_keyed_hash(verifier), selector=selector, user_id=user.id
+        )
+
+        return token, REFRESH_TOKEN_SEPARATOR.join([selector, verifier])
+
+
+def split_refresh_token(raw_key: str) -> str | None:
+    selector, separator, verifier = raw_key.partition(REFRESH_TOKEN_SEPARATOR)
+    if not separator or not selector or not verifier:
+        return None
+
+    return selector
+
+
+def create_keyed_hash(raw: str) -> str:
+    # Verifiers are long random secrets, a keyed hash is enough where passwords
+    # need bcrypt.
+    return hmac.new(
+        settings.refresh_token_secret_key.encode(HASHING_ENCODING),
+        raw.encode(HASHING_ENCODING),
+        hashlib.sha256,
+    ).hexdigest()
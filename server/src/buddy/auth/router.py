@@ -37,12 +37,12 @@ auth_router = APIRouter(prefix="/auth")
         },
     },
 )
-def register(
+async def register(
     email: Annotated[EmailStr, Form()],
     password: Annotated[str, Form()],
     controller: Annotated[AuthControllable, Depends(get_auth_controller)],
 ) -> RegisterResponse:
-    return controller.register(email=email, password=password)
+    return await controller.register(email=email, password=password)
 
 
 @auth_router.post(
@@ -63,12 +63,12 @@ def register(
         },
     },
 )
-def login(
+async def login(
     email: Annotated[EmailStr, Form()],
     password: Annotated[str, Form()],
     controller: Annotated[AuthControllable, Depends(get_auth_controller)],
 ) -> LoginResponse:
-    return controller.login(email=email, password=password)
+    return await controller.login(email=email, password=password)
 
 
 @auth_router.get(
@@ -89,11 +89,11 @@ def login(
         },
     },
 )
-def session(
+async def session(
     user: Annotated[User, Depends(get_request_user)],
     controller: Annotated[AuthControllable, Depends(get_auth_controller)],
 ) -> SessionResponse:
-    return controller.session(user=user)
+    return await controller.session(user=user)
 
 
 @auth_router.post(
@@ -114,12 +114,12 @@ def session(
         },
     },
 )
-def refresh(
+async def refresh(
     payload: RefreshPayload,
     authorization: Annotated[str, Header()],
     controller: Annotated[AuthControllable, Depends(get_auth_controller)],
 ) -> RefreshResponse:
-    return controller.refresh(
+    return await controller.refresh(
         refresh_token=payload.refresh_token,
         authorization=authorization,
     )
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import pytest
+
+from buddy.auth.exceptions import PasswordHashingUnavailable
+from buddy.auth.hashing import (
+    PASSWORD_HASHING_DURATION,
+    HashingPool,
+    check_hash,
+    create_hash,
+)
+
+
+def test_hashing_pool_runs_hashes():
+    pool = HashingPool(max_workers=1, max_queue_size=1)
+    checks = PASSWORD_HASHING_DURATION.count(operation="check")
+
+    async def hash_and_check():
+        hashed = await pool.run("hash", create_hash, "nice_password")
+
+        return await pool.run("check", check_hash, "nice_password", hashed)
+
+    try:
+        assert asyncio.run(hash_and_check())
+    finally:
+        pool.shutdown()
+
+    assert PASSWORD_HASHING_DURATION.count(operation="check") == checks + 1
+
+
+def test_hashing_pool_rejects_work_when_saturated():
+    pool = HashingPool(max_workers=1, max_queue_size=1)
+    release = threading.Event()
+
+    async def saturate():
+        blocking_tasks = list(
+            map(
+                lambda _: asyncio.create_task(pool.run("check", release.wait, 5)),
+                range(2),
+            )
+        )
+        await asyncio.sleep(0)
+
+        assert pool.pending == 2
+        with pytest.raises(PasswordHashingUnavailable):
+            await pool.run("check", check_hash, "nice_password", create_hash("x"))
+
+        release.set()
+        await asyncio.gather(*blocking_tasks)
+
+    try:
+        asyncio.run(saturate())
+    finally:
+        pool.shutdown()
+
+    assert pool.pending == 0
+
+
+def test_hashing_pool_counts_cancelled_work_until_it_finishes():
+    pool = HashingPool(max_workers=1, max_queue_size=0)
+    release = threading.Event()
+
+    async def cancel():
+        task = asyncio.create_task(pool.run("check", release.wait, 5))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # The hash is still running, so there's no room for another one yet.
+        assert pool.pending == 1
+        with pytest.raises(PasswordHashingUnavailable):
+            await pool.run("check", check_hash, "nice_password", create_hash("x"))
+
+    try:
+        asyncio.run(cancel())
+        release.set()
+    finally:
+        pool.shutdown()
+
+    assert pool.pending == 0
@@ -0,0 +1,59 @@
+import re
+import uuid
+from http import HTTPStatus
+
+# Requests authenticated with an access token may load the user once more when it
+# isn't cached yet.
+
+
+def test_register_query_budget(client, query_budget):
+    payload = {"email": f"{uuid.uuid4()}@budget.io", "password": "nice_password"}
+    with query_budget(2):
+        response = client.post("/app-api/v1/auth/register", data=payload)
+
+    assert response.status_code == HTTPStatus.CREATED
+
+
+def test_login_query_budget(
+    client, default_user, default_user_credentials, query_budget
+):
+    # The 4th rotates out the oldest refresh tokens.
+    with query_budget(4):
+        response = client.post(
+            "/app-api/v1/auth/login", data=default_user_credentials.model_dump()
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_session_query_budget(client, default_user_login, query_budget):
+    with query_budget(1):
+        response = client.get(
+            "/app-api/v1/auth/session",
+            headers={"authorization": f"Bearer {default_user_login.access_token}"},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_refresh_query_budget(client, default_user_login, query_budget):
+    with query_budget(2):
+        response = client.post(
+            "/app-api/v1/auth/refresh",
+            json={"refresh_token": default_user_login.refresh_token},
+            headers={"authorization": f"Bearer {default_user_login.access_token}"},
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_statements_are_reported_in_server_timing(
+    client, default_user, default_user_credentials
+):
+    response = client.post(
+        "/app-api/v1/auth/login", data=default_user_credentials.model_dump()
+    )
+    server_timing = response.headers["server-timing"]
+
+    assert re.match(r'^db;dur=\d+\.\d{2};desc="\d+ queries"', server_timing)
+    assert "db-slowest;dur=" in server_timing
@@ -0,0 +1,60 @@
+import binascii
+import os
+import uuid
+from http import HTTPStatus
+
+from sqlmodel import Session
+
+from buddy.auth.hashing import create_hash
+from buddy.auth.models import User, UserToken
+from buddy.auth.schemas import UserPayload
+from buddy.auth.utils.jwt_utils import encode_jwt
+
+
+def test_refresh(client, default_user_login):
+    refresh_response = client.post(
+        "/app-api/v1/auth/refresh",
+        json={"refresh_token": default_user_login.refresh_token},
+        headers={"authorization": f"Bearer {default_user_login.access_token}"},
+    )
+    json_response = refresh_response.json()
+
+    assert refresh_response.status_code == HTTPStatus.OK
+    assert json_response["detail"] == "OK"
+    assert isinstance(json_response["access_token"], str)
+
+
+def test_refresh_with_tampered_verifier(client, default_user_login):
+    selector, _, verifier = default_user_login.refresh_token.partition(".")
+    tampered_verifier = ("0" if verifier[0] != "0" else "1") + verifier[1:]
+
+    refresh_response = client.post(
+        "/app-api/v1/auth/refresh",
+        json={"refresh_token": f"{selector}.{tampered_verifier}"},
+        headers={"authorization": f"Bearer {default_user_login.access_token}"},
+    )
+
+    assert refresh_response.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_refresh_with_legacy_token(client, database):
+    legacy_refresh_token = binascii.hexlify(os.urandom(20)).decode()
+    with Session(database.engine) as session:
+        user = User.create(
+            payload=UserPayload(
+                email=f"{uuid.uuid4().hex}@bulls.io", password="nice_password"
+            ),
+            session=session,
+        )
+        session.add(UserToken(key=create_hash(legacy_refresh_token), user_id=user.id))
+        session.commit()
+
+        access_token = encode_jwt(user).access_token
+
+    refresh_response = client.post(
+        "/app-api/v1/auth/refresh",
+        json={"refresh_token": legacy_refresh_token},
+        headers={"authorization": f"Bearer {access_token}"},
+    )
+
+    assert refresh_response.status_code == HTTPStatus.OK
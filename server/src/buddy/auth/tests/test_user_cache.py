@@ -0,0 +1,142 @@
+import time
+import uuid
+from http import HTTPStatus
+
+from sqlmodel import Session
+
+from buddy.auth.cache import (
+    USER_CACHE_HITS,
+    USER_CACHE_MISSES,
+    CachedUser,
+    InMemoryUserCache,
+    PostgresNotifyUserCache,
+    cache_user,
+    get_user_cache,
+)
+from buddy.auth.hashing import create_hash
+from buddy.auth.models import User
+from buddy.auth.schemas import UserPayload
+
+
+def test_authorized_requests_use_cached_user(
+    client, default_user_credentials, default_user_login
+):
+    get_user_cache().clear()
+    hits = USER_CACHE_HITS.value()
+    misses = USER_CACHE_MISSES.value()
+
+    for _ in range(2):
+        session_response = client.get(
+            "/app-api/v1/auth/session",
+            headers={"authorization": f"Bearer {default_user_login.access_token}"},
+        )
+
+        assert session_response.status_code == HTTPStatus.OK
+        assert session_response.json()["user"] == {
+            "email": default_user_credentials.email,
+            "tier": "FREE",
+        }
+
+    assert USER_CACHE_MISSES.value() == misses + 1
+    assert USER_CACHE_HITS.value() == hits + 1
+
+
+def test_password_change_invalidates_cached_user(database):
+    with Session(database.engine) as session:
+        user = User.create(
+            payload=UserPayload(
+                email=f"{uuid.uuid4().hex}@bulls.io", password="nice_password"
+            ),
+            session=session,
+        )
+        assert user.id is not None
+
+        cache_user(user, token_expires_at=int(time.time()) + 60)
+
+        assert get_user_cache().get(user.id) is not None
+
+        user.password = create_hash("other_password")
+        session.add(user)
+        session.commit()
+
+        assert get_user_cache().get(user.id) is None
+
+
+def test_user_cache_entries_expire_and_evict():
+    cache = InMemoryUserCache(max_size=2)
+    users = list(
+        map(lambda id: CachedUser(id=id, email=f"{id}@bulls.io", tier="FREE"), range(3))
+    )
+
+    cache.set(users[0], ttl_seconds=0)
+
+    assert cache.get(users[0].id) is None
+
+    cache.set(users[0], ttl_seconds=60)
+    cache.set(users[1], ttl_seconds=60)
+    cache.get(users[0].id)
+    cache.set(users[2], ttl_seconds=60)
+
+    assert cache.get(users[0].id) == users[0]
+    assert cache.get(users[1].id) is None
+    assert cache.get(users[2].id) == users[2]
+
+
+def test_postgres_user_cache_invalidates_other_workers(database):
+    database_url = database.engine.url.render_as_string(hide_password=False)
+    caches = [
+        PostgresNotifyUserCache(max_size=10, database_url=database_url),
+        PostgresNotifyUserCache(max_size=10, database_url=database_url),
+    ]
+    try:
+        user = CachedUser(id=-1, email="worker@bulls.io", tier="FREE")
+        for cache in caches:
+            assert cache.wait_until_listening(timeout=5)
+            cache.set(user, ttl_seconds=60)
+
+        caches[0].invalidate(user.id)
+
+        deadline = time.monotonic() + 5
+        while caches[1].get(user.id) is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        assert caches[1].get(user.id) is None
+    finally:
+        for cache in caches:
+            cache.close()
+
+
+def test_postgres_user_cache_notifies_with_the_committed_transaction(database):
+    database_url = database.engine.url.render_as_string(hide_password=False)
+    caches = [
+        PostgresNotifyUserCache(max_size=10, database_url=database_url),
+        PostgresNotifyUserCache(max_size=10, database_url=database_url),
+    ]
+    try:
+        users = list(
+            map(
+                lambda id: CachedUser(id=id, email=f"{id}@bulls.io", tier="FREE"),
+                (-2, -3),
+            )
+        )
+        for cache in caches:
+            assert cache.wait_until_listening(timeout=5)
+            for user in users:
+                cache.set(user, ttl_seconds=60)
+
+        with Session(database.engine) as session:
+            caches[0].notify_invalidation(users[0].id, connection=session.connection())
+            session.rollback()
+            caches[0].notify_invalidation(users[1].id, connection=session.connection())
+            session.commit()
+
+        deadline = time.monotonic() + 5
+        while caches[1].get(users[1].id) is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        # Notifications arrive in order, the rolled back one would have come first.
+        assert caches[1].get(users[1].id) is None
+        assert caches[1].get(users[0].id) == users[0]
+    finally:
+        for cache in caches:
+            cache.close()
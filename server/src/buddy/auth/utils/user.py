@@ -2,16 +2,16 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from sqlmodel import Session
-
+from buddy.auth.cache import cache_user, get_cached_user
 from buddy.auth.models import User
 from buddy.auth.utils.jwt_utils import decode_authorization_token
+from buddy.database import create_async_session
 
 if TYPE_CHECKING:
     from buddy.database import Databaseable
 
 
-def get_user_by_authorization_token(
+async def get_user_by_authorization_token(
     authorization: str, database: Databaseable, verify_exp=True
 ):
     claims = decode_authorization_token(
@@ -20,9 +20,16 @@ def get_user_by_authorization_token(
     if claims is None:
         return None
 
-    with Session(database.engine) as session:
-        user = User.get_by_id(id=int(claims.sub), session=session)
+    user_id = int(claims.sub)
+    cached_user = get_cached_user(user_id)
+    if cached_user is not None:
+        return cached_user
+
+    async with create_async_session(database) as session:
+        user = await User.get_by_id_async(id=user_id, session=session)
         if user is None:
             return None
 
+        cache_user(user, token_expires_at=claims.exp)
+
         return user
@@ -1,3 +1,5 @@
+from typing import Literal
+
 import pytz
 from pydantic_extra_types.timezone_name import TimeZoneName
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -19,8 +21,92 @@ class __Settings(BaseSettings):
     timezone: TimeZoneName = TimeZoneName("UTC")
     jwt_algorithm: str = "HS256"
     refresh_tokens_per_user: int = 4
+    refresh_token_secret_key: str = "not_so_secure_refresh_secret"
+    password_hashing_max_workers: int = 2
+    # Hashes allowed to wait for a worker before requests get a 503.
+    password_hashing_max_queue_size: int = 32
+    password_hashing_use_processes: bool = False
     openai_api_key: str | None = None
+    openai_max_connections: int = 100
+    openai_max_keepalive_connections: int = 20
+    openai_keepalive_expiry_seconds: float = 30
+    openai_connect_timeout_seconds: float = 5
+    # Reasoning models can take a while before the first byte of an answer.
+    openai_read_timeout_seconds: float = 120
+    openai_http2: bool = False
     google_ai_api_key: str | None = None
+    google_ai_max_connections: int = 100
+    google_ai_max_keepalive_connections: int = 20
+    google_ai_keepalive_expiry_seconds: float = 30
+    google_ai_connect_timeout_seconds: float = 5
+    google_ai_read_timeout_seconds: float = 120
+    google_ai_http2: bool = False
+    database_echo: bool = False
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout_seconds: float = 30
+    database_pool_recycle_seconds: int = 1800
+    database_pool_pre_ping: bool = True
+    # 0 disables the timeout.
+    database_statement_timeout_ms: int = 30_000
+    # Transaction pooling pgbouncer can't keep prepared statements or startup options.
+    database_pgbouncer_transaction_pooling: bool = False
+    # Requests spending this long on statements get logged as warnings.
+    database_slow_request_ms: float = 500
+    # "postgres" keeps every worker's cache in agreement through LISTEN/NOTIFY.
+    user_cache_backend: Literal["memory", "postgres"] = "memory"
+    # 0 disables the cache, entries never outlive the JWT they were loaded for.
+    user_cache_ttl_seconds: float = 60
+    user_cache_max_size: int = 10_000
+    # Answers to identical conversations are reused when enabled.
+    response_cache_backend: Literal["disabled", "memory", "postgres"] = "disabled"
+    response_cache_ttl_seconds: float = 24 * 60 * 60
+    response_cache_max_entries: int = 10_000
+    # Models to try in order once a model fails, e.g.
+    # {"openai:gpt-4o-mini": ["google:gemini-2.0-flash"]}. Tiers still apply.
+    llm_fallbacks: dict[str, list[str]] = {}
+    # Consecutive failures before a provider is skipped for `reset_seconds`.
+    llm_circuit_breaker_failure_threshold: int = 5
+    llm_circuit_breaker_reset_seconds: float = 30
+    # Starts the next model in the chain once the current one is slower than its p95.
+    llm_hedging_enabled: bool = False
+    llm_hedging_min_samples: int = 20
+    llm_hedging_min_delay_seconds: float = 0.5
+    llm_latency_window_size: int = 200
+    # Chat jobs taken on at once by every `python -m buddy.llm.jobs` worker.
+    chat_jobs_worker_concurrency: int = 4
+    chat_jobs_poll_interval_seconds: float = 1
+    # Running jobs whose worker went quiet for this long are picked up again.
+    chat_jobs_lease_seconds: float = 300
+    chat_jobs_max_attempts: int = 3
+    # Running jobs allowed per provider across all workers, `default` for the rest.
+    chat_jobs_provider_concurrency: dict[str, int] = {"default": 16}
+    # "postgres" lets every worker process see the keys.
+    idempotency_backend: Literal["memory", "postgres"] = "memory"
+    idempotency_ttl_seconds: float = 24 * 60 * 60
+    idempotency_max_entries: int = 10_000
+    # Duplicates wait this long for the first request to finish before getting a 409.
+    idempotency_wait_timeout_seconds: float = 60
+    # Request rates and daily tokens allowed per tier, see `buddy.money.limits`.
+    # "memory" keeps both per process and loads a user's daily tokens from Postgres
+    # once a day, "postgres" shares them between every worker process exactly.
+    rate_limit_backend: Literal["disabled", "memory", "postgres"] = "memory"
+    rate_limit_max_users: int = 100_000
+    # Usage and cost of every chat turn is buffered and written in batches, entries
+    # recorded while `max_buffer_size` are waiting get dropped.
+    usage_ledger_flush_interval_seconds: float = 5
+    usage_ledger_batch_size: int = 1_000
+    usage_ledger_max_buffer_size: int = 100_000
+    # Shared by every process serving `/metrics` when running several workers, each
+    # writes its metrics there every `write_interval_seconds`. Empty it on deploys.
+    metrics_multiprocess_dir: str | None = None
+    metrics_multiprocess_write_interval_seconds: float = 5
+    # `/health/ready` reports checks refreshed this often, results older than
+    # `max_age_seconds` fail it.
+    health_check_interval_seconds: float = 5
+    health_check_max_age_seconds: float = 30
+    # Free pooled connections below which the instance stops taking traffic.
+    health_min_pool_headroom: int = 1
 
     @property
     def tzinfo(self):
@@ -10,19 +10,26 @@ env_found = load_dotenv(project_root / ".env.testing")
 assert env_found
 
 
+from contextlib import contextmanager
 from http import HTTPStatus
+from itertools import chain
 from pathlib import Path
+from typing import Iterator
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, create_engine, select
 from testcontainers.postgres import PostgresContainer  # type: ignore
 
+from buddy import middleware
 from buddy.auth.models import User
 from buddy.auth.schemas import LoginResponse, UserPayload
 from buddy.database import (
     BaseDatabase,
     Databaseable,
+    QueryStats,
     create_db_and_tables,
     get_database,
 )
@@ -41,7 +48,14 @@ postgres = PostgresContainer(
 
 class DatabaseForTests(BaseDatabase):
     def __init__(self, database_url: str) -> None:
-        super().__init__(create_engine(database_url, echo=False))
+        super().__init__(
+            engine=create_engine(database_url, echo=False),
+            # The test client runs every request on a new event loop, pooled async
+            # connections can't be shared between those loops.
+            async_engine=create_async_engine(
+                database_url, echo=False, poolclass=NullPool
+            ),
+        )
 
 
 def get_database_override(database: DatabaseForTests):
@@ -112,3 +126,34 @@ def client(database, default_user):
         yield __client
     finally:
         app.dependency_overrides.clear()
+
+
+@pytest.fixture(scope="function")
+def query_budget(monkeypatch):
+    """
+    `with query_budget(3) as statements:` fails the test when the requests made in the
+    block send more than 3 statements. They are counted per request by the
+    `track_queries` stats `QueryStatsMiddleware` reports, and collected in the list.
+    """
+
+    requests_stats: list[QueryStats] = []
+    log_query_stats = middleware.log_query_stats
+
+    def collect(scope, stats: QueryStats) -> None:
+        requests_stats.append(stats)
+        log_query_stats(scope=scope, stats=stats)
+
+    monkeypatch.setattr(middleware, "log_query_stats", collect)
+
+    @contextmanager
+    def budget(max_queries: int) -> Iterator[list[str]]:
+        statements: list[str] = []
+        requests_stats.clear()
+        yield statements
+
+        statements.extend(
+            chain.from_iterable(map(lambda stats: stats.statements, requests_stats))
+        )
+        assert len(statements) <= max_queries, "\n".join(statements)
+
+    return budget
@@ -1,32 +1,220 @@
-from typing import Protocol
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Protocol
 
-from sqlalchemy import Engine
+from sqlalchemy import AsyncAdaptedQueuePool, Engine, Pool, QueuePool, event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlmodel import SQLModel, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from buddy.conf import settings
+from buddy.metrics import Gauge, Histogram
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+DATABASE_POOL_WAIT = Histogram(
+    "buddy_database_pool_wait_seconds",
+    "Time spent getting a pooled database connection, including opening new ones",
+    label_names=("engine",),
+)
+DATABASE_POOL_CHECKED_OUT = Gauge(
+    "buddy_database_pool_checked_out",
+    "Pooled database connections in use",
+    label_names=("engine",),
+)
 
 
 class Databaseable(Protocol):
     engine: Engine
+    async_engine: AsyncEngine
 
 
 class BaseDatabase:
-    def __init__(self, engine: Engine) -> None:
+    def __init__(self, engine: Engine, async_engine: AsyncEngine) -> None:
         self.engine = engine
+        self.async_engine = async_engine
+        instrument_engine(engine, label="sync")
+        instrument_engine(async_engine.sync_engine, label="async")
+
+
+class QueryStats:
+    """What the statements sent while tracking took, see `track_queries`."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: str | None = None
+        self.statements: list[str] = []
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.statements.append(statement)
+        self.total_seconds += seconds
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+
+QUERY_STARTED_AT_INFO_KEY = "buddy_query_started_at"
+
+__query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Attributes every statement sent from within the current context to the stats."""
+
+    stats = QueryStats()
+    token = __query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        __query_stats.reset(token)
+
+
+def instrument_engine(engine: Engine, label: str) -> None:
+    event.listen(engine, "before_cursor_execute", __before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", __after_cursor_execute)
+    event.listen(engine, "handle_error", __handle_error)
+    event.listen(
+        engine.pool,
+        "checkout",
+        lambda *_: DATABASE_POOL_CHECKED_OUT.inc(engine=label),
+    )
+    event.listen(
+        engine.pool,
+        "checkin",
+        lambda *_: DATABASE_POOL_CHECKED_OUT.dec(engine=label),
+    )
+
+
+def __before_cursor_execute(connection, cursor, statement, *args) -> None:
+    connection.info.setdefault(QUERY_STARTED_AT_INFO_KEY, []).append(
+        time.perf_counter()
+    )
+
+
+def __after_cursor_execute(connection, cursor, statement, *args) -> None:
+    started_at = connection.info[QUERY_STARTED_AT_INFO_KEY].pop()
+    stats = __query_stats.get()
+    if stats is not None:
+        stats.record(statement=statement, seconds=time.perf_counter() - started_at)
+
+
+def __handle_error(exception_context) -> None:
+    connection = exception_context.connection
+    if connection is None or exception_context.cursor is None:
+        return
+
+    started_at = connection.info.get(QUERY_STARTED_AT_INFO_KEY)
+    if started_at:
+        started_at.pop()
+
+
+def create_async_session(database: Databaseable) -> AsyncSession:
+    # Expired attributes would need lazy loading on access, which async sessions
+    # can't do, so objects keep their values after a commit.
+    return AsyncSession(database.async_engine, expire_on_commit=False)
 
 
 def create_db_and_tables(database: Databaseable) -> None:
     from buddy.auth.models import User, UserToken  # noqa: F401
-    from buddy.llm.models import ChatRoom  # noqa: F401
+    from buddy.llm.models import (  # noqa: F401
+        ChatIdempotencyKey,
+        ChatJob,
+        ChatMessage,
+        ChatRoom,
+        DailyTokenUsage,
+        DailyUsageRollup,
+        LLMResponseCacheEntry,
+        RateLimitBucket,
+        UsageLedgerEntry,
+    )
 
     SQLModel.metadata.create_all(database.engine)
+    run_migrations(database)
+
+
+MIGRATIONS_LOCK_ID = 7_283_001
+
+
+def run_migrations(database: Databaseable) -> None:
+    from buddy.auth.migrations import MIGRATIONS as AUTH_MIGRATIONS
+    from buddy.llm.migrations import MIGRATIONS as LLM_MIGRATIONS
+
+    with database.engine.begin() as connection:
+        # Every worker runs this on startup, only one of them may migrate at a time.
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:lock_id)"),
+            {"lock_id": MIGRATIONS_LOCK_ID},
+        )
+        for migration in [*AUTH_MIGRATIONS, *LLM_MIGRATIONS]:
+            migration(connection)
+
+
+def get_engine_options() -> dict[str, Any]:
+    connect_args: dict[str, Any] = {}
+    if settings.database_pgbouncer_transaction_pooling:
+        # Prepared statements live on a server connection pgbouncer may hand to
+        # another client on the next transaction.
+        connect_args["prepare_threshold"] = None
+        if settings.database_statement_timeout_ms > 0:
+            logger.warning(
+                "Statement timeout is not sent through pgbouncer, configure it on the database role instead"
+            )
+    elif settings.database_statement_timeout_ms > 0:
+        connect_args["options"] = (
+            f"-c statement_timeout={settings.database_statement_timeout_ms}"
+        )
+
+    return {
+        "echo": settings.database_echo,
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_timeout": settings.database_pool_timeout_seconds,
+        "pool_recycle": settings.database_pool_recycle_seconds,
+        "pool_pre_ping": settings.database_pool_pre_ping,
+        "connect_args": connect_args,
+    }
+
+
+class TimedPool(Pool):
+    engine_label: str
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DATABASE_POOL_WAIT.observe(
+                time.perf_counter() - started_at, engine=self.engine_label
+            )
+
+
+class TimedQueuePool(TimedPool, QueuePool):
+    engine_label = "sync"
+
+
+class TimedAsyncAdaptedQueuePool(TimedPool, AsyncAdaptedQueuePool):
+    engine_label = "async"
 
 
 class Database(BaseDatabase):
     def __init__(self) -> None:
-        engine = create_engine(settings.database_url, echo=True)
-
-        super().__init__(engine=engine)
+        engine_options = get_engine_options()
+        engine = create_engine(
+            settings.database_url, poolclass=TimedQueuePool, **engine_options
+        )
+        async_engine = create_async_engine(
+            settings.database_url,
+            poolclass=TimedAsyncAdaptedQueuePool,
+            **engine_options,
+        )
+
+        super().__init__(engine=engine, async_engine=async_engine)
 
 
 __database: Database | None = None
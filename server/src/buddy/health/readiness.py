@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import threading
+
+from sqlalchemy import QueuePool, text
+
+from buddy.conf import settings
+from buddy.database import Databaseable
+from buddy.health.schemas import ReadinessCheck, ReadinessResponse
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.routing import CircuitState, get_circuit_breaker
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+CIRCUIT_STATE_CHECKS: dict[CircuitState, ReadinessCheck] = {
+    "closed": ReadinessCheck(status="ok"),
+    "half_open": ReadinessCheck(
+        status="degraded", detail="Trying the provider again after failures"
+    ),
+    "open": ReadinessCheck(
+        status="degraded", detail="Skipped until its circuit breaker resets"
+    ),
+}
+
+
+class ReadinessMonitor:
+    """
+    Checks the dependencies every `interval_seconds` on a background thread, probes
+    only read the last results.
+    """
+
+    def __init__(self, database: Databaseable, interval_seconds: float) -> None:
+        self.database = database
+        self.interval_seconds = interval_seconds
+        self.__response: ReadinessResponse | None = None
+        self.__stopped = threading.Event()
+        self.__checker = threading.Thread(
+            target=self.__refresh_periodically, name="readiness-checker", daemon=True
+        )
+        self.__checker.start()
+
+    @property
+    def response(self) -> ReadinessResponse | None:
+        """The last results, not ready once they're older than they should get."""
+        response = self.__response
+        if response is None:
+            return None
+
+        age_seconds = (
+            datetime_now_with_timezone() - response.checked_at
+        ).total_seconds()
+        if age_seconds <= settings.health_check_max_age_seconds:
+            return response
+
+        return response.model_copy(
+            update={
+                "detail": "NOT_READY",
+                "checks": {
+                    **response.checks,
+                    "freshness": ReadinessCheck(
+                        status="failing",
+                        detail=f"Checks last ran {round(age_seconds)} seconds ago",
+                    ),
+                },
+            }
+        )
+
+    def refresh(self) -> ReadinessResponse:
+        checks = {
+            "database": check_database(self.database),
+            "database_pool": check_database_pool(self.database),
+            **check_providers(),
+        }
+        ready = all(map(lambda check: check.status != "failing", checks.values()))
+        response = ReadinessResponse(
+            detail="READY" if ready else "NOT_READY",
+            checked_at=datetime_now_with_timezone(),
+            checks=checks,
+        )
+        self.__response = response
+
+        return response
+
+    def close(self) -> None:
+        self.__stopped.set()
+        self.__checker.join()
+
+    def __refresh_periodically(self) -> None:
+        while True:
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Failed to check readiness")
+
+            if self.__stopped.wait(self.interval_seconds):
+                return
+
+
+def check_database(database: Databaseable) -> ReadinessCheck:
+    try:
+        with database.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as exception:
+        logger.warning(f"Readiness check of the database failed: {exception}")
+
+        return ReadinessCheck(status="failing", detail=type(exception).__name__)
+
+    return ReadinessCheck(status="ok")
+
+
+def check_database_pool(database: Databaseable) -> ReadinessCheck:
+    # Requests run on the async engine, its pool is the one that runs dry.
+    pool = database.async_engine.pool
+    if not isinstance(pool, QueuePool):
+        return ReadinessCheck(status="ok", detail="Connections aren't pooled")
+
+    capacity = pool.size() + settings.database_max_overflow
+    in_use = pool.checkedout()
+    detail = f"{in_use} of {capacity} connections in use"
+    if capacity - in_use < settings.health_min_pool_headroom:
+        return ReadinessCheck(status="failing", detail=detail)
+
+    return ReadinessCheck(status="ok", detail=detail)
+
+
+def check_providers() -> dict[str, ReadinessCheck]:
+    """The last known circuit breaker states, providers aren't called for this."""
+
+    return dict(
+        map(
+            lambda name: (
+                f"provider:{name}",
+                CIRCUIT_STATE_CHECKS[get_circuit_breaker(name).state],
+            ),
+            PROVIDERS,
+        )
+    )
+
+
+__readiness_monitor: ReadinessMonitor | None = None
+__readiness_monitor_lock = threading.Lock()
+
+
+def get_readiness_monitor(database: Databaseable) -> ReadinessMonitor:
+    global __readiness_monitor
+    with __readiness_monitor_lock:
+        if __readiness_monitor is None:
+            __readiness_monitor = ReadinessMonitor(
+                database=database,
+                interval_seconds=settings.health_check_interval_seconds,
+            )
+
+        return __readiness_monitor
+
+
+def close_readiness_monitor() -> None:
+    global __readiness_monitor
+    with __readiness_monitor_lock:
+        if __readiness_monitor is not None:
+            __readiness_monitor.close()
+            __readiness_monitor = None
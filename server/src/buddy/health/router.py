@@ -1,15 +1,40 @@
-from typing import Literal
+from http import HTTPStatus
+from typing import Annotated
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-
-health_router = APIRouter(prefix="/health")
+from fastapi import APIRouter, Depends, Response
+from fastapi.concurrency import run_in_threadpool
 
+from buddy.database import Databaseable, get_database
+from buddy.health.readiness import get_readiness_monitor
+from buddy.health.schemas import PingResponse, ReadinessResponse
 
-class PingResponse(BaseModel):
-    detail: Literal["PONG"]
+health_router = APIRouter(prefix="/health")
 
 
 @health_router.get("/ping")
 async def ping() -> PingResponse:
     return PingResponse(detail="PONG")
+
+
+@health_router.get(
+    "/ready",
+    responses={
+        HTTPStatus.SERVICE_UNAVAILABLE: {
+            "model": ReadinessResponse,
+            "description": "A dependency is failing",
+        }
+    },
+)
+async def ready(
+    database: Annotated[Databaseable, Depends(get_database)], response: Response
+) -> ReadinessResponse:
+    monitor = get_readiness_monitor(database)
+    readiness = monitor.response
+    if readiness is None:
+        # Only until the background checks ran for the first time.
+        readiness = await run_in_threadpool(monitor.refresh)
+
+    if readiness.detail != "READY":
+        response.status_code = HTTPStatus.SERVICE_UNAVAILABLE
+
+    return readiness
@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel
+
+# Degraded dependencies get reported without failing the probe.
+ReadinessStatus = Literal["ok", "degraded", "failing"]
+
+
+class PingResponse(BaseModel):
+    detail: Literal["PONG"]
+
+
+class ReadinessCheck(BaseModel):
+    status: ReadinessStatus
+    detail: str | None = None
+
+
+class ReadinessResponse(BaseModel):
+    detail: Literal["READY", "NOT_READY"]
+    checked_at: datetime
+    checks: dict[str, ReadinessCheck]
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+from buddy.llm.routing import RouteCandidate, chat_with_fallbacks
+from buddy.llm.schemas import ChatRoomMessage, LLMCompletion, LLMModel
+from buddy.llm.tokenizers import TOKENS_PER_REPLY, estimate_conversation_tokens
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+if TYPE_CHECKING:
+    from buddy.llm.providers.provider import LLMProviderable
+
+SUMMARY_PREFIX = "Summary of our conversation so far:"
+
+SUMMARIZE_PROMPT = (
+    "Update the summary of a conversation between a user and an assistant with the "
+    "messages that follow it. Keep the facts, names, decisions and open questions "
+    "someone would need to continue the conversation, and answer with the updated "
+    "summary only."
+)
+
+
+class ChatContext(NamedTuple):
+    messages: list[ChatRoomMessage]
+    # Older messages that didn't fit and aren't part of the summary yet.
+    unsummarized: list[ChatRoomMessage]
+    # Sequence of the first history message that made it into `messages`.
+    first_sequence: int
+
+
+def assemble_context(
+    provider: LLMProviderable,
+    llm_model: LLMModel,
+    history: list[ChatRoomMessage],
+    history_start_sequence: int,
+    question: ChatRoomMessage,
+    summary: str | None = None,
+) -> ChatContext:
+    """
+    Keeps the most recent history that fits `llm_model.context_token_budget` along
+    with the question, the question itself is always sent.
+    """
+
+    def tokens_of(message: ChatRoomMessage) -> int:
+        return count_tokens_added(provider, llm_model, message)
+
+    summary_message = None
+    if llm_model.context_strategy == "summarize" and summary:
+        summary_message = make_summary_message(summary=summary, question=question)
+
+    used_tokens = TOKENS_PER_REPLY + tokens_of(question)
+    if summary_message is not None:
+        used_tokens += tokens_of(summary_message)
+
+    first_kept_index = len(history)
+    while first_kept_index > 0:
+        tokens = tokens_of(history[first_kept_index - 1])
+        if used_tokens + tokens > llm_model.context_token_budget:
+            break
+
+        used_tokens += tokens
+        first_kept_index -= 1
+
+    messages = [*history[first_kept_index:], question]
+    if summary_message is not None:
+        messages.insert(0, summary_message)
+
+    return ChatContext(
+        messages=messages,
+        unsummarized=history[:first_kept_index],
+        first_sequence=history_start_sequence + first_kept_index,
+    )
+
+
+def count_tokens(
+    provider: LLMProviderable, llm_model: LLMModel, messages: list[ChatRoomMessage]
+) -> int:
+    """The provider's local count, or an estimate when it can't count locally."""
+    tokens = provider.count_tokens(llm_model, messages)
+    if tokens is None:
+        return estimate_conversation_tokens(messages)
+
+    return tokens
+
+
+def count_tokens_added(
+    provider: LLMProviderable, llm_model: LLMModel, message: ChatRoomMessage
+) -> int:
+    """What a message adds to a conversation, the reply is only primed once."""
+    return count_tokens(provider, llm_model, [message]) - TOKENS_PER_REPLY
+
+
+async def summarize(
+    route: list[RouteCandidate],
+    summary: str | None,
+    messages: list[ChatRoomMessage],
+) -> LLMCompletion:
+    """Goes through the route like the turn, so breakers and fallbacks apply."""
+
+    llm_model = route[0].llm_model
+    transcript = "\n".join(
+        map(lambda message: f"{message.role}: {message.content}", messages)
+    )
+    prompt = "\n\n".join(
+        [SUMMARIZE_PROMPT, f"Summary: {summary or '-'}", f"Messages:\n{transcript}"]
+    )
+    return await chat_with_fallbacks(
+        route=route,
+        messages=[
+            ChatRoomMessage(
+                role="user",
+                content=prompt,
+                llm_key=llm_model.key,
+                llm_provider=llm_model.provider,
+                date=datetime_now_with_timezone(),
+            )
+        ],
+    )
+
+
+def make_summary_message(summary: str, question: ChatRoomMessage) -> ChatRoomMessage:
+    return ChatRoomMessage(
+        role="user",
+        content=f"{SUMMARY_PREFIX}\n{summary}",
+        llm_key=question.llm_key,
+        llm_provider=question.llm_provider,
+        date=question.date,
+    )
@@ -1,116 +1,445 @@
 from __future__ import annotations
 
+import asyncio
+import time
 import uuid
-from typing import Annotated, Protocol
+from datetime import datetime
+from typing import Annotated, AsyncIterator, NamedTuple, Protocol
 
-from fastapi import Depends
-from sqlmodel import Session
+from fastapi import BackgroundTasks, Depends
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from buddy.auth.middleware import get_request_user
 from buddy.auth.models import User
-from buddy.database import Databaseable, get_database
-from buddy.exceptions import BuddyNotFoundError
+from buddy.database import Databaseable, create_async_session, get_database
+from buddy.exceptions import (
+    BuddyBadRequestError,
+    BuddyInternalError,
+    BuddyNotFoundError,
+)
+from buddy.llm.context import (
+    ChatContext,
+    assemble_context,
+    count_tokens_added,
+    summarize,
+)
 from buddy.llm.exceptions import LLMNotAllowed
-from buddy.llm.models import ChatRoom
-from buddy.llm.providers import (
-    get_users_model_by_key,
-    get_users_provider_by_model,
+from buddy.llm.idempotency import (
+    IdempotencyStoreable,
+    get_idempotency_store,
+    run_idempotently,
 )
+from buddy.llm.models import ChatJob, ChatMessage, ChatRoom
+from buddy.llm.providers import get_registered_model
+from buddy.llm.providers.provider import LLMProviderable
+from buddy.llm.rate_limits import enforce_chat_limits, record_tokens_used
+from buddy.llm.response_cache import chat_with_response_cache, get_response_cache
+from buddy.llm.routing import RouteCandidate, get_route, stream_with_fallbacks
 from buddy.llm.schemas import (
+    ChatJobAcceptedResponse,
+    ChatJobResponse,
+    ChatMessageDelta,
     ChatRoomListItem,
     ChatRoomListResponse,
     ChatRoomMessage,
+    ChatStreamEvent,
     CreateChatMessagePayload,
     CreateChatMessageResponse,
     CreateChatRoomPayload,
+    LLMModel,
+    LLMUsage,
     ListChatMessagesResponse,
 )
+from buddy.llm.usage import get_usage_ledger
+from buddy.utils.cursor_utils import decode_cursor, encode_cursor
 from buddy.utils.datetime_utils import datetime_now_with_timezone
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+CHAT_JOB_LONG_POLL_INTERVAL_SECONDS = 0.5
+# Truncated history is read newest first in pages of this many messages.
+CHAT_HISTORY_PAGE_SIZE = 50
+
+
+class ChatTurn(NamedTuple):
+    llm_model: LLMModel
+    provider: LLMProviderable
+    question: ChatRoomMessage
+    messages: list[ChatRoomMessage]
+    existing_room: ChatRoom | None
+    context: ChatContext
+    route: list[RouteCandidate]
 
 
 class LLMControllable(Protocol):
     user: User
     database: Databaseable
+    background_tasks: BackgroundTasks
 
-    def list_chat_rooms(self) -> ChatRoomListResponse: ...
+    async def list_chat_rooms(
+        self, limit: int, cursor: str | None = None
+    ) -> ChatRoomListResponse: ...
 
-    def list_chat_messages(self, room_id: uuid.UUID) -> ListChatMessagesResponse: ...
+    async def list_chat_messages(
+        self,
+        room_id: uuid.UUID,
+        limit: int,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> ListChatMessagesResponse: ...
 
-    def create_chat_message(
-        self, payload: CreateChatMessagePayload
+    async def create_chat_message(
+        self, payload: CreateChatMessagePayload, idempotency_key: str | None = None
     ) -> CreateChatMessageResponse: ...
 
+    async def stream_chat_message(
+        self, payload: CreateChatMessagePayload
+    ) -> AsyncIterator[ChatStreamEvent]: ...
+
+    async def enqueue_chat_message(
+        self, payload: CreateChatMessagePayload, idempotency_key: str | None = None
+    ) -> ChatJobAcceptedResponse: ...
+
+    async def get_chat_job(
+        self, job_id: uuid.UUID, wait_seconds: float = 0
+    ) -> ChatJobResponse: ...
+
 
 class LLMController(LLMControllable):
     user: User
     database: Databaseable
+    background_tasks: BackgroundTasks
 
-    def __init__(self, database: Databaseable, user: User):
+    def __init__(
+        self,
+        database: Databaseable,
+        user: User,
+        background_tasks: BackgroundTasks,
+        idempotency_store: IdempotencyStoreable | None = None,
+        enforce_limits=True,
+    ):
         self.database = database
         self.user = user
+        self.background_tasks = background_tasks
+        self.idempotency_store = idempotency_store or get_idempotency_store(database)
+        self.enforce_limits = enforce_limits
 
-    def list_chat_rooms(self) -> ChatRoomListResponse:
+    async def list_chat_rooms(self, limit, cursor=None) -> ChatRoomListResponse:
         owner_id = self.user.id
         assert owner_id is not None
 
-        with Session(self.database.engine) as session:
+        after = None
+        if cursor is not None:
+            after = decode_chat_rooms_cursor(cursor)
+            if after is None:
+                raise BuddyBadRequestError
 
-            def chat_room_to_response(room: ChatRoom) -> ChatRoomListItem:
-                return ChatRoomListItem(
+        async with create_async_session(self.database) as session:
+            rooms, has_more = await ChatRoom.list_summaries_for_owner_async(
+                owner_id=owner_id, limit=limit, after=after, session=session
+            )
+
+        items = list(
+            map(
+                lambda room: ChatRoomListItem(
                     room_id=room.id,
                     title=room.title,
-                    messages_count=len(room.messages),
+                    messages_count=room.messages_count,
                     created_at=room.created_at,
                     updated_at=room.updated_at,
+                ),
+                rooms,
+            )
+        )
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_chat_rooms_cursor(
+                updated_at=items[-1].updated_at, room_id=items[-1].room_id
+            )
+
+        return ChatRoomListResponse(detail="OK", data=items, next_cursor=next_cursor)
+
+    async def list_chat_messages(
+        self, room_id, limit, before=None, after=None
+    ) -> ListChatMessagesResponse:
+        if before is not None and after is not None:
+            raise BuddyBadRequestError
+
+        owner_id = self.user.id
+        assert owner_id is not None
+
+        async with create_async_session(self.database) as session:
+            room = await ChatRoom.get_by_id_async(
+                id=room_id, owner_id=owner_id, session=session
+            )
+            if room is None:
+                raise BuddyNotFoundError
+
+            messages, has_more = await ChatMessage.list_window_for_room_async(
+                room_id=room.id,
+                limit=limit,
+                before=before,
+                after=after,
+                session=session,
+            )
+
+            next_cursor = None
+            if has_more:
+                # Older history continues before the first message, newer history
+                # after the last one.
+                cursor_message = messages[0] if after is None else messages[-1]
+                next_cursor = cursor_message.sequence
+
+            return ListChatMessagesResponse(
+                detail="OK",
+                data=list(map(lambda message: message.as_chat_room_message, messages)),
+                next_cursor=next_cursor,
+            )
+
+    async def create_chat_message(
+        self, payload, idempotency_key=None
+    ) -> CreateChatMessageResponse:
+        if idempotency_key is None:
+            return await self.__create_chat_message(payload)
+
+        owner_id = self.user.id
+        assert owner_id is not None
+
+        return await run_idempotently(
+            store=self.idempotency_store,
+            owner_id=owner_id,
+            key=idempotency_key,
+            payload=payload,
+            response_type=CreateChatMessageResponse,
+            call=lambda: self.__create_chat_message(payload),
+        )
+
+    async def __create_chat_message(
+        self, payload: CreateChatMessagePayload
+    ) -> CreateChatMessageResponse:
+        # Runs inside the idempotent call, replays aren't charged.
+        await self.__enforce_chat_limits()
+        turn = await self.__prepare_chat_turn(payload)
+        started_at = time.monotonic()
+        completion, cached = await chat_with_response_cache(
+            route=turn.route,
+            messages=turn.messages,
+            cache=get_response_cache(self.database),
+        )
+        latency_seconds = time.monotonic() - started_at
+        if not cached:
+            await self.__record_tokens_used(completion.usage)
+
+        response = await self.__save_chat_turn(
+            turn=turn, answer=completion.message, cached=cached
+        )
+        if not cached:
+            self.__record_usage(
+                turn=turn,
+                answer=completion.message,
+                usage=completion.usage,
+                latency_seconds=latency_seconds,
+                room_id=response.room_id,
+            )
+
+        return response
+
+    async def stream_chat_message(self, payload) -> AsyncIterator[ChatStreamEvent]:
+        await self.__enforce_chat_limits()
+        # Preparing eagerly lets invalid requests fail before the stream starts.
+        turn = await self.__prepare_chat_turn(payload)
+
+        return self.__stream_chat_turn(turn)
+
+    async def enqueue_chat_message(
+        self, payload, idempotency_key=None
+    ) -> ChatJobAcceptedResponse:
+        owner_id = self.user.id
+        assert owner_id is not None
+
+        # Requests that can't succeed are turned away before they take up the queue.
+        registered_model = get_registered_model(
+            user=self.user, llm_key=payload.llm_key, provider=payload.llm_provider
+        )
+        if registered_model is None:
+            raise LLMNotAllowed
+
+        if idempotency_key is not None:
+            async with create_async_session(self.database) as session:
+                existing_job = await ChatJob.get_by_idempotency_key_async(
+                    owner_id=owner_id,
+                    idempotency_key=idempotency_key,
+                    payload=payload,
+                    session=session,
+                )
+            # Replays aren't charged.
+            if existing_job is not None:
+                return ChatJobAcceptedResponse(
+                    detail="Accepted", **existing_job.as_chat_job_details.model_dump()
                 )
 
-            rooms = list(
-                map(
-                    chat_room_to_response,
-                    ChatRoom.list_for_owner(owner_id=owner_id, session=session),
+        await self.__enforce_chat_limits()
+        async with create_async_session(self.database) as session:
+            if payload.room_id is not None:
+                room = await ChatRoom.get_by_id_async(
+                    id=payload.room_id, owner_id=owner_id, session=session
                 )
+                if room is None:
+                    raise LLMNotAllowed
+
+            job = await ChatJob.enqueue_async(
+                owner_id=owner_id,
+                payload=payload,
+                idempotency_key=idempotency_key,
+                session=session,
             )
 
-            return ChatRoomListResponse(detail="OK", data=rooms)
+        return ChatJobAcceptedResponse(
+            detail="Accepted", **job.as_chat_job_details.model_dump()
+        )
 
-    def list_chat_messages(self, room_id) -> ListChatMessagesResponse:
+    async def get_chat_job(self, job_id, wait_seconds=0) -> ChatJobResponse:
         owner_id = self.user.id
         assert owner_id is not None
 
-        with Session(self.database.engine) as session:
-            room = ChatRoom.get_by_id(id=room_id, owner_id=owner_id, session=session)
-            if room is None:
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            async with create_async_session(self.database) as session:
+                job = await ChatJob.get_for_owner_async(
+                    id=job_id, owner_id=owner_id, session=session
+                )
+            if job is None:
                 raise BuddyNotFoundError
 
-            messages = room.validated_messages()
-            return ListChatMessagesResponse(detail="OK", data=messages)
+            remaining_seconds = deadline - time.monotonic()
+            if job.status in ("succeeded", "failed") or remaining_seconds <= 0:
+                return ChatJobResponse(
+                    detail="OK", **job.as_chat_job_details.model_dump()
+                )
+
+            await asyncio.sleep(
+                min(CHAT_JOB_LONG_POLL_INTERVAL_SECONDS, remaining_seconds)
+            )
+
+    async def __stream_chat_turn(
+        self, turn: ChatTurn
+    ) -> AsyncIterator[ChatStreamEvent]:
+        started_at = time.monotonic()
+        contents: list[str] = []
+        usage: LLMUsage | None = None
+        candidate, stream = await stream_with_fallbacks(
+            route=turn.route, messages=turn.messages
+        )
+        async for delta in stream:
+            if isinstance(delta, LLMUsage):
+                usage = delta
+                continue
+
+            contents.append(delta)
+            yield ChatMessageDelta(content=delta)
+
+        if len(contents) == 0 or usage is None:
+            logger.warning("No content or usage streamed from the provider")
+            raise BuddyInternalError
+
+        answer = ChatRoomMessage(
+            role="assistant",
+            content="".join(contents),
+            llm_key=candidate.llm_model.key,
+            llm_provider=candidate.llm_model.provider,
+            date=datetime_now_with_timezone(),
+        )
+
+        latency_seconds = time.monotonic() - started_at
+        await self.__record_tokens_used(usage)
+
+        response = await self.__save_chat_turn(turn=turn, answer=answer)
+        self.__record_usage(
+            turn=turn,
+            answer=answer,
+            usage=usage,
+            latency_seconds=latency_seconds,
+            room_id=response.room_id,
+        )
+
+        yield response
+
+    async def __enforce_chat_limits(self) -> None:
+        if self.enforce_limits:
+            await enforce_chat_limits(database=self.database, user=self.user)
+
+    async def __record_tokens_used(self, usage: LLMUsage) -> None:
+        owner_id = self.user.id
+        assert owner_id is not None
+
+        await record_tokens_used(database=self.database, owner_id=owner_id, usage=usage)
+
+    def __record_usage(
+        self,
+        turn: ChatTurn,
+        answer: ChatRoomMessage,
+        usage: LLMUsage,
+        latency_seconds: float,
+        room_id: uuid.UUID,
+    ) -> None:
+        owner_id = self.user.id
+        assert owner_id is not None
+
+        # The answer may have come from a fallback, which is billed at its own price.
+        llm_model = next(
+            filter(
+                lambda llm_model: llm_model.key == answer.llm_key
+                and llm_model.provider == answer.llm_provider,
+                map(lambda candidate: candidate.llm_model, turn.route),
+            ),
+            turn.llm_model,
+        )
+        get_usage_ledger(self.database).record(
+            owner_id=owner_id,
+            room_id=room_id,
+            llm_model=llm_model,
+            usage=usage,
+            latency_seconds=latency_seconds,
+        )
 
-    def create_chat_message(self, payload) -> CreateChatMessageResponse:
+    async def __prepare_chat_turn(self, payload: CreateChatMessagePayload) -> ChatTurn:
         request_time = datetime_now_with_timezone()
-        selected_model = get_users_model_by_key(
+        registered_model = get_registered_model(
             user=self.user, llm_key=payload.llm_key, provider=payload.llm_provider
         )
-        if selected_model is None:
+        if registered_model is None:
             raise LLMNotAllowed
 
-        provider = get_users_provider_by_model(user=self.user, model=selected_model)
-        if provider is None:
-            raise LLMNotAllowed
+        selected_model, provider = registered_model
 
         asking_user_id = self.user.id
         assert asking_user_id is not None
 
-        messages: list[ChatRoomMessage] = []
+        history: list[ChatRoomMessage] = []
+        history_start_sequence = 0
         existing_room: ChatRoom | None = None
-        with Session(self.database.engine) as session:
-            if room_id := payload.room_id:
-                existing_room = ChatRoom.get_by_id(
+        if room_id := payload.room_id:
+            async with create_async_session(self.database) as session:
+                existing_room = await ChatRoom.get_by_id_async(
                     id=room_id, owner_id=asking_user_id, session=session
                 )
                 if existing_room is None:
                     raise LLMNotAllowed
 
-                messages = existing_room.validated_messages()
+                if selected_model.context_strategy == "summarize":
+                    # Older messages only reach the provider through the summary.
+                    history_start_sequence = existing_room.summary_sequence
+                    history = await existing_room.validated_messages_async(
+                        session=session, from_sequence=history_start_sequence
+                    )
+                else:
+                    history, history_start_sequence = await load_recent_history(
+                        room=existing_room,
+                        provider=provider,
+                        llm_model=selected_model,
+                        session=session,
+                    )
 
         question = ChatRoomMessage(
             role="user",
@@ -119,46 +448,164 @@ class LLMController(LLMControllable):
             llm_key=payload.llm_key,
             date=request_time,
         )
-        messages.append(question)
-        response = provider.chat(
+        context = assemble_context(
+            provider=provider,
             llm_model=selected_model,
-            messages=messages,
+            history=history,
+            history_start_sequence=history_start_sequence,
+            question=question,
+            summary=existing_room.summary if existing_room is not None else None,
         )
+
+        return ChatTurn(
+            llm_model=selected_model,
+            provider=provider,
+            question=question,
+            messages=context.messages,
+            existing_room=existing_room,
+            context=context,
+            route=get_route(
+                user=self.user, llm_model=selected_model, provider=provider
+            ),
+        )
+
+    async def __save_chat_turn(
+        self, turn: ChatTurn, answer: ChatRoomMessage, cached=False
+    ) -> CreateChatMessageResponse:
+        asking_user_id = self.user.id
+        assert asking_user_id is not None
+
         response_time = datetime_now_with_timezone()
-        with Session(self.database.engine) as session:
-            if existing_room:
-                room = existing_room.add_messages(
+        async with create_async_session(self.database) as session:
+            if turn.existing_room:
+                room = await turn.existing_room.add_messages_async(
                     messages=[
-                        question,
-                        response,
+                        turn.question,
+                        answer,
                     ],
                     session=session,
                 )
             else:
-                room = ChatRoom.create(
+                room = await ChatRoom.create_async(
                     payload=CreateChatRoomPayload(
-                        question=question,
-                        answer=response,
+                        question=turn.question,
+                        answer=answer,
                         asking_user_id=asking_user_id,
                     ),
                     session=session,
                 )
 
+            if (
+                turn.llm_model.context_strategy == "summarize"
+                and len(turn.context.unsummarized) > 0
+            ):
+                # Runs once the response has been sent.
+                self.background_tasks.add_task(self.__update_room_summary, turn)
+
             return CreateChatMessageResponse(
                 detail="Created",
-                role=response.role,
-                content=response.content,
+                role=answer.role,
+                content=answer.content,
                 date=response_time,
                 room_id=room.id,
-                llm_key=payload.llm_key,
-                llm_provider=payload.llm_provider,
+                llm_key=answer.llm_key,
+                llm_provider=answer.llm_provider,
                 title=room.title,
                 updated_at=room.updated_at,
+                cached=cached,
+            )
+
+    async def __update_room_summary(self, turn: ChatTurn) -> None:
+        room = turn.existing_room
+        assert room is not None
+
+        started_at = time.monotonic()
+        try:
+            completion = await summarize(
+                route=turn.route,
+                summary=room.summary,
+                messages=turn.context.unsummarized,
+            )
+        except Exception:
+            logger.exception("Failed to summarize the chat room")
+            return
+
+        latency_seconds = time.monotonic() - started_at
+        await self.__record_tokens_used(completion.usage)
+        self.__record_usage(
+            turn=turn,
+            answer=completion.message,
+            usage=completion.usage,
+            latency_seconds=latency_seconds,
+            room_id=room.id,
+        )
+        async with create_async_session(self.database) as session:
+            updated = await room.update_summary_async(
+                summary=completion.message.content,
+                summary_sequence=turn.context.first_sequence,
+                session=session,
             )
+            if not updated:
+                logger.info("Chat room summary has already been moved along")
+
+
+async def load_recent_history(
+    room: ChatRoom,
+    provider: LLMProviderable,
+    llm_model: LLMModel,
+    session: AsyncSession,
+) -> tuple[list[ChatRoomMessage], int]:
+    """
+    The newest messages, stops reading once they exceed the context token budget.
+    Returns them with the sequence of the first one.
+    """
+
+    history: list[ChatRoomMessage] = []
+    start_sequence = 0
+    tokens = 0
+    before = None
+    while tokens <= llm_model.context_token_budget:
+        messages, has_more = await ChatMessage.list_window_for_room_async(
+            room_id=room.id,
+            limit=CHAT_HISTORY_PAGE_SIZE,
+            before=before,
+            session=session,
+        )
+        if len(messages) == 0:
+            break
+
+        page = list(map(lambda message: message.as_chat_room_message, messages))
+        history = page + history
+        start_sequence = before = messages[0].sequence
+        tokens += sum(
+            map(lambda message: count_tokens_added(provider, llm_model, message), page)
+        )
+        if not has_more:
+            break
+
+    return history, start_sequence
+
+
+def encode_chat_rooms_cursor(updated_at: datetime, room_id: uuid.UUID) -> str:
+    return encode_cursor([updated_at.isoformat(), str(room_id)])
+
+
+def decode_chat_rooms_cursor(cursor: str) -> tuple[datetime, uuid.UUID] | None:
+    values = decode_cursor(cursor)
+    if values is None or len(values) != 2:
+        return None
+
+    try:
+        return datetime.fromisoformat(values[0]), uuid.UUID(values[1])
+    except ValueError:
+        return None
 
 
 async def get_llm_controller(
     database: Annotated[Databaseable, Depends(get_database)],
     user: Annotated[User, Depends(get_request_user)],
+    background_tasks: BackgroundTasks,
 ) -> LLMControllable:
-    return LLMController(database=database, user=user)
+    return LLMController(
+        database=database, user=user, background_tasks=background_tasks
+    )
@@ -15,3 +15,72 @@ class LLMNotAllowed(BuddyError):
             ],
             headers,
         )
+
+
+class LLMUnavailable(BuddyError):
+    def __init__(self, headers: dict[str, str] | None = None) -> None:
+        super().__init__(
+            HTTPStatus.SERVICE_UNAVAILABLE,
+            [
+                BuddyErrorDetail(
+                    msg="Selected LLM is unavailable, try again later",
+                    type="llm_unavailable",
+                )
+            ],
+            headers,
+        )
+
+
+class IdempotencyKeyReused(BuddyError):
+    def __init__(self, headers: dict[str, str] | None = None) -> None:
+        super().__init__(
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+            [
+                BuddyErrorDetail(
+                    msg="Idempotency key has already been used for another request",
+                    type="idempotency_key_reused",
+                )
+            ],
+            headers,
+        )
+
+
+class IdempotentRequestInProgress(BuddyError):
+    def __init__(self, headers: dict[str, str] | None = None) -> None:
+        super().__init__(
+            HTTPStatus.CONFLICT,
+            [
+                BuddyErrorDetail(
+                    msg="Request with this idempotency key is still in progress",
+                    type="idempotent_request_in_progress",
+                )
+            ],
+            headers if headers is not None else {"Retry-After": "1"},
+        )
+
+
+class RateLimited(BuddyError):
+    def __init__(self, headers: dict[str, str] | None = None) -> None:
+        super().__init__(
+            HTTPStatus.TOO_MANY_REQUESTS,
+            [
+                BuddyErrorDetail(
+                    msg="Too many chat messages, try again later", type="rate_limited"
+                )
+            ],
+            headers,
+        )
+
+
+class TokenQuotaExceeded(BuddyError):
+    def __init__(self, headers: dict[str, str] | None = None) -> None:
+        super().__init__(
+            HTTPStatus.TOO_MANY_REQUESTS,
+            [
+                BuddyErrorDetail(
+                    msg="Daily token quota has been used up",
+                    type="token_quota_exceeded",
+                )
+            ],
+            headers,
+        )
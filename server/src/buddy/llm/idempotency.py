@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+import time
+from typing import Awaitable, Callable, NamedTuple, Protocol, TypeVar
+
+from pydantic import BaseModel
+
+from buddy.conf import settings
+from buddy.database import Databaseable, create_async_session
+from buddy.llm.exceptions import IdempotencyKeyReused, IdempotentRequestInProgress
+from buddy.llm.models import ChatIdempotencyKey
+from buddy.metrics import Counter
+from buddy.utils.cache_utils import TTLCache
+
+# Requests that die while holding a key give it up after this long.
+IDEMPOTENCY_IN_FLIGHT_SECONDS = 5 * 60
+IDEMPOTENCY_POLL_INTERVAL_SECONDS = 0.1
+
+IDEMPOTENT_REPLAYS = Counter(
+    "buddy_idempotent_replays",
+    "Requests answered with the stored response of an earlier identical request",
+)
+
+Response = TypeVar("Response", bound=BaseModel)
+
+
+class IdempotencyRecord(NamedTuple):
+    fingerprint: str
+    # None while the first request is still in flight.
+    response: str | None
+
+
+class IdempotencyStoreable(Protocol):
+    async def acquire(
+        self, owner_id: int, key: str, fingerprint: str
+    ) -> IdempotencyRecord | None:
+        """None when the key is now held by the caller, the existing record otherwise."""
+        ...
+
+    async def complete(self, owner_id: int, key: str, response: str) -> None: ...
+
+    async def release(self, owner_id: int, key: str) -> None: ...
+
+
+class InMemoryIdempotencyStore(IdempotencyStoreable):
+    def __init__(self, max_size: int) -> None:
+        self.__records: TTLCache[tuple[int, str], IdempotencyRecord] = TTLCache(
+            max_size=max_size
+        )
+        self.__lock = threading.Lock()
+
+    async def acquire(self, owner_id, key, fingerprint) -> IdempotencyRecord | None:
+        with self.__lock:
+            record = self.__records.get((owner_id, key))
+            if record is None:
+                self.__records.set(
+                    (owner_id, key),
+                    IdempotencyRecord(fingerprint=fingerprint, response=None),
+                    ttl_seconds=IDEMPOTENCY_IN_FLIGHT_SECONDS,
+                )
+
+            return record
+
+    async def complete(self, owner_id, key, response) -> None:
+        with self.__lock:
+            record = self.__records.get((owner_id, key))
+            if record is None:
+                return
+
+            self.__records.set(
+                (owner_id, key),
+                record._replace(response=response),
+                ttl_seconds=settings.idempotency_ttl_seconds,
+            )
+
+    async def release(self, owner_id, key) -> None:
+        with self.__lock:
+            self.__records.delete((owner_id, key))
+
+
+class PostgresIdempotencyStore(IdempotencyStoreable):
+    def __init__(self, database: Databaseable) -> None:
+        self.database = database
+
+    async def acquire(self, owner_id, key, fingerprint) -> IdempotencyRecord | None:
+        async with create_async_session(self.database) as session:
+            existing_key = await ChatIdempotencyKey.acquire_async(
+                owner_id=owner_id,
+                key=key,
+                fingerprint=fingerprint,
+                in_flight_seconds=IDEMPOTENCY_IN_FLIGHT_SECONDS,
+                session=session,
+            )
+            if existing_key is None:
+                return None
+
+            return IdempotencyRecord(
+                fingerprint=existing_key.fingerprint, response=existing_key.response
+            )
+
+    async def complete(self, owner_id, key, response) -> None:
+        async with create_async_session(self.database) as session:
+            await ChatIdempotencyKey.complete_async(
+                owner_id=owner_id,
+                key=key,
+                response=response,
+                ttl_seconds=settings.idempotency_ttl_seconds,
+                session=session,
+            )
+
+    async def release(self, owner_id, key) -> None:
+        async with create_async_session(self.database) as session:
+            await ChatIdempotencyKey.release_async(
+                owner_id=owner_id, key=key, session=session
+            )
+
+
+__in_memory_idempotency_store: InMemoryIdempotencyStore | None = None
+
+
+def get_idempotency_store(database: Databaseable) -> IdempotencyStoreable:
+    global __in_memory_idempotency_store
+    if settings.idempotency_backend == "postgres":
+        return PostgresIdempotencyStore(database=database)
+
+    if __in_memory_idempotency_store is None:
+        __in_memory_idempotency_store = InMemoryIdempotencyStore(
+            max_size=settings.idempotency_max_entries
+        )
+
+    return __in_memory_idempotency_store
+
+
+async def run_idempotently(
+    store: IdempotencyStoreable,
+    owner_id: int,
+    key: str,
+    payload: BaseModel,
+    response_type: type[Response],
+    call: Callable[[], Awaitable[Response]],
+) -> Response:
+    """
+    Makes `call` at most once per key. Duplicates wait for the first call and get its
+    response, reusing a key for another payload is refused.
+    """
+
+    fingerprint = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+    deadline = time.monotonic() + settings.idempotency_wait_timeout_seconds
+    while (
+        record := await store.acquire(
+            owner_id=owner_id, key=key, fingerprint=fingerprint
+        )
+    ) is not None:
+        if record.fingerprint != fingerprint:
+            raise IdempotencyKeyReused
+
+        if record.response is not None:
+            IDEMPOTENT_REPLAYS.inc()
+
+            return response_type.model_validate_json(record.response)
+
+        if time.monotonic() >= deadline:
+            raise IdempotentRequestInProgress
+
+        await asyncio.sleep(IDEMPOTENCY_POLL_INTERVAL_SECONDS)
+
+    try:
+        response = await call()
+    except BaseException:
+        # Failed requests may be retried with the same key.
+        await store.release(owner_id=owner_id, key=key)
+        raise
+
+    await store.complete(
+        owner_id=owner_id, key=key, response=response.model_dump_json()
+    )
+
+    return response
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import signal
+
+from fastapi import BackgroundTasks, HTTPException
+
+from buddy.auth.models import User
+from buddy.conf import settings
+from buddy.database import Databaseable, create_async_session, get_database
+from buddy.exceptions import BuddyInternalError, BuddyNotFoundError
+from buddy.llm.controller import LLMController
+from buddy.llm.idempotency import PostgresIdempotencyStore
+from buddy.llm.models import ChatJob
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.schemas import CreateChatMessagePayload
+from buddy.llm.usage import close_usage_ledger
+from buddy.metrics import Gauge
+from buddy.metrics.multiprocess import start_metrics_writer, stop_metrics_writer
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+# Autoscaling signals, add workers while jobs queue up or wait for too long. Every
+# worker reads them from the same queue, so they aren't added up across processes.
+CHAT_JOBS_QUEUED = Gauge(
+    "buddy_chat_jobs_queued",
+    "Chat jobs waiting for a worker to pick them up",
+    multiprocess_mode="max",
+)
+CHAT_JOBS_OLDEST_QUEUED_SECONDS = Gauge(
+    "buddy_chat_jobs_oldest_queued_seconds",
+    "How long the oldest queued chat job has been waiting",
+    multiprocess_mode="max",
+)
+CHAT_JOBS_RUNNING = Gauge(
+    "buddy_chat_jobs_running",
+    "Chat jobs being worked on across all workers",
+    label_names=("provider",),
+    multiprocess_mode="max",
+)
+
+
+class ChatJobWorker:
+    """
+    Answers the chat jobs `POST /llm/chats` enqueued, at most `concurrency` at a
+    time. Any amount of workers may drain the same queue.
+    """
+
+    def __init__(
+        self,
+        database: Databaseable,
+        concurrency: int = settings.chat_jobs_worker_concurrency,
+    ) -> None:
+        self.database = database
+        self.concurrency = concurrency
+        self.__running: set[asyncio.Task[None]] = set()
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                claimed = await self.__claim_available()
+            except Exception:
+                logger.exception("Failed to claim chat jobs")
+                claimed = 0
+
+            if claimed == 0 or len(self.__running) >= self.concurrency:
+                await self.__wait(stop)
+
+        if len(self.__running) > 0:
+            await asyncio.gather(*self.__running, return_exceptions=True)
+
+    async def run_once(self) -> int:
+        """Works on the claimable jobs until the queue is drained."""
+
+        processed = 0
+        while claimed := await self.__claim_available():
+            processed += claimed
+            await asyncio.gather(*self.__running)
+
+        return processed
+
+    async def __wait(self, stop: asyncio.Event) -> None:
+        # Until it's time to poll again, a slot frees up or the worker gets stopped.
+        stopping = asyncio.ensure_future(stop.wait())
+        await asyncio.wait(
+            [stopping, *self.__running],
+            timeout=settings.chat_jobs_poll_interval_seconds,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        stopping.cancel()
+
+    async def __claim_available(self) -> int:
+        claimed = 0
+        async with create_async_session(self.database) as session:
+            await ChatJob.fail_abandoned_async(
+                max_attempts=settings.chat_jobs_max_attempts,
+                error=json.dumps(BuddyInternalError().detail),
+                session=session,
+            )
+            running = await ChatJob.count_running_by_provider_async(session=session)
+            await self.__record_queue_stats(running=running, session=session)
+
+            while len(self.__running) < self.concurrency:
+                job = await ChatJob.claim_next_async(
+                    excluded_providers=get_providers_at_capacity(running),
+                    lease_seconds=settings.chat_jobs_lease_seconds,
+                    max_attempts=settings.chat_jobs_max_attempts,
+                    session=session,
+                )
+                if job is None:
+                    break
+
+                running[job.llm_provider] = running.get(job.llm_provider, 0) + 1
+                task = asyncio.create_task(self.__process(job))
+                self.__running.add(task)
+                task.add_done_callback(self.__running.discard)
+                claimed += 1
+
+        return claimed
+
+    async def __record_queue_stats(self, running: dict[str, int], session) -> None:
+        queued, oldest_created_at = await ChatJob.get_queue_stats_async(session=session)
+        CHAT_JOBS_QUEUED.set(queued)
+        oldest_queued_seconds = 0.0
+        if oldest_created_at is not None:
+            oldest_queued_seconds = (
+                datetime_now_with_timezone() - oldest_created_at
+            ).total_seconds()
+        CHAT_JOBS_OLDEST_QUEUED_SECONDS.set(oldest_queued_seconds)
+        for provider in PROVIDERS:
+            CHAT_JOBS_RUNNING.set(running.get(provider, 0), provider=provider)
+
+    async def __process(self, job: ChatJob) -> None:
+        background_tasks = BackgroundTasks()
+        result = None
+        error = None
+        lease_keeper = asyncio.create_task(self.__keep_leased(job))
+        try:
+            async with create_async_session(self.database) as session:
+                user = await User.get_by_id_async(id=job.owner_id, session=session)
+            if user is None:
+                raise BuddyNotFoundError
+
+            # Jobs taken over after a crash replay the stored turn rather than
+            # answering and billing it again, whichever worker they end up on.
+            controller = LLMController(
+                database=self.database,
+                user=user,
+                background_tasks=background_tasks,
+                idempotency_store=PostgresIdempotencyStore(database=self.database),
+                # Jobs have been charged when they were enqueued.
+                enforce_limits=False,
+            )
+            response = await controller.create_chat_message(
+                CreateChatMessagePayload.model_validate_json(job.payload),
+                idempotency_key=f"chat-job:{job.id}",
+            )
+            result = response.model_dump_json()
+        except HTTPException as exception:
+            error = json.dumps(exception.detail)
+        except Exception:
+            logger.exception(f"Chat job '{job.id}' failed")
+            error = json.dumps(BuddyInternalError().detail)
+        finally:
+            lease_keeper.cancel()
+
+        async with create_async_session(self.database) as session:
+            finished = await ChatJob.finish_async(
+                job=job, result=result, error=error, session=session
+            )
+        if not finished:
+            logger.warning(f"Chat job '{job.id}' has been taken over by another worker")
+            return
+
+        await background_tasks()
+
+    async def __keep_leased(self, job: ChatJob) -> None:
+        # Slow turns and fallback chains may take longer than a single lease.
+        while True:
+            await asyncio.sleep(settings.chat_jobs_lease_seconds / 3)
+            try:
+                async with create_async_session(self.database) as session:
+                    extended = await ChatJob.extend_lease_async(
+                        job=job,
+                        lease_seconds=settings.chat_jobs_lease_seconds,
+                        session=session,
+                    )
+            except Exception:
+                logger.exception(f"Failed to extend the lease of chat job '{job.id}'")
+                continue
+
+            if not extended:
+                return
+
+
+def get_providers_at_capacity(running: dict[str, int]) -> list[str]:
+    limits = settings.chat_jobs_provider_concurrency
+    default_limit = limits.get("default")
+
+    return list(
+        filter(
+            lambda provider: (limit := limits.get(provider, default_limit)) is not None
+            and running.get(provider, 0) >= limit,
+            PROVIDERS,
+        )
+    )
+
+
+async def main() -> None:
+    database = await get_database()
+    for provider in PROVIDERS.values():
+        provider.preload()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stop.set)
+
+    start_metrics_writer()
+    logger.info("Chat job worker started")
+    await ChatJobWorker(database=database).run(stop)
+    close_usage_ledger()
+    stop_metrics_writer()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
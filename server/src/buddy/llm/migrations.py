@@ -0,0 +1,94 @@
+from sqlalchemy import Connection, inspect, text
+
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+
+def move_chat_room_messages_to_chat_message(connection: Connection) -> None:
+    chat_room_columns = inspect(connection).get_columns("chat_room")
+    if "messages" not in map(lambda column: column["name"], chat_room_columns):
+        return
+
+    logger.info("Moving chat_room.messages over to the chat_message table")
+    # Messages used to be sorted by date when read, so the sequence follows the
+    # date with the array position as tie breaker.
+    connection.execute(
+        text(
+            """
+            INSERT INTO chat_message
+                (room_id, sequence, role, content, llm_provider, llm_key, date)
+            SELECT
+                chat_room.id,
+                row_number() OVER (
+                    PARTITION BY chat_room.id
+                    ORDER BY (message.value ->> 'date')::timestamptz, message.position
+                ) - 1,
+                message.value ->> 'role',
+                message.value ->> 'content',
+                message.value ->> 'llm_provider',
+                message.value ->> 'llm_key',
+                (message.value ->> 'date')::timestamptz
+            FROM chat_room,
+                unnest(chat_room.messages) WITH ORDINALITY AS message(value, position)
+            ON CONFLICT DO NOTHING
+            """
+        )
+    )
+    connection.execute(text("ALTER TABLE chat_room DROP COLUMN messages"))
+
+
+def add_chat_room_messages_count(connection: Connection) -> None:
+    chat_room_columns = inspect(connection).get_columns("chat_room")
+    if "messages_count" in map(lambda column: column["name"], chat_room_columns):
+        return
+
+    logger.info("Adding and backfilling chat_room.messages_count")
+    connection.execute(
+        text(
+            "ALTER TABLE chat_room ADD COLUMN messages_count integer NOT NULL DEFAULT 0"
+        )
+    )
+    connection.execute(
+        text(
+            """
+            UPDATE chat_room
+            SET messages_count = message_counts.count
+            FROM (
+                SELECT room_id, count(*) AS count FROM chat_message GROUP BY room_id
+            ) AS message_counts
+            WHERE chat_room.id = message_counts.room_id
+            """
+        )
+    )
+
+
+def add_chat_room_owner_id_updated_at_index(connection: Connection) -> None:
+    connection.execute(
+        text(
+            """
+            CREATE INDEX IF NOT EXISTS ix_chat_room_owner_id_updated_at
+            ON chat_room (owner_id, updated_at DESC, id DESC)
+            """
+        )
+    )
+
+
+def add_chat_room_summary(connection: Connection) -> None:
+    connection.execute(
+        text(
+            """
+            ALTER TABLE chat_room
+                ADD COLUMN IF NOT EXISTS summary TEXT,
+                ADD COLUMN IF NOT EXISTS summary_sequence INTEGER NOT NULL DEFAULT 0
+            """
+        )
+    )
+
+
+MIGRATIONS = [
+    move_chat_room_messages_to_chat_message,
+    add_chat_room_messages_count,
+    add_chat_room_owner_id_updated_at_index,
+    add_chat_room_summary,
+]
@@ -1,22 +1,76 @@
 from __future__ import annotations
 
+import json
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import Sequence
 
-from sqlalchemy import ARRAY, JSON, Column, DateTime
+from sqlalchemy import (
+    CTE,
+    Column,
+    ColumnElement,
+    DateTime,
+    Index,
+    Integer,
+    Select,
+    String,
+    Text,
+    UniqueConstraint,
+    Uuid,
+    and_,
+    column,
+    delete,
+    func,
+    insert,
+    literal,
+    or_,
+    text,
+    true,
+    tuple_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as postgres_insert
+from sqlalchemy.orm import load_only
+from sqlalchemy.sql.dml import Insert
 from sqlmodel import Field, SQLModel, Session, col, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.sql.expression import SelectOfScalar
 
 from buddy.auth.models import User
-from buddy.exceptions import BuddyBadRequestError
-from buddy.llm.schemas import ChatRoomMessage, CreateChatRoomPayload
+from buddy.conf import settings
+from buddy.exceptions import BuddyBadRequestError, BuddyNotFoundError
+from buddy.llm.exceptions import IdempotencyKeyReused
+from buddy.llm.schemas import (
+    ChatJobDetails,
+    ChatRoomMessage,
+    CreateChatMessagePayload,
+    CreateChatMessageResponse,
+    CreateChatRoomPayload,
+    LLMUsage,
+)
 from buddy.utils.datetime_utils import datetime_now_with_timezone
 
 CHAT_ROOM_MAX_TITLE_LENGTH = 255
+CHAT_ROOM_SUMMARY_ATTRIBUTES = (
+    "id",
+    "title",
+    "messages_count",
+    "created_at",
+    "updated_at",
+)
 
 
 class ChatRoom(SQLModel, table=True):
     __tablename__: str = "chat_room"  # type: ignore
+    __table_args__ = (
+        Index(
+            "ix_chat_room_owner_id_updated_at",
+            "owner_id",
+            text("updated_at DESC"),
+            text("id DESC"),
+        ),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     created_at: datetime = Field(
@@ -32,82 +86,1030 @@ class ChatRoom(SQLModel, table=True):
         default_factory=datetime_now_with_timezone,
     )
     title: str = Field(min_length=1)
-    messages: list = Field(
-        default_factory=list, sa_column=Column(ARRAY(JSON), nullable=False)
-    )
     owner_id: int = Field(default=None, foreign_key=f"{User.__tablename__}.id")
+    messages_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    # Rolling summary of every message before `summary_sequence`.
+    summary: str | None = Field(default=None, sa_column=Column(Text, nullable=True))
+    summary_sequence: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
+    def validated_messages(self, session: Session) -> list[ChatRoomMessage]:
+        return list(
+            map(
+                lambda message: message.as_chat_room_message,
+                ChatMessage.list_for_room(room_id=self.id, session=session),
+            )
+        )
 
-    def validated_messages(self) -> list[ChatRoomMessage]:
-        return sorted(
-            map(lambda message: ChatRoomMessage(**message), self.messages),
-            key=lambda message: message.date,
-            reverse=False,
+    async def validated_messages_async(
+        self, session: AsyncSession, from_sequence: int = 0
+    ) -> list[ChatRoomMessage]:
+        messages = await ChatMessage.list_for_room_async(
+            room_id=self.id, session=session, from_sequence=from_sequence
         )
 
+        return list(map(lambda message: message.as_chat_room_message, messages))
+
+    async def update_summary_async(
+        self, summary: str, summary_sequence: int, session: AsyncSession
+    ) -> bool:
+        """Only applies when no other turn moved the summary along in the meantime."""
+        query = (
+            update(ChatRoom)
+            .where(
+                col(ChatRoom.id) == self.id,
+                col(ChatRoom.summary_sequence) == self.summary_sequence,
+            )
+            .values(summary=summary, summary_sequence=summary_sequence)
+        )
+        result = await session.exec(query)  # type: ignore
+        await session.commit()
+        if result.rowcount == 0:
+            return False
+
+        self.summary = summary
+        self.summary_sequence = summary_sequence
+
+        return True
+
     def add_messages(
         self, messages: list[ChatRoomMessage], session: Session
     ) -> ChatRoom:
-        all_messages = self.validated_messages()
-        all_messages.extend(messages)
-        self.messages = list(
-            map(lambda message: message.model_dump(mode="json"), all_messages)
+        query, updated_at = self.__append_messages_query(messages=messages)
+        sequences = session.exec(query).scalars().all()  # type: ignore
+        session.commit()
+
+        return self.__appended(sequences=sequences, updated_at=updated_at)
+
+    async def add_messages_async(
+        self, messages: list[ChatRoomMessage], session: AsyncSession
+    ) -> ChatRoom:
+        query, updated_at = self.__append_messages_query(messages=messages)
+        sequences = (await session.exec(query)).scalars().all()  # type: ignore
+        await session.commit()
+
+        return self.__appended(sequences=sequences, updated_at=updated_at)
+
+    def __append_messages_query(
+        self, messages: list[ChatRoomMessage]
+    ) -> tuple[Insert, datetime]:
+        # Bumping the room takes its row lock, so concurrent turns on the same room
+        # get consecutive sequences instead of colliding. Only the counter in the
+        # database is trusted, this instance may be long out of date.
+        updated_at = datetime_now_with_timezone()
+        bumped_room = (
+            update(ChatRoom)
+            .where(col(ChatRoom.id) == self.id, col(ChatRoom.owner_id) == self.owner_id)
+            .values(
+                updated_at=updated_at,
+                messages_count=col(ChatRoom.messages_count) + len(messages),
+            )
+            .returning(col(ChatRoom.messages_count))
+            .cte("bumped_room")
         )
+        query = ChatMessage.insert_many_query(
+            room_id=self.id,
+            start_sequence=bumped_room.c.messages_count - len(messages),
+            messages=messages,
+            source=bumped_room,
+        ).returning(col(ChatMessage.sequence))
 
-        session.add(self)
-        session.commit()
+        return query, updated_at
 
-        room = self
-        session.refresh(room)
+    def __appended(self, sequences: Sequence[int], updated_at: datetime) -> ChatRoom:
+        # Nothing gets inserted when the room is gone.
+        if len(sequences) == 0:
+            raise BuddyNotFoundError
 
-        return room
+        self.updated_at = updated_at
+        self.messages_count = max(sequences) + 1
+
+        return self
 
     @staticmethod
-    def list_for_owner(owner_id: int, session: Session) -> Sequence[ChatRoom]:
+    async def list_summaries_for_owner_async(
+        owner_id: int,
+        limit: int,
+        session: AsyncSession,
+        after: tuple[datetime, uuid.UUID] | None = None,
+    ) -> tuple[Sequence[ChatRoom], bool]:
+        """Most recently updated rooms first, loading only the listed columns.
+
+        `after` is the (updated_at, id) keyset of the last room of the previous page.
+        The returned flag tells whether more rooms come after this page.
+        """
         query = (
             select(ChatRoom)
+            .options(
+                load_only(
+                    *map(
+                        lambda attribute: getattr(ChatRoom, attribute),
+                        CHAT_ROOM_SUMMARY_ATTRIBUTES,
+                    )
+                )
+            )
             .where(ChatRoom.owner_id == owner_id)
-            .order_by(col(ChatRoom.updated_at).desc())
+            .order_by(col(ChatRoom.updated_at).desc(), col(ChatRoom.id).desc())
+            .limit(limit + 1)
         )
+        if after is not None:
+            query = query.where(
+                tuple_(col(ChatRoom.updated_at), col(ChatRoom.id))
+                < tuple_(literal(after[0]), literal(after[1]))
+            )
+
+        rooms = (await session.exec(query)).all()
 
-        return session.exec(query).all()
+        return rooms[:limit], len(rooms) > limit
 
     @staticmethod
     def get_by_id(id: uuid.UUID, owner_id: int, session: Session) -> ChatRoom | None:
-        query = (
+        return session.exec(ChatRoom.__by_id_query(id=id, owner_id=owner_id)).first()
+
+    @staticmethod
+    async def get_by_id_async(
+        id: uuid.UUID, owner_id: int, session: AsyncSession
+    ) -> ChatRoom | None:
+        query = ChatRoom.__by_id_query(id=id, owner_id=owner_id)
+
+        return (await session.exec(query)).first()
+
+    @staticmethod
+    def create(
+        payload: CreateChatRoomPayload, session: Session, commit=True
+    ) -> ChatRoom:
+        room = ChatRoom.__new_room(payload=payload)
+        session.exec(ChatRoom.__create_query(room=room, payload=payload))  # type: ignore
+        if commit:
+            session.commit()
+
+        return room
+
+    @staticmethod
+    async def create_async(
+        payload: CreateChatRoomPayload, session: AsyncSession, commit=True
+    ) -> ChatRoom:
+        room = ChatRoom.__new_room(payload=payload)
+        await session.exec(ChatRoom.__create_query(room=room, payload=payload))  # type: ignore
+        if commit:
+            await session.commit()
+
+        return room
+
+    @staticmethod
+    def __create_query(room: ChatRoom, payload: CreateChatRoomPayload) -> Insert:
+        # The room and its first messages go out in one statement, every column is
+        # known up front so nothing needs to be read back.
+        new_room = insert(ChatRoom).values(room.model_dump()).cte("new_room")
+
+        return ChatMessage.insert_many_query(
+            room_id=room.id,
+            start_sequence=0,
+            messages=[payload.question, payload.answer],
+        ).add_cte(new_room)
+
+    @staticmethod
+    def __by_id_query(id: uuid.UUID, owner_id: int) -> SelectOfScalar[ChatRoom]:
+        return (
             select(ChatRoom)
             .where(ChatRoom.id == id)
             .where(ChatRoom.owner_id == owner_id)
             .limit(1)
         )
 
-        return session.exec(query).first()
-
     @staticmethod
-    def create(
-        payload: CreateChatRoomPayload, session: Session, commit=True
-    ) -> ChatRoom:
+    def __new_room(payload: CreateChatRoomPayload) -> ChatRoom:
         if len(payload.question.content.strip()) == 0:
             raise BuddyBadRequestError
 
-        messages = [
-            payload.question.model_dump(mode="json"),
-            payload.answer.model_dump(mode="json"),
-        ]
+        # Owners are authenticated before they get here, the foreign key covers
+        # the rest.
+        return ChatRoom(
+            title=payload.question.content.strip()[:CHAT_ROOM_MAX_TITLE_LENGTH],
+            owner_id=payload.asking_user_id,
+            messages_count=2,
+        )
 
-        asking_user = User.get_by_id(id=payload.asking_user_id, session=session)
-        if asking_user is None:
-            raise BuddyBadRequestError
 
-        assert asking_user.id is not None
+class ChatMessage(SQLModel, table=True):
+    __tablename__: str = "chat_message"  # type: ignore
 
-        room = ChatRoom(
-            title=payload.question.content.strip()[:CHAT_ROOM_MAX_TITLE_LENGTH],
-            messages=messages,
-            owner_id=asking_user.id,
+    room_id: uuid.UUID = Field(
+        primary_key=True,
+        foreign_key=f"{ChatRoom.__tablename__}.id",
+        ondelete="CASCADE",
+    )
+    sequence: int = Field(primary_key=True)
+    role: str = Field()
+    content: str = Field(sa_column=Column(Text, nullable=False))
+    llm_provider: str = Field()
+    llm_key: str = Field()
+    date: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+    @property
+    def as_chat_room_message(self) -> ChatRoomMessage:
+        return ChatRoomMessage(
+            role=self.role,  # type: ignore
+            content=self.content,
+            llm_provider=self.llm_provider,
+            llm_key=self.llm_key,
+            date=self.date,
         )
 
-        session.add(room)
-        if commit:
-            session.commit()
+    @staticmethod
+    def list_for_room(room_id: uuid.UUID, session: Session) -> Sequence[ChatMessage]:
+        return session.exec(ChatMessage.__for_room_query(room_id)).all()
 
-        return room
+    @staticmethod
+    async def list_for_room_async(
+        room_id: uuid.UUID, session: AsyncSession, from_sequence: int = 0
+    ) -> Sequence[ChatMessage]:
+        query = ChatMessage.__for_room_query(room_id)
+        if from_sequence > 0:
+            query = query.where(col(ChatMessage.sequence) >= from_sequence)
+
+        return (await session.exec(query)).all()
+
+    @staticmethod
+    async def list_window_for_room_async(
+        room_id: uuid.UUID,
+        limit: int,
+        session: AsyncSession,
+        before: int | None = None,
+        after: int | None = None,
+    ) -> tuple[list[ChatMessage], bool]:
+        """Keyset page of a rooms messages, always returned in ascending sequence.
+
+        Without `after` the page holds the newest messages (older than `before` when
+        given), otherwise the oldest messages newer than `after`. The returned flag
+        tells whether more messages exist further in the paging direction.
+        """
+        assert before is None or after is None
+
+        query = select(ChatMessage).where(ChatMessage.room_id == room_id)
+        if after is not None:
+            query = query.where(ChatMessage.sequence > after).order_by(
+                col(ChatMessage.sequence).asc()
+            )
+        else:
+            if before is not None:
+                query = query.where(ChatMessage.sequence < before)
+            query = query.order_by(col(ChatMessage.sequence).desc())
+
+        # Fetching one extra row tells whether there is another page without a count.
+        messages = list((await session.exec(query.limit(limit + 1))).all())
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if after is None:
+            messages.reverse()
+
+        return messages, has_more
+
+    @staticmethod
+    def insert_many_query(
+        room_id: uuid.UUID,
+        start_sequence: int | ColumnElement[int],
+        messages: list[ChatRoomMessage],
+        source: CTE | None = None,
+    ) -> Insert:
+        """Rows get selected from `source` when given, none when it has no rows."""
+        assert len(messages) > 0
+
+        new_messages = values(
+            column("offset", Integer),
+            column("role", String),
+            column("content", Text),
+            column("llm_provider", String),
+            column("llm_key", String),
+            column("date", DateTime(timezone=True)),
+            name="new_message",
+        ).data(
+            [
+                (
+                    offset,
+                    message.role,
+                    message.content,
+                    message.llm_provider,
+                    message.llm_key,
+                    message.date,
+                )
+                for offset, message in enumerate(messages)
+            ]
+        )
+        rows: Select = Select(
+            literal(room_id, Uuid),
+            start_sequence + new_messages.c.offset,
+            new_messages.c.role,
+            new_messages.c.content,
+            new_messages.c.llm_provider,
+            new_messages.c.llm_key,
+            new_messages.c.date,
+        )
+        if source is None:
+            rows = rows.select_from(new_messages)
+        else:
+            rows = rows.select_from(source).join(new_messages, true())
+
+        return insert(ChatMessage).from_select(
+            [
+                "room_id",
+                "sequence",
+                "role",
+                "content",
+                "llm_provider",
+                "llm_key",
+                "date",
+            ],
+            rows,
+        )
+
+    @staticmethod
+    def __for_room_query(room_id: uuid.UUID) -> SelectOfScalar[ChatMessage]:
+        return (
+            select(ChatMessage)
+            .where(ChatMessage.room_id == room_id)
+            .order_by(col(ChatMessage.sequence).asc())
+        )
+
+
+class LLMResponseCacheEntry(SQLModel, table=True):
+    __tablename__: str = "llm_response_cache"  # type: ignore
+
+    key: str = Field(primary_key=True)
+    content: str = Field(sa_column=Column(Text, nullable=False))
+    prompt_tokens: int
+    completion_tokens: int
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+    last_hit_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False, index=True)
+    )
+
+    @staticmethod
+    async def get_fresh_async(
+        key: str, session: AsyncSession
+    ) -> tuple[str, LLMUsage] | None:
+        # Touching the entry on read is what makes the eviction least recently used.
+        query = (
+            update(LLMResponseCacheEntry)
+            .where(
+                col(LLMResponseCacheEntry.key) == key,
+                col(LLMResponseCacheEntry.expires_at) > func.now(),
+            )
+            .values(last_hit_at=func.now())
+            .returning(
+                col(LLMResponseCacheEntry.content),
+                col(LLMResponseCacheEntry.prompt_tokens),
+                col(LLMResponseCacheEntry.completion_tokens),
+            )
+        )
+        row = (await session.exec(query)).first()  # type: ignore
+        await session.commit()
+        if row is None:
+            return None
+
+        content, prompt_tokens, completion_tokens = row
+
+        return content, LLMUsage(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+
+    @staticmethod
+    async def put_async(
+        key: str,
+        content: str,
+        usage: LLMUsage,
+        expires_at: datetime,
+        max_entries: int,
+        session: AsyncSession,
+    ) -> None:
+        values = {
+            "content": content,
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "expires_at": expires_at,
+            "last_hit_at": func.now(),
+        }
+        upsert_query = (
+            postgres_insert(LLMResponseCacheEntry)
+            .values(key=key, **values)
+            .on_conflict_do_update(
+                index_elements=[col(LLMResponseCacheEntry.key)], set_=values
+            )
+        )
+        evicted_keys = (
+            select(col(LLMResponseCacheEntry.key))
+            .order_by(col(LLMResponseCacheEntry.last_hit_at).desc())
+            .offset(max_entries)
+        )
+        evict_query = delete(LLMResponseCacheEntry).where(
+            or_(
+                col(LLMResponseCacheEntry.expires_at) <= func.now(),
+                col(LLMResponseCacheEntry.key).in_(evicted_keys),
+            )
+        )
+        await session.exec(upsert_query)  # type: ignore
+        await session.exec(evict_query)  # type: ignore
+        await session.commit()
+
+
+class ChatJob(SQLModel, table=True):
+    __tablename__: str = "chat_job"  # type: ignore
+    __table_args__ = (
+        UniqueConstraint(
+            "owner_id",
+            "idempotency_key",
+            name="uq_chat_job_owner_id_idempotency_key",
+        ),
+        Index(
+            "ix_chat_job_queued_created_at",
+            "created_at",
+            postgresql_where=text("status = 'queued'"),
+        ),
+        Index(
+            "ix_chat_job_running_llm_provider",
+            "llm_provider",
+            postgresql_where=text("status = 'running'"),
+        ),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    owner_id: int = Field(foreign_key=f"{User.__tablename__}.id", ondelete="CASCADE")
+    idempotency_key: str | None = Field(default=None)
+    llm_provider: str
+    payload: str = Field(sa_column=Column(Text, nullable=False))
+    status: str = Field(default="queued")
+    attempts: int = Field(default=0)
+    result: str | None = Field(default=None, sa_column=Column(Text, nullable=True))
+    error: str | None = Field(default=None, sa_column=Column(Text, nullable=True))
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False),
+        default_factory=datetime_now_with_timezone,
+    )
+    finished_at: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), nullable=True)
+    )
+    # Running jobs whose worker doesn't finish them by then are up for grabs again.
+    locked_until: datetime | None = Field(
+        default=None, sa_column=Column(DateTime(timezone=True), nullable=True)
+    )
+
+    @property
+    def as_chat_job_details(self) -> ChatJobDetails:
+        return ChatJobDetails(
+            job_id=self.id,
+            status=self.status,  # type: ignore
+            created_at=self.created_at,
+            finished_at=self.finished_at,
+            result=CreateChatMessageResponse.model_validate_json(self.result)
+            if self.result is not None
+            else None,
+            error=json.loads(self.error) if self.error is not None else None,
+        )
+
+    @staticmethod
+    async def enqueue_async(
+        owner_id: int,
+        payload: CreateChatMessagePayload,
+        session: AsyncSession,
+        idempotency_key: str | None = None,
+    ) -> ChatJob:
+        """Returns the already enqueued job when the idempotency key has been used."""
+        job = ChatJob(
+            owner_id=owner_id,
+            idempotency_key=idempotency_key,
+            llm_provider=payload.llm_provider,
+            payload=payload.model_dump_json(),
+        )
+        query = (
+            postgres_insert(ChatJob)
+            .values(**job.model_dump())
+            .on_conflict_do_nothing(
+                index_elements=[col(ChatJob.owner_id), col(ChatJob.idempotency_key)]
+            )
+            .returning(col(ChatJob.id))
+        )
+        inserted = (await session.exec(query)).first()  # type: ignore
+        await session.commit()
+        if inserted is not None:
+            return job
+
+        assert idempotency_key is not None
+
+        existing_job = await ChatJob.get_by_idempotency_key_async(
+            owner_id=owner_id,
+            idempotency_key=idempotency_key,
+            payload=payload,
+            session=session,
+        )
+        assert existing_job is not None
+
+        return existing_job
+
+    @staticmethod
+    async def get_by_idempotency_key_async(
+        owner_id: int,
+        idempotency_key: str,
+        payload: CreateChatMessagePayload,
+        session: AsyncSession,
+    ) -> ChatJob | None:
+        query = select(ChatJob).where(
+            ChatJob.owner_id == owner_id, ChatJob.idempotency_key == idempotency_key
+        )
+        job = (await session.exec(query)).first()
+        if job is not None and job.payload != payload.model_dump_json():
+            raise IdempotencyKeyReused
+
+        return job
+
+    @staticmethod
+    async def get_for_owner_async(
+        id: uuid.UUID, owner_id: int, session: AsyncSession
+    ) -> ChatJob | None:
+        query = select(ChatJob).where(ChatJob.id == id, ChatJob.owner_id == owner_id)
+
+        return (await session.exec(query)).first()
+
+    @staticmethod
+    async def claim_next_async(
+        excluded_providers: list[str],
+        lease_seconds: float,
+        max_attempts: int,
+        session: AsyncSession,
+    ) -> ChatJob | None:
+        """
+        Oldest claimable job first. Jobs other workers are claiming at the same time
+        are skipped rather than waited on.
+        """
+        claimable_query = (
+            select(col(ChatJob.id))
+            .where(
+                or_(
+                    col(ChatJob.status) == "queued",
+                    and_(
+                        col(ChatJob.status) == "running",
+                        col(ChatJob.locked_until) < func.now(),
+                    ),
+                ),
+                col(ChatJob.attempts) < max_attempts,
+            )
+            .order_by(col(ChatJob.created_at).asc())
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if len(excluded_providers) > 0:
+            claimable_query = claimable_query.where(
+                col(ChatJob.llm_provider).not_in(excluded_providers)
+            )
+
+        query = (
+            update(ChatJob)
+            .where(col(ChatJob.id) == claimable_query.scalar_subquery())
+            .values(
+                status="running",
+                attempts=col(ChatJob.attempts) + 1,
+                locked_until=func.now() + timedelta(seconds=lease_seconds),
+            )
+            .returning(col(ChatJob.id))
+        )
+        claimed_id = (await session.exec(query)).scalar()  # type: ignore
+        if claimed_id is None:
+            await session.commit()
+            return None
+
+        job = await session.get(ChatJob, claimed_id)
+        await session.commit()
+
+        return job
+
+    @staticmethod
+    async def extend_lease_async(
+        job: ChatJob, lease_seconds: float, session: AsyncSession
+    ) -> bool:
+        """False when the job has been taken over by another worker in the meantime."""
+        query = (
+            update(ChatJob)
+            .where(
+                col(ChatJob.id) == job.id,
+                col(ChatJob.status) == "running",
+                col(ChatJob.attempts) == job.attempts,
+            )
+            .values(locked_until=func.now() + timedelta(seconds=lease_seconds))
+        )
+        updated = (await session.exec(query)).rowcount  # type: ignore
+        await session.commit()
+
+        return updated > 0
+
+    @staticmethod
+    async def finish_async(
+        job: ChatJob, result: str | None, error: str | None, session: AsyncSession
+    ) -> bool:
+        """False when the job has been taken over by another worker in the meantime."""
+        finished_at = datetime_now_with_timezone()
+        status = "succeeded" if error is None else "failed"
+        query = (
+            update(ChatJob)
+            .where(
+                col(ChatJob.id) == job.id,
+                col(ChatJob.status) == "running",
+                col(ChatJob.attempts) == job.attempts,
+            )
+            .values(
+                status=status,
+                result=result,
+                error=error,
+                finished_at=finished_at,
+                locked_until=None,
+            )
+        )
+        updated = (await session.exec(query)).rowcount  # type: ignore
+        await session.commit()
+        if updated == 0:
+            return False
+
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = finished_at
+
+        return True
+
+    @staticmethod
+    async def fail_abandoned_async(
+        max_attempts: int, error: str, session: AsyncSession
+    ) -> int:
+        query = (
+            update(ChatJob)
+            .where(
+                col(ChatJob.status) == "running",
+                col(ChatJob.locked_until) < func.now(),
+                col(ChatJob.attempts) >= max_attempts,
+            )
+            .values(
+                status="failed", error=error, finished_at=func.now(), locked_until=None
+            )
+        )
+        failed = (await session.exec(query)).rowcount  # type: ignore
+        await session.commit()
+
+        return failed
+
+    @staticmethod
+    async def count_running_by_provider_async(session: AsyncSession) -> dict[str, int]:
+        query = (
+            select(col(ChatJob.llm_provider), func.count())
+            .where(
+                col(ChatJob.status) == "running",
+                col(ChatJob.locked_until) >= func.now(),
+            )
+            .group_by(col(ChatJob.llm_provider))
+        )
+
+        return dict(map(tuple, (await session.exec(query)).all()))  # type: ignore
+
+    @staticmethod
+    async def get_queue_stats_async(
+        session: AsyncSession,
+    ) -> tuple[int, datetime | None]:
+        """The amount of queued jobs and when the oldest of them was enqueued."""
+        query = select(func.count(), func.min(col(ChatJob.created_at))).where(
+            col(ChatJob.status) == "queued"
+        )
+        queued, oldest_created_at = (await session.exec(query)).one()
+
+        return queued, oldest_created_at
+
+
+class ChatIdempotencyKey(SQLModel, table=True):
+    __tablename__: str = "chat_idempotency_key"  # type: ignore
+
+    owner_id: int = Field(
+        primary_key=True, foreign_key=f"{User.__tablename__}.id", ondelete="CASCADE"
+    )
+    key: str = Field(primary_key=True)
+    fingerprint: str
+    # Empty while the first request is still in flight.
+    response: str | None = Field(default=None, sa_column=Column(Text, nullable=True))
+    expires_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+    @staticmethod
+    async def acquire_async(
+        owner_id: int,
+        key: str,
+        fingerprint: str,
+        in_flight_seconds: float,
+        session: AsyncSession,
+    ) -> ChatIdempotencyKey | None:
+        """None when the key is now held by the caller, the existing key otherwise."""
+        values = {
+            "fingerprint": fingerprint,
+            "response": None,
+            "expires_at": func.now() + timedelta(seconds=in_flight_seconds),
+        }
+        query = (
+            postgres_insert(ChatIdempotencyKey)
+            .values(owner_id=owner_id, key=key, **values)
+            .on_conflict_do_update(
+                index_elements=[
+                    col(ChatIdempotencyKey.owner_id),
+                    col(ChatIdempotencyKey.key),
+                ],
+                set_=values,
+                # Expired keys, and requests that died while holding one, are free.
+                where=col(ChatIdempotencyKey.expires_at) < func.now(),
+            )
+            .returning(col(ChatIdempotencyKey.key))
+        )
+        acquired = (await session.exec(query)).first()  # type: ignore
+        await session.commit()
+        if acquired is not None:
+            return None
+
+        existing_key = (
+            await session.exec(
+                select(ChatIdempotencyKey).where(
+                    ChatIdempotencyKey.owner_id == owner_id,
+                    ChatIdempotencyKey.key == key,
+                )
+            )
+        ).first()
+        if existing_key is None:
+            # Released in the meantime, the caller waits and tries again.
+            return ChatIdempotencyKey(
+                owner_id=owner_id,
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=datetime_now_with_timezone(),
+            )
+
+        return existing_key
+
+    @staticmethod
+    async def complete_async(
+        owner_id: int,
+        key: str,
+        response: str,
+        ttl_seconds: float,
+        session: AsyncSession,
+    ) -> None:
+        await session.exec(  # type: ignore
+            update(ChatIdempotencyKey)
+            .where(
+                col(ChatIdempotencyKey.owner_id) == owner_id,
+                col(ChatIdempotencyKey.key) == key,
+            )
+            .values(
+                response=response,
+                expires_at=func.now() + timedelta(seconds=ttl_seconds),
+            )
+        )
+        await session.exec(  # type: ignore
+            delete(ChatIdempotencyKey).where(
+                col(ChatIdempotencyKey.owner_id) == owner_id,
+                col(ChatIdempotencyKey.expires_at) < func.now(),
+            )
+        )
+        await session.commit()
+
+    @staticmethod
+    async def release_async(owner_id: int, key: str, session: AsyncSession) -> None:
+        await session.exec(  # type: ignore
+            delete(ChatIdempotencyKey).where(
+                col(ChatIdempotencyKey.owner_id) == owner_id,
+                col(ChatIdempotencyKey.key) == key,
+                col(ChatIdempotencyKey.response).is_(None),
+            )
+        )
+        await session.commit()
+
+
+class RateLimitBucket(SQLModel, table=True):
+    __tablename__: str = "rate_limit_bucket"  # type: ignore
+
+    owner_id: int = Field(
+        primary_key=True, foreign_key=f"{User.__tablename__}.id", ondelete="CASCADE"
+    )
+    tokens: float
+    updated_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+    @staticmethod
+    async def take_async(
+        owner_id: int, rate_per_second: float, burst: int, session: AsyncSession
+    ) -> bool:
+        """Refills and takes a token in one statement, False when none is left."""
+        refilled_tokens = func.least(
+            burst,
+            col(RateLimitBucket.tokens)
+            + func.extract("epoch", func.now() - col(RateLimitBucket.updated_at))
+            * rate_per_second,
+        )
+        query = (
+            postgres_insert(RateLimitBucket)
+            .values(owner_id=owner_id, tokens=burst - 1, updated_at=func.now())
+            .on_conflict_do_update(
+                index_elements=[col(RateLimitBucket.owner_id)],
+                set_={"tokens": refilled_tokens - 1, "updated_at": func.now()},
+                where=refilled_tokens >= 1,
+            )
+            .returning(col(RateLimitBucket.owner_id))
+        )
+        taken = (await session.exec(query)).first()  # type: ignore
+        await session.commit()
+
+        return taken is not None
+
+
+# Daily token quotas are enforced against this. The "postgres" rate limiter writes it as
+# soon as a turn got its answer, the in-memory one through the usage ledger.
+# `DailyUsageRollup` is only for reporting and billing.
+class DailyTokenUsage(SQLModel, table=True):
+    __tablename__: str = "daily_token_usage"  # type: ignore
+
+    owner_id: int = Field(
+        primary_key=True, foreign_key=f"{User.__tablename__}.id", ondelete="CASCADE"
+    )
+    day: date = Field(primary_key=True)
+    tokens: int = Field(default=0)
+
+    @staticmethod
+    async def get_tokens_async(owner_id: int, day: date, session: AsyncSession) -> int:
+        query = select(col(DailyTokenUsage.tokens)).where(
+            DailyTokenUsage.owner_id == owner_id, DailyTokenUsage.day == day
+        )
+
+        return (await session.exec(query)).first() or 0
+
+    @staticmethod
+    async def add_tokens_async(
+        owner_id: int, day: date, tokens: int, session: AsyncSession
+    ) -> None:
+        query = (
+            postgres_insert(DailyTokenUsage)
+            .values(owner_id=owner_id, day=day, tokens=tokens)
+            .on_conflict_do_update(
+                index_elements=[
+                    col(DailyTokenUsage.owner_id),
+                    col(DailyTokenUsage.day),
+                ],
+                set_={"tokens": col(DailyTokenUsage.tokens) + tokens},
+            )
+        )
+        await session.exec(query)  # type: ignore
+        await session.commit()
+
+    @staticmethod
+    def add_many(tokens_used: dict[tuple[int, date], int], session: Session) -> None:
+        if len(tokens_used) == 0:
+            return
+
+        query = postgres_insert(DailyTokenUsage).values(
+            list(
+                map(
+                    lambda item: {
+                        "owner_id": item[0][0],
+                        "day": item[0][1],
+                        "tokens": item[1],
+                    },
+                    tokens_used.items(),
+                )
+            )
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[col(DailyTokenUsage.owner_id), col(DailyTokenUsage.day)],
+            set_={"tokens": col(DailyTokenUsage.tokens) + query.excluded.tokens},
+        )
+        session.exec(query)  # type: ignore
+        session.commit()
+
+
+class UsageLedgerEntry(SQLModel, table=True):
+    __tablename__: str = "usage_ledger_entry"  # type: ignore
+    __table_args__ = (
+        Index("ix_usage_ledger_entry_owner_id_created_at", "owner_id", "created_at"),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    owner_id: int = Field(foreign_key=f"{User.__tablename__}.id", ondelete="CASCADE")
+    # Not a foreign key, usage is billed even after the room got deleted.
+    room_id: uuid.UUID
+    llm_provider: str
+    llm_key: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency_ms: int
+    cost_micro_usd: int
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+    @staticmethod
+    def insert_many(entries: Sequence[UsageLedgerEntry], session: Session) -> None:
+        """One multi-row INSERT for the ledger and one upsert for the rollups."""
+        if len(entries) == 0:
+            return
+
+        session.exec(  # type: ignore
+            insert(UsageLedgerEntry).values(
+                list(
+                    map(
+                        lambda entry: entry.model_dump(exclude={"id"}),
+                        entries,
+                    )
+                )
+            )
+        )
+        DailyUsageRollup.add_many(entries=entries, session=session)
+        session.commit()
+
+
+class DailyUsageRollup(SQLModel, table=True):
+    __tablename__: str = "daily_usage_rollup"  # type: ignore
+
+    owner_id: int = Field(
+        primary_key=True, foreign_key=f"{User.__tablename__}.id", ondelete="CASCADE"
+    )
+    day: date = Field(primary_key=True)
+    llm_provider: str = Field(primary_key=True)
+    llm_key: str = Field(primary_key=True)
+    requests: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    latency_ms: int = Field(default=0)
+    cost_micro_usd: int = Field(default=0)
+
+    @staticmethod
+    def add_many(entries: Sequence[UsageLedgerEntry], session: Session) -> None:
+        rollups: dict[tuple[int, date, str, str], DailyUsageRollup] = {}
+        for entry in entries:
+            day = entry.created_at.astimezone(settings.tzinfo).date()
+            rollup = rollups.setdefault(
+                (entry.owner_id, day, entry.llm_provider, entry.llm_key),
+                DailyUsageRollup(
+                    owner_id=entry.owner_id,
+                    day=day,
+                    llm_provider=entry.llm_provider,
+                    llm_key=entry.llm_key,
+                ),
+            )
+            rollup.requests += 1
+            rollup.prompt_tokens += entry.prompt_tokens
+            rollup.completion_tokens += entry.completion_tokens
+            rollup.latency_ms += entry.latency_ms
+            rollup.cost_micro_usd += entry.cost_micro_usd
+
+        # A statement can't upsert the same row twice, so entries get summed first.
+        query = postgres_insert(DailyUsageRollup).values(
+            list(map(lambda rollup: rollup.model_dump(), rollups.values()))
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[
+                col(DailyUsageRollup.owner_id),
+                col(DailyUsageRollup.day),
+                col(DailyUsageRollup.llm_provider),
+                col(DailyUsageRollup.llm_key),
+            ],
+            set_=dict(
+                map(
+                    lambda name: (
+                        name,
+                        getattr(DailyUsageRollup, name) + getattr(query.excluded, name),
+                    ),
+                    DAILY_USAGE_ROLLUP_SUMS,
+                )
+            ),
+        )
+        session.exec(query)  # type: ignore
+
+    @staticmethod
+    async def list_for_owner_async(
+        owner_id: int, from_day: date, to_day: date, session: AsyncSession
+    ) -> Sequence[DailyUsageRollup]:
+        query = (
+            select(DailyUsageRollup)
+            .where(
+                DailyUsageRollup.owner_id == owner_id,
+                col(DailyUsageRollup.day) >= from_day,
+                col(DailyUsageRollup.day) <= to_day,
+            )
+            .order_by(
+                col(DailyUsageRollup.day),
+                col(DailyUsageRollup.llm_provider),
+                col(DailyUsageRollup.llm_key),
+            )
+        )
+
+        return (await session.exec(query)).all()
+
+
+DAILY_USAGE_ROLLUP_SUMS = (
+    "requests",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency_ms",
+    "cost_micro_usd",
+)
@@ -3,10 +3,12 @@ from __future__ import annotations
 from collections import OrderedDict
 from functools import reduce
 from itertools import chain
-from typing import TYPE_CHECKING
+from types import MappingProxyType
+from typing import TYPE_CHECKING, NamedTuple
 
 from buddy.llm.providers.google import GoogleProvider
 from buddy.llm.providers.openai import OpenAIProvider
+from buddy.money.tiers import UserTiers
 
 if TYPE_CHECKING:
     from buddy.auth.models import User
@@ -15,6 +17,12 @@ if TYPE_CHECKING:
 
     Providers = OrderedDict[str, LLMProviderable]
 
+
+class RegisteredModel(NamedTuple):
+    llm_model: LLMModel
+    provider: LLMProviderable
+
+
 __PROVIDERS: list[LLMProviderable] = [GoogleProvider(), OpenAIProvider()]
 
 
@@ -27,53 +35,60 @@ def __reduce_provider(acc: Providers, provider: LLMProviderable) -> Providers:
 PROVIDERS: Providers = reduce(__reduce_provider, __PROVIDERS, OrderedDict())
 
 
-def get_users_model_by_key(user: User, llm_key: str, provider: str) -> LLMModel | None:
-    user_models = get_models_grouped_by_provider_available_to_user(user)
-    provider_models = user_models.get(provider)
-    if provider_models is None:
-        return None
-
-    assert len(provider_models) > 0
-
-    selected_model = None
-    for provider_model in provider_models:
-        if provider_model.key == llm_key:
-            selected_model = provider_model
-            break
+def __build_model_registry() -> dict[tuple[UserTiers, str, str], RegisteredModel]:
+    registry: dict[tuple[UserTiers, str, str], RegisteredModel] = {}
+    for tier in UserTiers:
+        for name, provider in PROVIDERS.items():
+            for llm_model in provider.get_model_list_available_to_tier(tier):
+                registry[(tier, name, llm_model.key)] = RegisteredModel(
+                    llm_model=llm_model, provider=provider
+                )
+
+    return registry
+
+
+def __build_available_models() -> dict[UserTiers, list[LLMModel]]:
+    return dict(
+        map(
+            lambda tier: (
+                tier,
+                list(
+                    chain.from_iterable(
+                        map(
+                            lambda provider: provider.get_model_list_available_to_tier(
+                                tier
+                            ),
+                            PROVIDERS.values(),
+                        )
+                    )
+                ),
+            ),
+            UserTiers,
+        )
+    )
 
-    if selected_model is None:
-        return None
 
-    return selected_model
+# Built once, dispatching a request is a dictionary lookup however many providers,
+# tiers or models there are.
+MODEL_REGISTRY = MappingProxyType(__build_model_registry())
+AVAILABLE_MODELS_BY_TIER = MappingProxyType(__build_available_models())
 
 
-def get_users_provider_by_model(user: User, model: LLMModel) -> LLMProviderable | None:
-    selected_model = get_users_model_by_key(
-        user=user, llm_key=model.key, provider=model.provider
-    )
-    if selected_model is None:
+def get_registered_model(
+    user: User, llm_key: str, provider: str
+) -> RegisteredModel | None:
+    tier = user.formatted_tier
+    if tier is None:
         return None
 
-    return PROVIDERS[selected_model.provider]
-
-
-def get_models_grouped_by_provider_available_to_user(
-    user: User,
-) -> dict[str, list[LLMModel]]:
-    models: dict[str, list[LLMModel]] = {}
-    for name, provider in PROVIDERS.items():
-        provider_models = provider.get_model_list_available_to_user(user)
-        if len(provider_models) == 0:
-            continue
+    return MODEL_REGISTRY.get((tier, provider, llm_key))
 
-        models[name] = provider_models
 
-    return models
+def get_model_list_available_to_user(user: User) -> list[LLMModel]:
+    """Shared between requests, don't mutate it."""
 
+    tier = user.formatted_tier
+    if tier is None:
+        return []
 
-def get_model_list_available_to_user(user: User) -> list[LLMModel]:
-    return list(
-        chain.from_iterable(
-            get_models_grouped_by_provider_available_to_user(user).values()
-        )
-    )
+    return AVAILABLE_MODELS_BY_TIER.get(tier, [])
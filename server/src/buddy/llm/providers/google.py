@@ -1,14 +1,20 @@
 from collections import OrderedDict
 from functools import reduce
-from typing import Literal
+from typing import AsyncIterator, Literal
 
 from google import genai  # type: ignore
 from pydantic import BaseModel
 
 from buddy.conf import settings
 from buddy.exceptions import BuddyInternalError
-from buddy.llm.providers.provider import LLMProviderable
-from buddy.llm.schemas import ChatRoomMessage, LLMModel
+from buddy.llm.providers.http_client import PooledGoogleClient, create_http_client
+from buddy.llm.providers.provider import (
+    LLMProviderable,
+    observe_latency,
+    record_usage,
+)
+from buddy.llm.schemas import ChatRoomMessage, LLMCompletion, LLMModel, LLMUsage
+from buddy.llm.tokenizers import estimate_conversation_tokens
 from buddy.money.tiers import UserTiers
 from buddy.utils.datetime_utils import datetime_now_with_timezone
 from buddy.utils.logger_utils import get_logger
@@ -26,12 +32,16 @@ _MODELS_MAPPED_BY_TIER: OrderedDict[UserTiers, list[LLMModel]] = OrderedDict(
                     key="gemini-2.0-flash-lite",
                     display_name="Gemini 2.0 Flash-Lite",
                     description="Lightning-fast and cheapest AI. Incredibly efficient reasoning model by Google.",
+                    prompt_usd_per_million_tokens=0.075,
+                    completion_usd_per_million_tokens=0.3,
                 ),
                 LLMModel(
                     provider=_NAME,
                     key="gemini-2.0-flash",
                     display_name="Gemini 2.0 Flash",
                     description="Lightning-fast AI. Incredibly efficient reasoning model by Google.",
+                    prompt_usd_per_million_tokens=0.1,
+                    completion_usd_per_million_tokens=0.4,
                 ),
             ],
         )
@@ -51,6 +61,9 @@ def __reduce_model(
 
 
 _MODELS: list[LLMModel] = reduce(__reduce_model, _MODELS_MAPPED_BY_TIER.items(), [])
+_MODELS_BY_KEY: dict[str, LLMModel] = dict(
+    map(lambda model: (model.key, model), _MODELS)
+)
 
 
 class GoogleProviderNativeMessagePart(BaseModel):
@@ -66,26 +79,30 @@ class GoogleProvider(LLMProviderable[GoogleProviderNativeMessage]):
     client: genai.Client
 
     def __init__(self):
-        self.client = genai.Client(api_key=settings.google_ai_api_key)
+        self.client = PooledGoogleClient(
+            api_key=settings.google_ai_api_key,
+            http_client=create_http_client(
+                max_connections=settings.google_ai_max_connections,
+                max_keepalive_connections=settings.google_ai_max_keepalive_connections,
+                keepalive_expiry_seconds=settings.google_ai_keepalive_expiry_seconds,
+                connect_timeout_seconds=settings.google_ai_connect_timeout_seconds,
+                read_timeout_seconds=settings.google_ai_read_timeout_seconds,
+                http2=settings.google_ai_http2,
+            ),
+        )
 
-    def chat(self, llm_model, messages) -> ChatRoomMessage:
+    async def chat(self, llm_model, messages) -> LLMCompletion:
         assert llm_model.provider == _NAME
-        assert llm_model.key in map(lambda model: model.key, _MODELS)
+        assert llm_model.key in _MODELS_BY_KEY
         assert self.client is not None
 
-        pre_calculated_token_count = self.client.models.count_tokens(
-            model=llm_model.key, contents=messages[-1].content
-        )
         logger.info(
-            f"Google AI completion on model '{llm_model.key}' made with '{pre_calculated_token_count}' tokens pre calculated"
-        )
-        native_messages = self.transform_messages_to_native(messages)
-        response = self.client.models.generate_content(
-            model=llm_model.key,
-            contents=list(
-                map(lambda message: message.model_dump(mode="python"), native_messages)
-            ),
+            f"Google AI completion on model '{llm_model.key}' made with '{self.count_tokens(llm_model, messages)}' tokens estimated"
         )
+        with observe_latency(llm_model, call="chat"):
+            response = await self.client.aio.models.generate_content(
+                model=llm_model.key, contents=self.__native_contents(messages)
+            )
         if response.usage_metadata is None:
             logger.warning("Usage from Google AI completion is None")
             raise BuddyInternalError
@@ -97,30 +114,79 @@ class GoogleProvider(LLMProviderable[GoogleProviderNativeMessage]):
             raise BuddyInternalError
 
         response_time = datetime_now_with_timezone()
+        usage = LLMUsage(
+            prompt_tokens=response.usage_metadata.prompt_token_count or 0,
+            completion_tokens=response.usage_metadata.candidates_token_count or 0,
+        )
+        record_usage(llm_model=llm_model, usage=usage)
+
+        return LLMCompletion(
+            message=ChatRoomMessage(
+                role="assistant",
+                content=response.text,
+                llm_key=llm_model.key,
+                llm_provider=llm_model.provider,
+                date=response_time,
+            ),
+            usage=usage,
+        )
+
+    async def stream_chat(self, llm_model, messages) -> AsyncIterator[str | LLMUsage]:
+        assert llm_model.provider == _NAME
+        assert llm_model.key in _MODELS_BY_KEY
+        assert self.client is not None
 
-        return ChatRoomMessage(
-            role="assistant",
-            content=response.text,
-            llm_key=llm_model.key,
-            llm_provider=llm_model.provider,
-            date=response_time,
+        usage_metadata = None
+        with observe_latency(llm_model, call="stream_chat") as observation:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=llm_model.key, contents=self.__native_contents(messages)
+            )
+            try:
+                async for chunk in stream:
+                    # Every chunk reports the usage so far, the last one has the total.
+                    if chunk.usage_metadata is not None:
+                        usage_metadata = chunk.usage_metadata
+
+                    if chunk.text:
+                        observation.first_token()
+                        yield chunk.text
+            finally:
+                # Releases the pooled connection when the client went away mid-stream.
+                await stream.aclose()
+
+        if usage_metadata is None:
+            logger.warning("Usage from Google AI completion stream is None")
+            raise BuddyInternalError
+
+        usage = LLMUsage(
+            prompt_tokens=usage_metadata.prompt_token_count or 0,
+            completion_tokens=usage_metadata.candidates_token_count or 0,
         )
+        record_usage(llm_model=llm_model, usage=usage)
+        yield usage
 
     def get_name(self):
         return _NAME
 
-    def get_model_list_available_to_user(self, user):
-        tier = user.formatted_tier
-        assert tier is not None
-
-        if tier is None:
-            return []
-
+    def get_model_list_available_to_tier(self, tier) -> list[LLMModel]:
         return _MODELS_MAPPED_BY_TIER.get(tier, [])
 
     def get_all_models(self) -> list[LLMModel]:
         return _MODELS
 
+    def count_tokens(self, llm_model, messages) -> int | None:
+        return estimate_conversation_tokens(messages)
+
+    async def count_tokens_exactly(self, llm_model, messages) -> int | None:
+        response = await self.client.aio.models.count_tokens(
+            model=llm_model.key, contents=self.__native_contents(messages)
+        )
+
+        return response.total_tokens
+
+    def preload(self) -> None:
+        pass
+
     def transform_messages_to_native(
         self, messages
     ) -> list[GoogleProviderNativeMessage]:
@@ -134,3 +200,11 @@ class GoogleProvider(LLMProviderable[GoogleProviderNativeMessage]):
             )
 
         return transformed_messages
+
+    def __native_contents(self, messages: list[ChatRoomMessage]) -> list[dict]:
+        return list(
+            map(
+                lambda message: message.model_dump(mode="python"),
+                self.transform_messages_to_native(messages),
+            )
+        )
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+
+import httpx
+from google import genai  # type: ignore
+from google.genai import errors  # type: ignore
+from google.genai._api_client import BaseApiClient, HttpResponse  # type: ignore
+
+
+def create_http_client(
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry_seconds: float,
+    connect_timeout_seconds: float,
+    read_timeout_seconds: float,
+    http2: bool,
+) -> httpx.AsyncClient:
+    """
+    One client per provider and process, every request shares its connection pool.
+    HTTP/2 needs the `h2` package to be installed.
+    """
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(read_timeout_seconds, connect=connect_timeout_seconds),
+        http2=http2,
+        follow_redirects=True,
+    )
+
+
+class PooledGoogleApiClient(BaseApiClient):
+    """
+    google-genai opens a new `httpx.AsyncClient`, and with it a new connection, for
+    every async request. This sends those requests through a shared client instead.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.__http_client = http_client
+
+    async def _async_request(self, http_request, stream=False):
+        if self.vertexai:
+            return await super()._async_request(
+                http_request=http_request, stream=stream
+            )
+
+        request = self.__http_client.build_request(
+            method=http_request.method,
+            url=http_request.url,
+            headers=http_request.headers,
+            content=json.dumps(http_request.data) if http_request.data else None,
+            timeout=http_request.timeout or httpx.USE_CLIENT_DEFAULT,
+        )
+        response = await self.__http_client.send(request, stream=stream)
+        if stream and response.is_error:
+            await response.aread()
+
+        errors.APIError.raise_for_response(response)
+
+        return HttpResponse(response.headers, response if stream else [response.text])
+
+    async def async_request_streamed(
+        self, http_method, path, request_dict, http_options=None
+    ):
+        http_request = self._build_request(
+            http_method, path, request_dict, http_options
+        )
+        response = await self._async_request(http_request=http_request, stream=True)
+
+        async def chunks():
+            # Streams left before their end would keep the connection checked out.
+            try:
+                async for chunk in response:
+                    yield chunk
+            finally:
+                await response.response_stream.aclose()
+
+        return chunks()
+
+
+class PooledGoogleClient(genai.Client):
+    def __init__(self, api_key: str | None, http_client: httpx.AsyncClient) -> None:
+        self.__http_client = http_client
+        super().__init__(api_key=api_key)
+
+    def _get_api_client(self, debug_config=None, **kwargs) -> PooledGoogleApiClient:
+        return PooledGoogleApiClient(http_client=self.__http_client, **kwargs)
@@ -1,13 +1,23 @@
 from collections import OrderedDict
 from functools import reduce
+from typing import AsyncIterator
 
-import tiktoken
-from openai import OpenAI
+from openai import AsyncOpenAI
 
 from buddy.conf import settings
 from buddy.exceptions import BuddyInternalError
-from buddy.llm.providers.provider import LLMProviderable
-from buddy.llm.schemas import ChatRoomMessage, LLMModel
+from buddy.llm.providers.http_client import create_http_client
+from buddy.llm.providers.provider import (
+    LLMProviderable,
+    observe_latency,
+    record_usage,
+)
+from buddy.llm.schemas import ChatRoomMessage, LLMCompletion, LLMModel, LLMUsage
+from buddy.llm.tokenizers import (
+    count_conversation_tokens,
+    get_preloaded_encoding,
+    preload_encodings,
+)
 from buddy.money.tiers import UserTiers
 from buddy.utils.datetime_utils import datetime_now_with_timezone
 from buddy.utils.logger_utils import get_logger
@@ -25,18 +35,24 @@ _MODELS_MAPPED_BY_TIER: OrderedDict[UserTiers, list[LLMModel]] = OrderedDict(
                     key="gpt-4o-mini",
                     display_name="GPT-4o mini",
                     description="GPT-4o Mini is great for lightweight, fast, and cost-effective AI tasks.",
+                    prompt_usd_per_million_tokens=0.15,
+                    completion_usd_per_million_tokens=0.6,
                 ),
                 LLMModel(
                     provider=_NAME,
                     key="o3-mini",
                     display_name="GPT-o3 mini",
                     description="GPT-o3 Mini is a small reasoning model, providing high intelligence at the same cost.",
+                    prompt_usd_per_million_tokens=1.1,
+                    completion_usd_per_million_tokens=4.4,
                 ),
                 LLMModel(
                     provider=_NAME,
                     key="gpt-4o",
                     display_name="GPT-4o",
                     description="Excels at fast, accurate, and multimodal AI interactions.",
+                    prompt_usd_per_million_tokens=2.5,
+                    completion_usd_per_million_tokens=10.0,
                 ),
             ],
         )
@@ -56,30 +72,42 @@ def __reduce_model(
 
 
 _MODELS: list[LLMModel] = reduce(__reduce_model, _MODELS_MAPPED_BY_TIER.items(), [])
+_MODELS_BY_KEY: dict[str, LLMModel] = dict(
+    map(lambda model: (model.key, model), _MODELS)
+)
 
 
 class OpenAIProvider(LLMProviderable[ChatRoomMessage]):
-    client: OpenAI
+    client: AsyncOpenAI
 
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        self.client = AsyncOpenAI(
+            api_key=settings.openai_api_key,
+            http_client=create_http_client(
+                max_connections=settings.openai_max_connections,
+                max_keepalive_connections=settings.openai_max_keepalive_connections,
+                keepalive_expiry_seconds=settings.openai_keepalive_expiry_seconds,
+                connect_timeout_seconds=settings.openai_connect_timeout_seconds,
+                read_timeout_seconds=settings.openai_read_timeout_seconds,
+                http2=settings.openai_http2,
+            ),
+        )
 
-    def chat(self, llm_model, messages) -> ChatRoomMessage:
+    async def chat(self, llm_model, messages) -> LLMCompletion:
         assert llm_model.provider == _NAME
-        assert llm_model.key in map(lambda model: model.key, _MODELS)
+        assert llm_model.key in _MODELS_BY_KEY
         assert self.client is not None
 
-        encoding = tiktoken.encoding_for_model(llm_model.key)
-        pre_calculated_token_count = len(encoding.encode(text=messages[-1].content))
         logger.info(
-            f"OpenAI completion on model '{llm_model.key}' made with '{pre_calculated_token_count}' tokens pre calculated"
-        )
-        response = self.client.chat.completions.create(
-            messages=list(
-                map(lambda message: message.as_llm_message.model_dump(), messages)
-            ),
-            model=llm_model.key,
+            f"OpenAI completion on model '{llm_model.key}' made with '{self.count_tokens(llm_model, messages)}' tokens pre calculated"
         )
+        with observe_latency(llm_model, call="chat"):
+            response = await self.client.chat.completions.create(
+                messages=list(
+                    map(lambda message: message.as_llm_message.model_dump(), messages)
+                ),
+                model=llm_model.key,
+            )
         if response.usage is None:
             logger.warning("Usage from OpenAI completion is None")
             raise BuddyInternalError
@@ -96,25 +124,81 @@ class OpenAIProvider(LLMProviderable[ChatRoomMessage]):
             raise BuddyInternalError
 
         response_time = datetime_now_with_timezone()
-
-        return ChatRoomMessage(
-            role=choice.message.role,
-            content=choice.message.content,
-            llm_key=llm_model.key,
-            llm_provider=llm_model.provider,
-            date=response_time,
+        usage = LLMUsage(
+            prompt_tokens=response.usage.prompt_tokens,
+            completion_tokens=response.usage.completion_tokens,
+        )
+        record_usage(llm_model=llm_model, usage=usage)
+
+        return LLMCompletion(
+            message=ChatRoomMessage(
+                role=choice.message.role,
+                content=choice.message.content,
+                llm_key=llm_model.key,
+                llm_provider=llm_model.provider,
+                date=response_time,
+            ),
+            usage=usage,
         )
 
-    def transform_messages_to_native(self, messages) -> list[ChatRoomMessage]:
-        return messages
+    async def stream_chat(self, llm_model, messages) -> AsyncIterator[str | LLMUsage]:
+        assert llm_model.provider == _NAME
+        assert llm_model.key in _MODELS_BY_KEY
+        assert self.client is not None
+
+        usage: LLMUsage | None = None
+        with observe_latency(llm_model, call="stream_chat") as observation:
+            stream = await self.client.chat.completions.create(
+                messages=list(
+                    map(lambda message: message.as_llm_message.model_dump(), messages)
+                ),
+                model=llm_model.key,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async with stream:
+                async for chunk in stream:
+                    # Only set on the last chunk, which comes without choices.
+                    if chunk.usage is not None:
+                        usage = LLMUsage(
+                            prompt_tokens=chunk.usage.prompt_tokens,
+                            completion_tokens=chunk.usage.completion_tokens,
+                        )
+
+                    if len(chunk.choices) == 0:
+                        continue
+
+                    if content := chunk.choices[0].delta.content:
+                        observation.first_token()
+                        yield content
+
+        if usage is None:
+            logger.warning("Usage from OpenAI completion stream is None")
+            raise BuddyInternalError
 
-    def get_model_list_available_to_user(self, user) -> list[LLMModel]:
-        tier = user.formatted_tier
-        assert tier is not None
+        record_usage(llm_model=llm_model, usage=usage)
+        yield usage
 
-        if tier is None:
-            return []
+    def count_tokens(self, llm_model, messages) -> int | None:
+        encoding = get_preloaded_encoding(llm_model.key)
+        if encoding is None:
+            return None
+
+        return count_conversation_tokens(encoding, messages)
+
+    async def count_tokens_exactly(self, llm_model, messages) -> int | None:
+        return self.count_tokens(llm_model, messages)
+
+    def preload(self) -> None:
+        try:
+            preload_encodings(map(lambda model: model.key, _MODELS))
+        except Exception:
+            logger.exception("Failed to preload the tiktoken encodings")
+
+    def transform_messages_to_native(self, messages) -> list[ChatRoomMessage]:
+        return messages
 
+    def get_model_list_available_to_tier(self, tier) -> list[LLMModel]:
         return _MODELS_MAPPED_BY_TIER.get(tier, [])
 
     def get_name(self):
@@ -1,25 +1,74 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Generic, Protocol, TypeVar
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Generic, Iterator, Protocol, TypeVar
 
 from pydantic import BaseModel
 
 from buddy.llm.schemas import ChatRoomMessage
+from buddy.metrics import Counter, Histogram
 
 if TYPE_CHECKING:
-    from buddy.auth.models import User
-    from buddy.llm.schemas import LLMModel
+    from buddy.llm.schemas import LLMCompletion, LLMModel, LLMUsage
+    from buddy.money.tiers import UserTiers
 
+LLM_TOKENS = Counter(
+    "buddy_llm_tokens",
+    "Tokens used by LLM provider calls as reported by the providers",
+    label_names=("provider", "model", "kind"),
+)
+
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+LLM_PROVIDER_LATENCY = Histogram(
+    "buddy_llm_provider_latency_seconds",
+    "Time LLM provider calls took, streams until their last chunk",
+    label_names=("provider", "model", "call"),
+    buckets=LLM_LATENCY_BUCKETS,
+)
+
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "buddy_llm_time_to_first_token_seconds",
+    "Time until streamed LLM provider calls sent their first chunk of content",
+    label_names=("provider", "model"),
+    buckets=LLM_LATENCY_BUCKETS,
+)
+LLM_PROVIDER_ERRORS = Counter(
+    "buddy_llm_provider_errors",
+    "LLM provider calls that failed",
+    label_names=("provider", "model", "call"),
+)
 
 NativeMessage = TypeVar("NativeMessage", bound=BaseModel)
 
 
 class LLMProviderable(Protocol, Generic[NativeMessage]):
-    def chat(
+    async def chat(
+        self, llm_model: LLMModel, messages: list[ChatRoomMessage]
+    ) -> LLMCompletion: ...
+
+    def stream_chat(
+        self, llm_model: LLMModel, messages: list[ChatRoomMessage]
+    ) -> AsyncIterator[str | LLMUsage]:
+        """Yields the answer in chunks, followed by the usage the provider reported."""
+        ...
+
+    def count_tokens(
+        self, llm_model: LLMModel, messages: list[ChatRoomMessage]
+    ) -> int | None:
+        """Local count or estimate, cheap enough for every request."""
+        ...
+
+    async def count_tokens_exactly(
         self, llm_model: LLMModel, messages: list[ChatRoomMessage]
-    ) -> ChatRoomMessage: ...
+    ) -> int | None:
+        """May call the provider, only for when an estimate isn't good enough."""
+        ...
 
-    def get_model_list_available_to_user(self, user: User) -> list[LLMModel]: ...
+    def preload(self) -> None: ...
+
+    def get_model_list_available_to_tier(self, tier: UserTiers) -> list[LLMModel]: ...
 
     def get_name(self) -> str: ...
 
@@ -28,3 +77,56 @@ class LLMProviderable(Protocol, Generic[NativeMessage]):
     def transform_messages_to_native(
         self, messages: list[ChatRoomMessage]
     ) -> list[NativeMessage]: ...
+
+
+def record_usage(llm_model: LLMModel, usage: LLMUsage) -> None:
+    LLM_TOKENS.inc(
+        usage.prompt_tokens,
+        provider=llm_model.provider,
+        model=llm_model.key,
+        kind="prompt",
+    )
+    LLM_TOKENS.inc(
+        usage.completion_tokens,
+        provider=llm_model.provider,
+        model=llm_model.key,
+        kind="completion",
+    )
+
+
+class LatencyObservation:
+    def __init__(self, llm_model: LLMModel) -> None:
+        self.llm_model = llm_model
+        self.started_at = time.perf_counter()
+        self.__first_token_observed = False
+
+    def first_token(self) -> None:
+        """Call it for every chunk a stream yields, only the first one counts."""
+        if self.__first_token_observed:
+            return
+
+        self.__first_token_observed = True
+        LLM_TIME_TO_FIRST_TOKEN.observe(
+            time.perf_counter() - self.started_at,
+            provider=self.llm_model.provider,
+            model=self.llm_model.key,
+        )
+
+
+@contextmanager
+def observe_latency(llm_model: LLMModel, call: str) -> Iterator[LatencyObservation]:
+    observation = LatencyObservation(llm_model)
+    try:
+        yield observation
+    except Exception:
+        LLM_PROVIDER_ERRORS.inc(
+            provider=llm_model.provider, model=llm_model.key, call=call
+        )
+        raise
+    finally:
+        LLM_PROVIDER_LATENCY.observe(
+            time.perf_counter() - observation.started_at,
+            provider=llm_model.provider,
+            model=llm_model.key,
+            call=call,
+        )
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Protocol
+
+from buddy.auth.models import User
+from buddy.conf import settings
+from buddy.database import Databaseable, create_async_session
+from buddy.llm.exceptions import RateLimited, TokenQuotaExceeded
+from buddy.llm.models import DailyTokenUsage, RateLimitBucket
+from buddy.llm.schemas import LLMUsage
+from buddy.llm.usage import get_usage_ledger
+from buddy.metrics import Counter
+from buddy.money.limits import TIER_LIMITS, TierLimits
+from buddy.utils.cache_utils import TTLCache
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+DAY_SECONDS = 24 * 60 * 60
+
+RATE_LIMITED_REQUESTS = Counter(
+    "buddy_rate_limited_requests",
+    "Chat requests turned away by the rate limits or the daily token quotas",
+    label_names=("tier", "reason"),
+)
+
+
+class RateLimitable(Protocol):
+    async def take_request(self, owner_id: int, limits: TierLimits) -> bool: ...
+
+    async def get_tokens_used(self, owner_id: int, day: date) -> int: ...
+
+    async def add_tokens_used(self, owner_id: int, day: date, tokens: int) -> None: ...
+
+
+class PostgresRateLimiter(RateLimitable):
+    def __init__(self, database: Databaseable) -> None:
+        self.database = database
+
+    async def take_request(self, owner_id, limits) -> bool:
+        async with create_async_session(self.database) as session:
+            return await RateLimitBucket.take_async(
+                owner_id=owner_id,
+                rate_per_second=limits.requests_per_minute / 60,
+                burst=limits.request_burst,
+                session=session,
+            )
+
+    async def get_tokens_used(self, owner_id, day) -> int:
+        async with create_async_session(self.database) as session:
+            return await DailyTokenUsage.get_tokens_async(
+                owner_id=owner_id, day=day, session=session
+            )
+
+    async def add_tokens_used(self, owner_id, day, tokens) -> None:
+        async with create_async_session(self.database) as session:
+            await DailyTokenUsage.add_tokens_async(
+                owner_id=owner_id, day=day, tokens=tokens, session=session
+            )
+
+
+class InMemoryRateLimiter(PostgresRateLimiter):
+    """
+    Keeps the request buckets and the daily tokens in memory. A user's daily tokens
+    are loaded from Postgres once a day, the tokens used since are added locally and
+    written through the usage ledger.
+    """
+
+    def __init__(self, database: Databaseable, max_users: int) -> None:
+        super().__init__(database=database)
+        # Buckets that would have refilled completely are as good as missing ones.
+        self.__buckets: TTLCache[int, tuple[float, float]] = TTLCache(
+            max_size=max_users
+        )
+        self.__tokens_used: TTLCache[tuple[int, date], int] = TTLCache(
+            max_size=max_users
+        )
+        self.__lock = threading.Lock()
+
+    async def take_request(self, owner_id, limits) -> bool:
+        rate_per_second = limits.requests_per_minute / 60
+        now = time.monotonic()
+        with self.__lock:
+            tokens, updated_at = self.__buckets.get(owner_id) or (
+                limits.request_burst,
+                now,
+            )
+            tokens = min(
+                limits.request_burst, tokens + (now - updated_at) * rate_per_second
+            )
+            if tokens < 1:
+                return False
+
+            self.__buckets.set(
+                owner_id,
+                (tokens - 1, now),
+                ttl_seconds=limits.request_burst / rate_per_second,
+            )
+
+            return True
+
+    async def get_tokens_used(self, owner_id, day) -> int:
+        tokens_used = self.__tokens_used.get((owner_id, day))
+        if tokens_used is not None:
+            return tokens_used
+
+        loaded_tokens_used = await super().get_tokens_used(owner_id=owner_id, day=day)
+        with self.__lock:
+            # Another request may have loaded and added to it in the meantime.
+            tokens_used = self.__tokens_used.get((owner_id, day))
+            if tokens_used is None:
+                tokens_used = loaded_tokens_used
+                self.__tokens_used.set(
+                    (owner_id, day), tokens_used, ttl_seconds=DAY_SECONDS
+                )
+
+            return tokens_used
+
+    async def add_tokens_used(self, owner_id, day, tokens) -> None:
+        tokens_used = await self.get_tokens_used(owner_id=owner_id, day=day)
+        with self.__lock:
+            tokens_used = self.__tokens_used.get((owner_id, day)) or tokens_used
+            self.__tokens_used.set(
+                (owner_id, day), tokens_used + tokens, ttl_seconds=DAY_SECONDS
+            )
+
+        get_usage_ledger(self.database).record_tokens_used(
+            owner_id=owner_id, day=day, tokens=tokens
+        )
+
+
+__in_memory_rate_limiter: InMemoryRateLimiter | None = None
+
+
+def get_rate_limiter(database: Databaseable) -> RateLimitable | None:
+    global __in_memory_rate_limiter
+    if settings.rate_limit_backend == "postgres":
+        return PostgresRateLimiter(database=database)
+
+    if settings.rate_limit_backend == "memory":
+        if __in_memory_rate_limiter is None:
+            __in_memory_rate_limiter = InMemoryRateLimiter(
+                database=database, max_users=settings.rate_limit_max_users
+            )
+
+        return __in_memory_rate_limiter
+
+    return None
+
+
+async def enforce_chat_limits(database: Databaseable, user: User) -> None:
+    """
+    Runs before a chat message gets dispatched to a provider, idempotent replays
+    don't get here.
+    """
+
+    rate_limiter = get_rate_limiter(database)
+    tier = user.formatted_tier
+    if rate_limiter is None or tier is None:
+        return
+
+    limits = TIER_LIMITS.get(tier)
+    if limits is None:
+        return
+
+    assert user.id is not None
+
+    now = datetime_now_with_timezone()
+    tokens_used = await rate_limiter.get_tokens_used(owner_id=user.id, day=now.date())
+    if tokens_used >= limits.daily_tokens:
+        RATE_LIMITED_REQUESTS.inc(tier=tier.name, reason="daily_tokens")
+        raise TokenQuotaExceeded(
+            headers={"Retry-After": str(seconds_until_tomorrow(now))}
+        )
+
+    if not await rate_limiter.take_request(owner_id=user.id, limits=limits):
+        RATE_LIMITED_REQUESTS.inc(tier=tier.name, reason="requests")
+        raise RateLimited(
+            headers={"Retry-After": str(math.ceil(60 / limits.requests_per_minute))}
+        )
+
+
+async def record_tokens_used(
+    database: Databaseable, owner_id: int, usage: LLMUsage
+) -> None:
+    rate_limiter = get_rate_limiter(database)
+    if rate_limiter is None:
+        return
+
+    await rate_limiter.add_tokens_used(
+        owner_id=owner_id,
+        day=datetime_now_with_timezone().date(),
+        tokens=usage.prompt_tokens + usage.completion_tokens,
+    )
+
+
+def seconds_until_tomorrow(now: datetime) -> int:
+    tomorrow = datetime.combine(
+        now.date() + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo
+    )
+
+    return math.ceil((tomorrow - now).total_seconds())
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import timedelta
+from typing import NamedTuple, Protocol
+
+from buddy.conf import settings
+from buddy.database import Databaseable, create_async_session
+from buddy.llm.models import LLMResponseCacheEntry
+from buddy.llm.routing import RouteCandidate, chat_with_fallbacks
+from buddy.llm.schemas import ChatRoomMessage, LLMCompletion, LLMModel, LLMUsage
+from buddy.metrics import Counter
+from buddy.utils.cache_utils import TTLCache
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "buddy_llm_response_cache_lookups",
+    "LLM response cache lookups by result, the hit ratio is hit / (hit + miss)",
+    label_names=("result",),
+)
+RESPONSE_CACHE_SAVED_TOKENS = Counter(
+    "buddy_llm_response_cache_saved_tokens",
+    "Provider tokens not spent thanks to LLM response cache hits",
+    label_names=("provider", "model"),
+)
+
+
+class CachedResponse(NamedTuple):
+    content: str
+    usage: LLMUsage
+
+
+class ResponseCacheable(Protocol):
+    async def get(self, key: str) -> CachedResponse | None: ...
+
+    async def set(self, key: str, response: CachedResponse) -> None: ...
+
+
+class InMemoryResponseCache(ResponseCacheable):
+    def __init__(self, max_entries: int) -> None:
+        self.__entries: TTLCache[str, CachedResponse] = TTLCache(max_size=max_entries)
+
+    async def get(self, key) -> CachedResponse | None:
+        return self.__entries.get(key)
+
+    async def set(self, key, response) -> None:
+        self.__entries.set(
+            key, response, ttl_seconds=settings.response_cache_ttl_seconds
+        )
+
+
+class PostgresResponseCache(ResponseCacheable):
+    def __init__(self, database: Databaseable, max_entries: int) -> None:
+        self.database = database
+        self.max_entries = max_entries
+
+    async def get(self, key) -> CachedResponse | None:
+        async with create_async_session(self.database) as session:
+            entry = await LLMResponseCacheEntry.get_fresh_async(
+                key=key, session=session
+            )
+            if entry is None:
+                return None
+
+            content, usage = entry
+
+            return CachedResponse(content=content, usage=usage)
+
+    async def set(self, key, response) -> None:
+        expires_at = datetime_now_with_timezone() + timedelta(
+            seconds=settings.response_cache_ttl_seconds
+        )
+        async with create_async_session(self.database) as session:
+            await LLMResponseCacheEntry.put_async(
+                key=key,
+                content=response.content,
+                usage=response.usage,
+                expires_at=expires_at,
+                max_entries=self.max_entries,
+                session=session,
+            )
+
+
+__in_memory_response_cache: InMemoryResponseCache | None = None
+
+
+def get_response_cache(database: Databaseable) -> ResponseCacheable | None:
+    global __in_memory_response_cache
+    if settings.response_cache_backend == "postgres":
+        return PostgresResponseCache(
+            database=database, max_entries=settings.response_cache_max_entries
+        )
+
+    if settings.response_cache_backend == "memory":
+        if __in_memory_response_cache is None:
+            __in_memory_response_cache = InMemoryResponseCache(
+                max_entries=settings.response_cache_max_entries
+            )
+
+        return __in_memory_response_cache
+
+    return None
+
+
+def make_response_cache_key(
+    llm_model: LLMModel, messages: list[ChatRoomMessage]
+) -> str:
+    # Whitespace differences don't change the answer, dates and ids aren't part of it.
+    conversation = list(
+        map(
+            lambda message: [message.role, " ".join(message.content.split())],
+            messages,
+        )
+    )
+    payload = json.dumps([llm_model.provider, llm_model.key, conversation])
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def chat_with_response_cache(
+    route: list[RouteCandidate],
+    messages: list[ChatRoomMessage],
+    cache: ResponseCacheable | None,
+) -> tuple[LLMCompletion, bool]:
+    """Returns the completion and whether it came out of the cache."""
+
+    if cache is None:
+        return await chat_with_fallbacks(route=route, messages=messages), False
+
+    llm_model = route[0].llm_model
+    key = make_response_cache_key(llm_model=llm_model, messages=messages)
+    cached_response = await cache.get(key)
+    if cached_response is not None:
+        RESPONSE_CACHE_LOOKUPS.inc(result="hit")
+        RESPONSE_CACHE_SAVED_TOKENS.inc(
+            cached_response.usage.prompt_tokens
+            + cached_response.usage.completion_tokens,
+            provider=llm_model.provider,
+            model=llm_model.key,
+        )
+        message = ChatRoomMessage(
+            role="assistant",
+            content=cached_response.content,
+            llm_key=llm_model.key,
+            llm_provider=llm_model.provider,
+            date=datetime_now_with_timezone(),
+        )
+
+        return LLMCompletion(message=message, usage=cached_response.usage), True
+
+    RESPONSE_CACHE_LOOKUPS.inc(result="miss")
+    completion = await chat_with_fallbacks(route=route, messages=messages)
+    if (
+        completion.message.llm_provider != llm_model.provider
+        or completion.message.llm_key != llm_model.key
+    ):
+        # Answered by a fallback, not what the key promises.
+        return completion, False
+
+    await cache.set(
+        key,
+        CachedResponse(content=completion.message.content, usage=completion.usage),
+    )
+
+    return completion, False
@@ -2,16 +2,29 @@ import uuid
 from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
 
 from buddy.llm.controller import LLMControllable, get_llm_controller
 from buddy.llm.schemas import (
+    CHAT_JOB_MAX_WAIT_SECONDS,
+    CHAT_MESSAGES_DEFAULT_PAGE_SIZE,
+    CHAT_MESSAGES_MAX_PAGE_SIZE,
+    CHAT_ROOMS_DEFAULT_PAGE_SIZE,
+    CHAT_ROOMS_MAX_PAGE_SIZE,
+    ChatJobAcceptedResponse,
+    ChatJobResponse,
     ChatRoomListResponse,
     CreateChatMessagePayload,
     CreateChatMessageResponse,
     ListChatMessagesResponse,
 )
+from buddy.llm.streaming import chat_stream_as_server_sent_events
 from buddy.schemas import ErrorResponse
+from buddy.utils.sse_utils import (
+    SERVER_SENT_EVENTS_HEADERS,
+    SERVER_SENT_EVENTS_MEDIA_TYPE,
+)
 
 llm_router = APIRouter(prefix="/llm")
 
@@ -22,7 +35,11 @@ llm_router = APIRouter(prefix="/llm")
     responses={
         HTTPStatus.OK: {
             "model": ChatRoomListResponse,
-            "description": "Returns the requesting users chat rooms",
+            "description": "Returns a page of the requesting users chat rooms",
+        },
+        HTTPStatus.BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Invalid cursor provided",
         },
         HTTPStatus.UNAUTHORIZED: {
             "model": ErrorResponse,
@@ -30,10 +47,17 @@ llm_router = APIRouter(prefix="/llm")
         },
     },
 )
-def list_chat_rooms(
+async def list_chat_rooms(
     controller: Annotated[LLMControllable, Depends(get_llm_controller)],
+    limit: Annotated[
+        int, Query(ge=1, le=CHAT_ROOMS_MAX_PAGE_SIZE)
+    ] = CHAT_ROOMS_DEFAULT_PAGE_SIZE,
+    cursor: Annotated[
+        str | None,
+        Query(description="Return the chat rooms after this cursor"),
+    ] = None,
 ) -> ChatRoomListResponse:
-    return controller.list_chat_rooms()
+    return await controller.list_chat_rooms(limit=limit, cursor=cursor)
 
 
 @llm_router.get(
@@ -42,7 +66,11 @@ def list_chat_rooms(
     responses={
         HTTPStatus.OK: {
             "model": ListChatMessagesResponse,
-            "description": "Returns the requesting users chat rooms",
+            "description": "Returns a page of the requesting users chat room messages",
+        },
+        HTTPStatus.BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Both the before and after cursors have been provided",
         },
         HTTPStatus.UNAUTHORIZED: {
             "model": ErrorResponse,
@@ -54,11 +82,24 @@ def list_chat_rooms(
         },
     },
 )
-def list_chat_messages(
+async def list_chat_messages(
     room_id: uuid.UUID,
     controller: Annotated[LLMControllable, Depends(get_llm_controller)],
+    limit: Annotated[
+        int, Query(ge=1, le=CHAT_MESSAGES_MAX_PAGE_SIZE)
+    ] = CHAT_MESSAGES_DEFAULT_PAGE_SIZE,
+    before: Annotated[
+        int | None,
+        Query(ge=0, description="Return the messages older than this cursor"),
+    ] = None,
+    after: Annotated[
+        int | None,
+        Query(ge=0, description="Return the messages newer than this cursor"),
+    ] = None,
 ) -> ListChatMessagesResponse:
-    return controller.list_chat_messages(room_id)
+    return await controller.list_chat_messages(
+        room_id=room_id, limit=limit, before=before, after=after
+    )
 
 
 @llm_router.post(
@@ -69,6 +110,13 @@ def list_chat_messages(
             "model": CreateChatMessageResponse,
             "description": "Return the chat response after sending a message.",
         },
+        HTTPStatus.ACCEPTED: {
+            "model": ChatJobAcceptedResponse,
+            "description": (
+                "With `Prefer: respond-async` the message is answered in the "
+                "background, poll `/llm/jobs/{job_id}` for the chat response."
+            ),
+        },
         HTTPStatus.UNAUTHORIZED: {
             "model": ErrorResponse,
             "description": "Resources requested while unauthorized",
@@ -77,14 +125,111 @@ def list_chat_messages(
             "model": ErrorResponse,
             "description": "Forbidden LLM has been selected",
         },
+        HTTPStatus.CONFLICT: {
+            "model": ErrorResponse,
+            "description": "Request with the same `Idempotency-Key` is still in progress",
+        },
+        HTTPStatus.TOO_MANY_REQUESTS: {
+            "model": ErrorResponse,
+            "description": "Rate limit or daily token quota reached",
+        },
+        HTTPStatus.UNPROCESSABLE_ENTITY: {
+            "model": ErrorResponse,
+            "description": "`Idempotency-Key` has been used for another request",
+        },
         HTTPStatus.INTERNAL_SERVER_ERROR: {
             "model": ErrorResponse,
             "description": "Something unexpected went wrong",
         },
     },
 )
-def create_chat_message(
+async def create_chat_message(
     payload: CreateChatMessagePayload,
     controller: Annotated[LLMControllable, Depends(get_llm_controller)],
-) -> CreateChatMessageResponse:
-    return controller.create_chat_message(payload)
+    response: Response,
+    prefer: Annotated[str | None, Header()] = None,
+    idempotency_key: Annotated[str | None, Header(max_length=255)] = None,
+) -> CreateChatMessageResponse | ChatJobAcceptedResponse:
+    if prefer is not None and "respond-async" in prefer:
+        response.status_code = HTTPStatus.ACCEPTED
+
+        return await controller.enqueue_chat_message(
+            payload, idempotency_key=idempotency_key
+        )
+
+    return await controller.create_chat_message(
+        payload, idempotency_key=idempotency_key
+    )
+
+
+@llm_router.get(
+    "/jobs/{job_id}",
+    status_code=HTTPStatus.OK,
+    responses={
+        HTTPStatus.OK: {
+            "model": ChatJobResponse,
+            "description": "Returns the chat job, with the chat response once done",
+        },
+        HTTPStatus.UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "Resources requested while unauthorized",
+        },
+        HTTPStatus.NOT_FOUND: {
+            "model": ErrorResponse,
+            "description": "Chat job not found",
+        },
+    },
+)
+async def get_chat_job(
+    job_id: uuid.UUID,
+    controller: Annotated[LLMControllable, Depends(get_llm_controller)],
+    wait: Annotated[
+        float,
+        Query(
+            ge=0,
+            le=CHAT_JOB_MAX_WAIT_SECONDS,
+            description="Seconds to wait for an unfinished job to finish",
+        ),
+    ] = 0,
+) -> ChatJobResponse:
+    return await controller.get_chat_job(job_id=job_id, wait_seconds=wait)
+
+
+@llm_router.post(
+    "/chats/stream",
+    status_code=HTTPStatus.OK,
+    response_class=StreamingResponse,
+    responses={
+        HTTPStatus.OK: {
+            "content": {SERVER_SENT_EVENTS_MEDIA_TYPE: {}},
+            "description": (
+                "Stream the chat response as server-sent events. `delta` events carry "
+                "the answer's content as it gets generated, the stream ends with a "
+                "`done` event carrying the saved message or an `error` event."
+            ),
+        },
+        HTTPStatus.UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "Resources requested while unauthorized",
+        },
+        HTTPStatus.FORBIDDEN: {
+            "model": ErrorResponse,
+            "description": "Forbidden LLM has been selected",
+        },
+        HTTPStatus.TOO_MANY_REQUESTS: {
+            "model": ErrorResponse,
+            "description": "Rate limit or daily token quota reached",
+        },
+    },
+)
+async def stream_chat_message(
+    payload: CreateChatMessagePayload,
+    controller: Annotated[LLMControllable, Depends(get_llm_controller)],
+) -> StreamingResponse:
+    events = await controller.stream_chat_message(payload)
+
+    return StreamingResponse(
+        chat_stream_as_server_sent_events(events),
+        media_type=SERVER_SENT_EVENTS_MEDIA_TYPE,
+        headers=SERVER_SENT_EVENTS_HEADERS,
+    )
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, AsyncIterator, Literal
+
+from buddy.conf import settings
+from buddy.llm.exceptions import LLMUnavailable
+from buddy.llm.providers import RegisteredModel, get_registered_model
+from buddy.llm.schemas import ChatRoomMessage, LLMCompletion, LLMModel, LLMUsage
+from buddy.metrics import Counter
+from buddy.utils.logger_utils import get_logger
+
+if TYPE_CHECKING:
+    from buddy.auth.models import User
+    from buddy.llm.providers.provider import LLMProviderable
+
+logger = get_logger()
+
+LLM_ROUTE_ATTEMPTS = Counter(
+    "buddy_llm_route_attempts",
+    "LLM calls made by the router by result, cancelled calls lost a hedged race",
+    label_names=("provider", "model", "result"),
+)
+
+CircuitState = Literal["closed", "open", "half_open"]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. Once `reset_seconds` have
+    passed a single trial call is let through and its outcome closes or reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.__failures = 0
+        self.__opened_at: float | None = None
+        self.__trial_in_flight = False
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitState:
+        if self.__opened_at is None:
+            return "closed"
+
+        if time.monotonic() - self.__opened_at >= self.reset_seconds:
+            return "half_open"
+
+        return "open"
+
+    def allow_request(self) -> bool:
+        with self.__lock:
+            state = self.state
+            if state == "closed":
+                return True
+
+            if state == "open" or self.__trial_in_flight:
+                return False
+
+            self.__trial_in_flight = True
+
+            return True
+
+    def record_success(self) -> None:
+        with self.__lock:
+            self.__failures = 0
+            self.__opened_at = None
+            self.__trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self.__lock:
+            self.__failures += 1
+            if self.__trial_in_flight or self.__failures >= self.failure_threshold:
+                self.__opened_at = time.monotonic()
+            self.__trial_in_flight = False
+
+    def release(self) -> None:
+        """For calls that were cancelled before they had an outcome."""
+
+        with self.__lock:
+            self.__trial_in_flight = False
+
+
+class LatencyWindow:
+    def __init__(self, size: int) -> None:
+        self.__samples: deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self.__samples.append(seconds)
+
+    def percentile(self, percentile: float, min_samples: int) -> float | None:
+        samples = sorted(self.__samples)
+        if len(samples) == 0 or len(samples) < min_samples:
+            return None
+
+        return samples[math.ceil(percentile * len(samples)) - 1]
+
+
+RouteCandidate = RegisteredModel
+
+
+__circuit_breakers: dict[str, CircuitBreaker] = {}
+__latency_windows: dict[tuple[str, str], LatencyWindow] = {}
+
+
+def get_circuit_breaker(provider_name: str) -> CircuitBreaker:
+    breaker = __circuit_breakers.get(provider_name)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            failure_threshold=settings.llm_circuit_breaker_failure_threshold,
+            reset_seconds=settings.llm_circuit_breaker_reset_seconds,
+        )
+        __circuit_breakers[provider_name] = breaker
+
+    return breaker
+
+
+def get_latency_window(llm_model: LLMModel) -> LatencyWindow:
+    key = (llm_model.provider, llm_model.key)
+    window = __latency_windows.get(key)
+    if window is None:
+        window = LatencyWindow(size=settings.llm_latency_window_size)
+        __latency_windows[key] = window
+
+    return window
+
+
+def get_route(
+    user: User, llm_model: LLMModel, provider: LLMProviderable
+) -> list[RouteCandidate]:
+    """The selected model followed by its configured fallbacks the user may use."""
+
+    route = [RouteCandidate(llm_model=llm_model, provider=provider)]
+    fallbacks = settings.llm_fallbacks.get(f"{llm_model.provider}:{llm_model.key}", [])
+    for fallback in fallbacks:
+        provider_name, _, llm_key = fallback.partition(":")
+        registered_model = get_registered_model(
+            user=user, llm_key=llm_key, provider=provider_name
+        )
+        if registered_model is None or registered_model in route:
+            continue
+
+        route.append(registered_model)
+
+    return route
+
+
+async def chat_with_fallbacks(
+    route: list[RouteCandidate], messages: list[ChatRoomMessage]
+) -> LLMCompletion:
+    """
+    Tries the route in order and skips models whose provider's circuit is open. With
+    hedging enabled the next model also starts once the current one runs past its
+    p95, whichever answers first wins.
+    """
+
+    remaining = list(route)
+    pending: dict[asyncio.Task[LLMCompletion], RouteCandidate] = {}
+    last_error: BaseException | None = None
+    try:
+        while len(pending) > 0 or __start_next(remaining, messages, pending):
+            latest_candidate = next(reversed(pending.values()))
+            done, _ = await asyncio.wait(
+                pending.keys(),
+                timeout=__hedge_delay(latest_candidate, remaining),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if len(done) == 0:
+                __start_next(remaining, messages, pending)
+                continue
+
+            for task in done:
+                candidate = pending.pop(task)
+                error = task.exception()
+                if error is None:
+                    return task.result()
+
+                logger.warning(
+                    "LLM call to %s:%s failed, %r",
+                    candidate.llm_model.provider,
+                    candidate.llm_model.key,
+                    error,
+                )
+                last_error = error
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if last_error is not None:
+        raise last_error
+
+    raise LLMUnavailable
+
+
+async def stream_with_fallbacks(
+    route: list[RouteCandidate], messages: list[ChatRoomMessage]
+) -> tuple[RouteCandidate, AsyncIterator[str | LLMUsage]]:
+    """
+    Streams from the first model in the route whose provider's circuit isn't open.
+    Falling back is only possible until the first chunk arrives, after that the
+    stream's failures are recorded and raised.
+    """
+
+    last_error: BaseException | None = None
+    for candidate in route:
+        breaker = get_circuit_breaker(candidate.provider.get_name())
+        if not breaker.allow_request():
+            LLM_ROUTE_ATTEMPTS.inc(
+                provider=candidate.llm_model.provider,
+                model=candidate.llm_model.key,
+                result="circuit_open",
+            )
+            continue
+
+        stream = candidate.provider.stream_chat(
+            llm_model=candidate.llm_model, messages=messages
+        )
+        try:
+            first_chunk = await stream.__anext__()
+        except asyncio.CancelledError:
+            breaker.release()
+            LLM_ROUTE_ATTEMPTS.inc(
+                provider=candidate.llm_model.provider,
+                model=candidate.llm_model.key,
+                result="cancelled",
+            )
+            raise
+        except Exception as error:
+            breaker.record_failure()
+            LLM_ROUTE_ATTEMPTS.inc(
+                provider=candidate.llm_model.provider,
+                model=candidate.llm_model.key,
+                result="failure",
+            )
+            logger.warning(
+                "LLM stream from %s:%s failed, %r",
+                candidate.llm_model.provider,
+                candidate.llm_model.key,
+                error,
+            )
+            last_error = error
+            continue
+
+        return candidate, __routed_stream(candidate, first_chunk, stream)
+
+    if last_error is not None:
+        raise last_error
+
+    raise LLMUnavailable
+
+
+async def __routed_stream(
+    candidate: RouteCandidate,
+    first_chunk: str | LLMUsage,
+    stream: AsyncIterator[str | LLMUsage],
+) -> AsyncIterator[str | LLMUsage]:
+    breaker = get_circuit_breaker(candidate.provider.get_name())
+    try:
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        breaker.release()
+        LLM_ROUTE_ATTEMPTS.inc(
+            provider=candidate.llm_model.provider,
+            model=candidate.llm_model.key,
+            result="cancelled",
+        )
+        raise
+    except Exception:
+        breaker.record_failure()
+        LLM_ROUTE_ATTEMPTS.inc(
+            provider=candidate.llm_model.provider,
+            model=candidate.llm_model.key,
+            result="failure",
+        )
+        raise
+
+    breaker.record_success()
+    LLM_ROUTE_ATTEMPTS.inc(
+        provider=candidate.llm_model.provider,
+        model=candidate.llm_model.key,
+        result="success",
+    )
+
+
+def __start_next(
+    remaining: list[RouteCandidate],
+    messages: list[ChatRoomMessage],
+    pending: dict[asyncio.Task[LLMCompletion], RouteCandidate],
+) -> bool:
+    while len(remaining) > 0:
+        candidate = remaining.pop(0)
+        if not get_circuit_breaker(candidate.provider.get_name()).allow_request():
+            LLM_ROUTE_ATTEMPTS.inc(
+                provider=candidate.llm_model.provider,
+                model=candidate.llm_model.key,
+                result="circuit_open",
+            )
+            continue
+
+        task = asyncio.create_task(__routed_chat(candidate, messages))
+        pending[task] = candidate
+
+        return True
+
+    return False
+
+
+def __hedge_delay(
+    candidate: RouteCandidate, remaining: list[RouteCandidate]
+) -> float | None:
+    if not settings.llm_hedging_enabled or len(remaining) == 0:
+        return None
+
+    p95 = get_latency_window(candidate.llm_model).percentile(
+        0.95, min_samples=settings.llm_hedging_min_samples
+    )
+    if p95 is None:
+        return None
+
+    return max(p95, settings.llm_hedging_min_delay_seconds)
+
+
+async def __routed_chat(
+    candidate: RouteCandidate, messages: list[ChatRoomMessage]
+) -> LLMCompletion:
+    breaker = get_circuit_breaker(candidate.provider.get_name())
+    started_at = time.monotonic()
+    try:
+        completion = await candidate.provider.chat(
+            llm_model=candidate.llm_model, messages=messages
+        )
+    except asyncio.CancelledError:
+        breaker.release()
+        LLM_ROUTE_ATTEMPTS.inc(
+            provider=candidate.llm_model.provider,
+            model=candidate.llm_model.key,
+            result="cancelled",
+        )
+        raise
+    except Exception:
+        breaker.record_failure()
+        LLM_ROUTE_ATTEMPTS.inc(
+            provider=candidate.llm_model.provider,
+            model=candidate.llm_model.key,
+            result="failure",
+        )
+        raise
+
+    breaker.record_success()
+    get_latency_window(candidate.llm_model).observe(time.monotonic() - started_at)
+    LLM_ROUTE_ATTEMPTS.inc(
+        provider=candidate.llm_model.provider,
+        model=candidate.llm_model.key,
+        result="success",
+    )
+
+    return completion
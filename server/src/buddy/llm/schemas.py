@@ -4,17 +4,42 @@ from typing import Literal
 
 from pydantic import BaseModel, Field, field_validator
 
-from buddy.schemas import CreatedResponse, OKResponse
+from buddy.schemas import (
+    AcceptedResponse,
+    BuddyErrorDetail,
+    CreatedResponse,
+    OKResponse,
+)
+
+CHAT_ROOMS_DEFAULT_PAGE_SIZE = 50
+CHAT_ROOMS_MAX_PAGE_SIZE = 200
+CHAT_MESSAGES_DEFAULT_PAGE_SIZE = 50
+CHAT_MESSAGES_MAX_PAGE_SIZE = 200
+
+CONTEXT_DEFAULT_TOKEN_BUDGET = 16_000
+
+CHAT_JOB_MAX_WAIT_SECONDS = 30
 
 AssistantMessageRole = Literal["assistant"]
 MessageRoles = Literal["user"] | AssistantMessageRole
 
+# "truncate" drops the oldest messages that don't fit the budget, "summarize" replaces
+# them with a rolling summary of the room.
+ContextStrategy = Literal["truncate", "summarize"]
+
 
 class LLMModel(BaseModel):
     provider: str
     key: str
     display_name: str
     description: str
+    context_token_budget: int = Field(
+        default=CONTEXT_DEFAULT_TOKEN_BUDGET, exclude=True
+    )
+    context_strategy: ContextStrategy = Field(default="truncate", exclude=True)
+    # What the provider bills, in US dollars per million tokens.
+    prompt_usd_per_million_tokens: float = Field(default=0, exclude=True)
+    completion_usd_per_million_tokens: float = Field(default=0, exclude=True)
 
 
 class LLMMessage(BaseModel):
@@ -44,11 +69,30 @@ class ChatRoomMessage(LLMMessage):
         return LLMMessage(role=self.role, content=self.content)
 
 
+class LLMUsage(BaseModel):
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class LLMCompletion(BaseModel):
+    message: ChatRoomMessage
+    usage: LLMUsage
+
+
 class CreateChatMessageResponse(CreatedResponse, ChatRoomMessage):
     room_id: uuid.UUID
     title: str
     date: datetime
     updated_at: datetime
+    # Whether the answer was reused from an identical earlier conversation.
+    cached: bool = False
+
+
+class ChatMessageDelta(BaseModel):
+    content: str
+
+
+ChatStreamEvent = ChatMessageDelta | CreateChatMessageResponse
 
 
 class CreateChatRoomPayload(BaseModel):
@@ -67,7 +111,37 @@ class ChatRoomListItem(BaseModel):
 
 class ChatRoomListResponse(OKResponse):
     data: list[ChatRoomListItem]
+    next_cursor: str | None = Field(
+        default=None,
+        description="Cursor for the next page of chat rooms, `null` when there is none",
+    )
 
 
 class ListChatMessagesResponse(OKResponse):
     data: list[ChatRoomMessage]
+    next_cursor: int | None = Field(
+        default=None,
+        description="Cursor for the next page in the same direction, `null` when there is none",
+    )
+
+
+ChatJobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+
+class ChatJobDetails(BaseModel):
+    job_id: uuid.UUID
+    status: ChatJobStatus
+    created_at: datetime
+    finished_at: datetime | None = None
+    result: CreateChatMessageResponse | None = Field(
+        default=None, description="The saved chat message once the job succeeded"
+    )
+    error: list[BuddyErrorDetail] | None = Field(
+        default=None, description="Why the job failed"
+    )
+
+
+class ChatJobAcceptedResponse(AcceptedResponse, ChatJobDetails): ...
+
+
+class ChatJobResponse(OKResponse, ChatJobDetails): ...
@@ -0,0 +1,36 @@
+from typing import AsyncIterator
+
+from buddy.exceptions import BuddyError, BuddyInternalError
+from buddy.llm.schemas import ChatMessageDelta, ChatStreamEvent
+from buddy.schemas import ErrorResponse
+from buddy.utils.logger_utils import get_logger
+from buddy.utils.sse_utils import format_server_sent_event
+
+logger = get_logger()
+
+
+async def chat_stream_as_server_sent_events(
+    events: AsyncIterator[ChatStreamEvent],
+) -> AsyncIterator[str]:
+    """Format the chat stream events, the stream ends with a `done` or `error` event.
+
+    The response status has already been sent once streaming starts, so failures
+    are reported as an `error` event carrying the usual error response body.
+    """
+    try:
+        async for event in events:
+            if isinstance(event, ChatMessageDelta):
+                yield format_server_sent_event("delta", event)
+            else:
+                yield format_server_sent_event("done", event)
+    except BuddyError as error:
+        yield __format_error_event(error)
+    except Exception:
+        logger.exception("Chat stream failed")
+        yield __format_error_event(BuddyInternalError())
+
+
+def __format_error_event(error: BuddyError) -> str:
+    return format_server_sent_event(
+        "error", ErrorResponse.model_validate({"detail": error.detail})
+    )
@@ -0,0 +1,49 @@
+from typing import AsyncIterator
+
+import pytest
+from sqlmodel import Session
+
+from buddy.llm.models import ChatRoom
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.schemas import ChatRoomMessage, LLMCompletion, LLMUsage
+from buddy.llm.tests.utils import create_room, make_message
+
+
+@pytest.fixture(scope="function")
+def chat_room(database, default_user) -> ChatRoom:
+    with Session(database.engine) as session:
+        return create_room(session=session, owner_id=default_user.id)
+
+
+class FakeOpenAIProvider:
+    """Replaces the OpenAI calls, answering every message with `answer`."""
+
+    answer = "Hello from the fake provider!"
+
+    def __init__(self) -> None:
+        self.calls: list[list[ChatRoomMessage]] = []
+
+    async def chat(self, llm_model, messages) -> LLMCompletion:
+        self.calls.append(messages)
+
+        return LLMCompletion(
+            message=make_message(self.answer, role="assistant"),
+            usage=LLMUsage(prompt_tokens=10, completion_tokens=5),
+        )
+
+    async def stream_chat(self, llm_model, messages) -> AsyncIterator[str | LLMUsage]:
+        self.calls.append(messages)
+        for word in self.answer.split(" "):
+            yield f"{word} "
+
+        yield LLMUsage(prompt_tokens=10, completion_tokens=5)
+
+
+@pytest.fixture(scope="function")
+def fake_openai(monkeypatch) -> FakeOpenAIProvider:
+    fake = FakeOpenAIProvider()
+    provider = PROVIDERS["openai"]
+    monkeypatch.setattr(provider, "chat", fake.chat)
+    monkeypatch.setattr(provider, "stream_chat", fake.stream_chat)
+
+    return fake
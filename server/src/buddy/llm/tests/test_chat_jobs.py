@@ -0,0 +1,183 @@
+import asyncio
+import uuid
+from datetime import timedelta
+from http import HTTPStatus
+
+from sqlmodel import Session, update
+
+from buddy.conf import settings
+from buddy.llm.jobs import ChatJobWorker
+from buddy.llm.models import ChatJob
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.tests.utils import authorization, chat_payload
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+ASYNC_HEADERS = {"prefer": "respond-async"}
+
+
+def enqueue(client, login, message: str, **headers):
+    return client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload(message),
+        headers={**authorization(login), **ASYNC_HEADERS, **headers},
+    )
+
+
+def get_job(client, login, job_id: str, wait=0):
+    return client.get(
+        f"/app-api/v1/llm/jobs/{job_id}",
+        params={"wait": wait},
+        headers=authorization(login),
+    )
+
+
+def test_enqueued_chat_message_is_answered_by_a_worker(
+    client, database, default_user_login, fake_openai
+):
+    response = enqueue(client, default_user_login, f"Take your time {uuid.uuid4()}")
+
+    assert response.status_code == HTTPStatus.ACCEPTED
+    assert response.json()["status"] == "queued"
+    assert len(fake_openai.calls) == 0
+
+    job_id = response.json()["job_id"]
+    assert get_job(client, default_user_login, job_id).json()["status"] == "queued"
+
+    assert asyncio.run(ChatJobWorker(database=database).run_once()) >= 1
+
+    job_response = get_job(client, default_user_login, job_id, wait=1)
+    job = job_response.json()
+    assert job_response.status_code == HTTPStatus.OK
+    assert job["status"] == "succeeded"
+    assert job["result"]["content"] == fake_openai.answer
+    assert job["error"] is None
+
+    messages_response = client.get(
+        f"/app-api/v1/llm/chats/{job['result']['room_id']}",
+        headers=authorization(default_user_login),
+    )
+    assert len(messages_response.json()["data"]) == 2
+
+
+def test_enqueueing_with_an_idempotency_key_enqueues_once(
+    client, default_user_login, fake_openai
+):
+    idempotency_key = str(uuid.uuid4())
+    message = f"Only once {uuid.uuid4()}"
+
+    job_ids = list(
+        map(
+            lambda _: enqueue(
+                client,
+                default_user_login,
+                message,
+                **{"idempotency-key": idempotency_key},
+            ).json()["job_id"],
+            range(2),
+        )
+    )
+    reused_response = enqueue(
+        client,
+        default_user_login,
+        "Something else",
+        **{"idempotency-key": idempotency_key},
+    )
+
+    assert job_ids[0] == job_ids[1]
+    assert reused_response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_workers_respect_provider_concurrency_limits(
+    client, database, default_user_login, fake_openai, monkeypatch
+):
+    monkeypatch.setattr(settings, "chat_jobs_provider_concurrency", {"openai": 0})
+    job_id = enqueue(client, default_user_login, f"Later {uuid.uuid4()}").json()[
+        "job_id"
+    ]
+
+    asyncio.run(ChatJobWorker(database=database).run_once())
+
+    assert get_job(client, default_user_login, job_id).json()["status"] == "queued"
+    assert len(fake_openai.calls) == 0
+
+    monkeypatch.setattr(settings, "chat_jobs_provider_concurrency", {"openai": 1})
+    asyncio.run(ChatJobWorker(database=database).run_once())
+
+    assert get_job(client, default_user_login, job_id).json()["status"] == "succeeded"
+
+
+def test_other_users_jobs_are_not_found(client, default_user_login):
+    response = get_job(client, default_user_login, str(uuid.uuid4()))
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+
+
+def calls_asking(fake_openai, message: str) -> int:
+    return len(
+        list(filter(lambda call: call[-1].content == message, fake_openai.calls))
+    )
+
+
+def test_jobs_taken_over_after_a_crash_replay_the_turn(
+    client, database, default_user_login, fake_openai
+):
+    message = f"Only answered once {uuid.uuid4()}"
+    job_id = enqueue(client, default_user_login, message).json()["job_id"]
+    asyncio.run(ChatJobWorker(database=database).run_once())
+    job = get_job(client, default_user_login, job_id).json()
+
+    # As if the worker crashed after answering, before finishing the job.
+    with Session(database.engine) as session:
+        session.exec(
+            update(ChatJob)  # type: ignore
+            .where(ChatJob.id == uuid.UUID(job_id))
+            .values(
+                status="running",
+                locked_until=datetime_now_with_timezone() - timedelta(seconds=1),
+            )
+        )
+        session.commit()
+    asyncio.run(ChatJobWorker(database=database).run_once())
+
+    replayed_job = get_job(client, default_user_login, job_id).json()
+    assert replayed_job["status"] == "succeeded"
+    assert replayed_job["result"] == job["result"]
+    assert calls_asking(fake_openai, message) == 1
+
+    messages_response = client.get(
+        f"/app-api/v1/llm/chats/{job['result']['room_id']}",
+        headers=authorization(default_user_login),
+    )
+    assert len(messages_response.json()["data"]) == 2
+
+
+def test_running_jobs_keep_their_lease(
+    client, database, default_user_login, fake_openai, monkeypatch
+):
+    monkeypatch.setattr(settings, "chat_jobs_lease_seconds", 0.3)
+    chat = fake_openai.chat
+
+    async def slow_chat(llm_model, messages):
+        await asyncio.sleep(1)
+
+        return await chat(llm_model=llm_model, messages=messages)
+
+    monkeypatch.setattr(PROVIDERS["openai"], "chat", slow_chat)
+    message = f"Take longer than a lease {uuid.uuid4()}"
+    job_id = enqueue(client, default_user_login, message).json()["job_id"]
+
+    async def run_two_workers():
+        first = asyncio.create_task(ChatJobWorker(database=database).run_once())
+        await asyncio.sleep(0.6)
+        await ChatJobWorker(database=database).run_once()
+        await first
+
+    asyncio.run(run_two_workers())
+
+    assert get_job(client, default_user_login, job_id).json()["status"] == "succeeded"
+    assert calls_asking(fake_openai, message) == 1
+    with Session(database.engine) as session:
+        job = session.get(ChatJob, uuid.UUID(job_id))
+
+        assert job is not None
+        assert job.attempts == 1
@@ -0,0 +1,114 @@
+import pytest
+from sqlalchemy import text
+from sqlmodel import Session, delete
+
+from buddy.database import run_migrations
+from buddy.exceptions import BuddyNotFoundError
+from buddy.llm.models import ChatMessage, ChatRoom
+from buddy.llm.tests.utils import create_room, make_message
+
+
+def test_create_stores_messages_in_sequence(database, default_user):
+    with Session(database.engine) as session:
+        room = create_room(session=session, owner_id=default_user.id)
+
+        messages = room.validated_messages(session=session)
+
+        assert list(map(lambda message: message.content, messages)) == [
+            "Hello?",
+            "Hi!",
+        ]
+        assert list(
+            map(
+                lambda message: message.sequence,
+                ChatMessage.list_for_room(room_id=room.id, session=session),
+            )
+        ) == [0, 1]
+
+
+def test_add_messages_appends_rows(database, default_user):
+    with Session(database.engine) as session:
+        room = create_room(session=session, owner_id=default_user.id)
+        created_updated_at = room.updated_at
+
+        room = room.add_messages(
+            messages=[
+                make_message("How are you?", offset_seconds=2),
+                make_message("Good!", role="assistant", offset_seconds=3),
+            ],
+            session=session,
+        )
+
+        assert room.updated_at > created_updated_at
+        assert list(
+            map(
+                lambda message: (message.sequence, message.content),
+                ChatMessage.list_for_room(room_id=room.id, session=session),
+            )
+        ) == [(0, "Hello?"), (1, "Hi!"), (2, "How are you?"), (3, "Good!")]
+        assert room.messages_count == 4
+
+
+def test_add_messages_to_a_deleted_room_fails(database, default_user):
+    with Session(database.engine) as session:
+        room = create_room(session=session, owner_id=default_user.id)
+        session.exec(delete(ChatRoom).where(ChatRoom.id == room.id))  # type: ignore
+        session.commit()
+
+        with pytest.raises(BuddyNotFoundError):
+            room.add_messages(messages=[make_message("Anyone?")], session=session)
+
+
+def test_legacy_messages_get_migrated(database, default_user):
+    with Session(database.engine) as session:
+        room = ChatRoom(title="Legacy", owner_id=default_user.id)
+        session.add(room)
+        session.commit()
+        room_id = room.id
+
+    question = make_message("Legacy question")
+    answer = make_message("Legacy answer", role="assistant", offset_seconds=1)
+    with database.engine.begin() as connection:
+        connection.execute(text("ALTER TABLE chat_room ADD COLUMN messages json[]"))
+        connection.execute(
+            text(
+                "UPDATE chat_room SET messages = ARRAY[CAST(:answer AS json), CAST(:question AS json)] WHERE id = :id"
+            ),
+            {
+                "answer": answer.model_dump_json(),
+                "question": question.model_dump_json(),
+                "id": room_id,
+            },
+        )
+
+    run_migrations(database)
+
+    with Session(database.engine) as session:
+        room = ChatRoom.get_by_id(id=room_id, owner_id=default_user.id, session=session)
+
+        assert room is not None
+        assert room.validated_messages(session=session) == [question, answer]
+
+    with database.engine.connect() as connection:
+        columns = connection.execute(
+            text(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = 'chat_room'"
+            )
+        ).scalars()
+
+        assert "messages" not in list(columns)
+
+
+def test_messages_count_gets_backfilled(database, chat_room):
+    with database.engine.begin() as connection:
+        connection.execute(text("ALTER TABLE chat_room DROP COLUMN messages_count"))
+
+    run_migrations(database)
+
+    with Session(database.engine) as session:
+        room = ChatRoom.get_by_id(
+            id=chat_room.id, owner_id=chat_room.owner_id, session=session
+        )
+
+        assert room is not None
+        assert room.messages_count == 2
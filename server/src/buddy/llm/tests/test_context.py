@@ -0,0 +1,147 @@
+import asyncio
+from http import HTTPStatus
+
+from sqlmodel import Session, select
+
+from buddy.database import create_async_session
+from buddy.llm import controller
+from buddy.llm.context import SUMMARY_PREFIX, assemble_context
+from buddy.llm.controller import load_recent_history
+from buddy.llm.models import ChatRoom, UsageLedgerEntry
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.tests.utils import authorization, chat_payload, make_message
+from buddy.llm.tokenizers import estimate_conversation_tokens
+from buddy.llm.usage import get_usage_ledger
+
+
+def get_openai_model(key: str):
+    return next(
+        filter(lambda model: model.key == key, PROVIDERS["openai"].get_all_models())
+    )
+
+
+def test_assemble_context_keeps_most_recent_messages():
+    history = list(map(lambda index: make_message(f"Message {index}"), range(5)))
+    question = make_message("Question")
+    # Exactly what the conversation takes, the reply is only primed once.
+    llm_model = get_openai_model("gpt-4o-mini").model_copy(
+        update={
+            "context_token_budget": estimate_conversation_tokens(
+                [*history[-2:], question]
+            )
+        }
+    )
+
+    context = assemble_context(
+        provider=PROVIDERS["openai"],
+        llm_model=llm_model,
+        history=history,
+        history_start_sequence=10,
+        question=question,
+        summary="Ignored when truncating",
+    )
+
+    assert context.messages == [*history[-2:], question]
+    assert context.unsummarized == history[:3]
+    assert context.first_sequence == 13
+
+
+def test_rolling_summary(
+    client, database, default_user_login, fake_openai, chat_room, monkeypatch
+):
+    question = make_message("What now?")
+    llm_model = get_openai_model("gpt-4o-mini")
+    monkeypatch.setattr(llm_model, "context_strategy", "summarize")
+    # Fits the question and the latest message, but not the first one.
+    monkeypatch.setattr(
+        llm_model,
+        "context_token_budget",
+        estimate_conversation_tokens([make_message("Hi!", role="assistant"), question]),
+    )
+
+    response = client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload(question.content, room_id=str(chat_room.id)),
+        headers=authorization(default_user_login),
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    turn_messages, summary_messages = fake_openai.calls
+    assert list(map(lambda message: message.content, turn_messages)) == [
+        "Hi!",
+        "What now?",
+    ]
+    assert "user: Hello?" in summary_messages[0].content
+
+    with Session(database.engine) as session:
+        room = ChatRoom.get_by_id(
+            id=chat_room.id, owner_id=chat_room.owner_id, session=session
+        )
+
+        assert room is not None
+        assert room.summary == fake_openai.answer
+        assert room.summary_sequence == 1
+
+    get_usage_ledger(database).flush()
+    with Session(database.engine) as session:
+        entries = session.exec(
+            select(UsageLedgerEntry).where(UsageLedgerEntry.room_id == chat_room.id)
+        ).all()
+
+        # The turn and its summary.
+        assert len(entries) == 2
+
+    monkeypatch.setattr(llm_model, "context_token_budget", 1000)
+    response = client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload("And then?", room_id=str(chat_room.id)),
+        headers=authorization(default_user_login),
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert len(fake_openai.calls) == 3
+    assert list(map(lambda message: message.content, fake_openai.calls[-1])) == [
+        f"{SUMMARY_PREFIX}\n{fake_openai.answer}",
+        "Hi!",
+        "What now?",
+        fake_openai.answer,
+        "And then?",
+    ]
+
+
+def test_load_recent_history_reads_pages_until_the_budget_is_used(
+    database, chat_room, monkeypatch
+):
+    with Session(database.engine) as session:
+        room = chat_room.add_messages(
+            messages=list(map(lambda index: make_message(f"More {index}"), range(6))),
+            session=session,
+        )
+    llm_model = get_openai_model("gpt-4o-mini").model_copy(
+        update={"context_token_budget": 1}
+    )
+    monkeypatch.setattr(controller, "CHAT_HISTORY_PAGE_SIZE", 3)
+
+    async def load():
+        async with create_async_session(database) as session:
+            return await load_recent_history(
+                room=room,
+                provider=PROVIDERS["openai"],
+                llm_model=llm_model,
+                session=session,
+            )
+
+    history, start_sequence = asyncio.run(load())
+
+    assert list(map(lambda message: message.content, history)) == [
+        "More 3",
+        "More 4",
+        "More 5",
+    ]
+    assert start_sequence == 5
+
+    llm_model.context_token_budget = 1000
+    history, start_sequence = asyncio.run(load())
+
+    assert len(history) == 8
+    assert start_sequence == 0
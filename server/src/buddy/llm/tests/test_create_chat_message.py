@@ -0,0 +1,148 @@
+import asyncio
+from http import HTTPStatus
+
+from fastapi import BackgroundTasks
+from sqlmodel import Session
+
+from buddy.llm.controller import LLMController
+from buddy.llm.models import ChatMessage, ChatRoom
+from buddy.llm.schemas import CreateChatMessagePayload
+from buddy.llm.tests.utils import (
+    authorization,
+    chat_payload,
+    parse_server_sent_events,
+)
+
+
+def test_create_chat_message(client, database, default_user_login, fake_openai):
+    response = client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload("Hello?"),
+        headers=authorization(default_user_login),
+    )
+    json_response = response.json()
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert json_response["content"] == fake_openai.answer
+    assert json_response["title"] == "Hello?"
+
+    response = client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload("And now?", room_id=json_response["room_id"]),
+        headers=authorization(default_user_login),
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert list(map(lambda message: message.content, fake_openai.calls[-1])) == [
+        "Hello?",
+        fake_openai.answer,
+        "And now?",
+    ]
+
+
+def test_stream_chat_message(client, database, default_user_login, fake_openai):
+    with client.stream(
+        "POST",
+        "/app-api/v1/llm/chats/stream",
+        json=chat_payload("Stream please"),
+        headers=authorization(default_user_login),
+    ) as response:
+        assert response.status_code == HTTPStatus.OK
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_server_sent_events(response.read().decode())
+
+    deltas = list(filter(lambda event: event[0] == "delta", events))
+    assert "".join(map(lambda event: event[1]["content"], deltas)).strip() == (
+        fake_openai.answer
+    )
+
+    done_event, done_data = events[-1]
+    assert done_event == "done"
+    assert done_data["content"].strip() == fake_openai.answer
+
+    with Session(database.engine) as session:
+        messages = ChatMessage.list_for_room(
+            room_id=done_data["room_id"], session=session
+        )
+
+        assert list(map(lambda message: message.content.strip(), messages)) == [
+            "Stream please",
+            fake_openai.answer,
+        ]
+
+
+def test_stream_chat_message_not_allowed(client, default_user_login, fake_openai):
+    response = client.post(
+        "/app-api/v1/llm/chats/stream",
+        json=chat_payload("Stream please", llm_key="gpt-9000"),
+        headers=authorization(default_user_login),
+    )
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_chat_turns_take_one_write_statement(
+    client, default_user_login, fake_openai, query_budget
+):
+    def is_write(statement: str) -> bool:
+        return not statement.lstrip().upper().startswith("SELECT")
+
+    # Loads the user into the cache, so it isn't counted below.
+    client.get("/app-api/v1/llm/chats", headers=authorization(default_user_login))
+
+    with query_budget(1) as new_room_statements:
+        response = client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload("Counting"),
+            headers=authorization(default_user_login),
+        )
+    with query_budget(3) as existing_room_statements:
+        client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload("Still counting", room_id=response.json()["room_id"]),
+            headers=authorization(default_user_login),
+        )
+
+    assert len(new_room_statements) == 1
+    assert len(list(filter(is_write, new_room_statements))) == 1
+    # The room and its messages are read before the one write.
+    assert len(existing_room_statements) == 3
+    assert len(list(filter(is_write, existing_room_statements))) == 1
+
+
+def test_concurrent_turns_on_one_room_are_all_kept(
+    database, default_user, chat_room, fake_openai
+):
+    controller = LLMController(
+        database=database, user=default_user, background_tasks=BackgroundTasks()
+    )
+    questions = list(map(lambda index: f"Parallel question {index}", range(8)))
+
+    async def send_all():
+        return await asyncio.gather(
+            *map(
+                lambda question: controller.create_chat_message(
+                    CreateChatMessagePayload.model_validate(
+                        chat_payload(question, room_id=str(chat_room.id))
+                    )
+                ),
+                questions,
+            )
+        )
+
+    asyncio.run(send_all())
+
+    with Session(database.engine) as session:
+        messages = ChatMessage.list_for_room(room_id=chat_room.id, session=session)
+        room = ChatRoom.get_by_id(
+            id=chat_room.id, owner_id=default_user.id, session=session
+        )
+
+    turns = list(zip(messages[2::2], messages[3::2]))
+    assert room is not None
+    assert room.messages_count == 2 + 2 * len(questions)
+    assert list(map(lambda message: message.sequence, messages)) == list(
+        range(room.messages_count)
+    )
+    assert sorted(map(lambda turn: turn[0].content, turns)) == sorted(questions)
+    assert all(map(lambda turn: turn[1].content == fake_openai.answer, turns))
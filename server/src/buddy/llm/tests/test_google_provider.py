@@ -0,0 +1,209 @@
+import asyncio
+import json
+from http import HTTPStatus
+from types import SimpleNamespace
+
+import httpx
+
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.providers.http_client import PooledGoogleClient
+from buddy.llm.providers.provider import LLM_PROVIDER_LATENCY, LLM_TOKENS
+from buddy.llm.schemas import LLMUsage
+from buddy.llm.tests.utils import make_message
+
+
+class FakeGoogleModels:
+    def __init__(self) -> None:
+        self.count_tokens_calls = 0
+
+    async def count_tokens(self, model, contents):
+        self.count_tokens_calls += 1
+
+        return SimpleNamespace(total_tokens=42)
+
+    async def generate_content(self, model, contents):
+        return SimpleNamespace(
+            text="Hello from Gemini!",
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=12, candidates_token_count=4
+            ),
+        )
+
+
+def test_chat_uses_response_usage_without_counting_tokens(monkeypatch):
+    provider = PROVIDERS["google"]
+    models = FakeGoogleModels()
+    monkeypatch.setattr(
+        provider, "client", SimpleNamespace(aio=SimpleNamespace(models=models))
+    )
+    llm_model = provider.get_all_models()[0]
+    prompt_tokens = LLM_TOKENS.value(
+        provider="google", model=llm_model.key, kind="prompt"
+    )
+
+    completion = asyncio.run(
+        provider.chat(llm_model=llm_model, messages=[make_message("Hello?")])
+    )
+
+    assert completion.message.content == "Hello from Gemini!"
+    assert completion.usage.prompt_tokens == 12
+    assert completion.usage.completion_tokens == 4
+    assert models.count_tokens_calls == 0
+    assert (
+        LLM_TOKENS.value(provider="google", model=llm_model.key, kind="prompt")
+        == prompt_tokens + 12
+    )
+
+    assert (
+        asyncio.run(
+            provider.count_tokens_exactly(
+                llm_model=llm_model, messages=[make_message("Hello?")]
+            )
+        )
+        == 42
+    )
+    assert models.count_tokens_calls == 1
+
+
+def test_pooled_client_sends_requests_through_shared_http_client():
+    requests: list[httpx.Request] = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+
+        return httpx.Response(
+            HTTPStatus.OK,
+            json={
+                "candidates": [
+                    {"content": {"role": "model", "parts": [{"text": "Pooled!"}]}}
+                ],
+                "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 1},
+            },
+        )
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+    client = PooledGoogleClient(api_key="unused", http_client=http_client)
+    latency_samples = LLM_PROVIDER_LATENCY.count(
+        provider="google", model="gemini-2.0-flash", call="chat"
+    )
+    provider = PROVIDERS["google"]
+    llm_model = next(
+        filter(lambda model: model.key == "gemini-2.0-flash", provider.get_all_models())
+    )
+
+    async def chat_twice():
+        for _ in range(2):
+            await provider.chat(llm_model=llm_model, messages=[make_message("Hi")])
+
+    original_client = provider.client
+    provider.client = client
+    try:
+        asyncio.run(chat_twice())
+    finally:
+        provider.client = original_client
+
+    assert len(requests) == 2
+    assert requests[0].url.path.endswith("/models/gemini-2.0-flash:generateContent")
+    assert requests[0].headers["x-goog-api-key"] == "unused"
+    assert (
+        LLM_PROVIDER_LATENCY.count(
+            provider="google", model="gemini-2.0-flash", call="chat"
+        )
+        == latency_samples + 2
+    )
+
+
+def test_stream_chat_reports_the_usage_of_the_last_chunk(monkeypatch):
+    chunks = [
+        {"candidates": [{"content": {"role": "model", "parts": [{"text": "Str"}]}}]},
+        {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": "eam"}]}}],
+            "usageMetadata": {"promptTokenCount": 7, "candidatesTokenCount": 2},
+        },
+    ]
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            HTTPStatus.OK,
+            content="".join(
+                map(lambda chunk: f"data: {json.dumps(chunk)}\n\n", chunks)
+            ),
+            headers={"content-type": "text/event-stream"},
+        )
+
+    provider = PROVIDERS["google"]
+    monkeypatch.setattr(
+        provider,
+        "client",
+        PooledGoogleClient(
+            api_key="unused",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle)),
+        ),
+    )
+    llm_model = provider.get_all_models()[0]
+    completion_tokens = LLM_TOKENS.value(
+        provider="google", model=llm_model.key, kind="completion"
+    )
+
+    async def stream():
+        return [
+            delta
+            async for delta in provider.stream_chat(
+                llm_model=llm_model, messages=[make_message("Hi")]
+            )
+        ]
+
+    assert asyncio.run(stream()) == [
+        "Str",
+        "eam",
+        LLMUsage(prompt_tokens=7, completion_tokens=2),
+    ]
+    assert (
+        LLM_TOKENS.value(provider="google", model=llm_model.key, kind="completion")
+        == completion_tokens + 2
+    )
+
+
+def test_abandoned_streams_release_their_connection(monkeypatch):
+    responses: list[httpx.Response] = []
+    chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": "On"}]}}]}
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        async def body():
+            for _ in range(3):
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+
+        return httpx.Response(
+            HTTPStatus.OK, content=body(), headers={"content-type": "text/event-stream"}
+        )
+
+    async def collect(response: httpx.Response) -> None:
+        responses.append(response)
+
+    provider = PROVIDERS["google"]
+    monkeypatch.setattr(
+        provider,
+        "client",
+        PooledGoogleClient(
+            api_key="unused",
+            http_client=httpx.AsyncClient(
+                transport=httpx.MockTransport(handle),
+                event_hooks={"response": [collect]},
+            ),
+        ),
+    )
+
+    async def abandon_stream():
+        stream = provider.stream_chat(
+            llm_model=provider.get_all_models()[0], messages=[make_message("Hi")]
+        )
+        assert await stream.__anext__() == "On"
+        assert not responses[0].is_closed
+
+        await stream.aclose()
+        # The generators google-genai wraps the stream in get closed by the loop.
+        await asyncio.sleep(0.01)
+
+    asyncio.run(abandon_stream())
+
+    assert responses[0].is_closed
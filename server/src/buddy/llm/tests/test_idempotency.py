@@ -0,0 +1,110 @@
+import asyncio
+import uuid
+from http import HTTPStatus
+
+import pytest
+
+from buddy.llm.exceptions import IdempotencyKeyReused
+from buddy.llm.idempotency import (
+    InMemoryIdempotencyStore,
+    PostgresIdempotencyStore,
+    run_idempotently,
+)
+from buddy.llm.schemas import LLMUsage
+from buddy.llm.tests.utils import authorization, chat_payload
+
+
+def make_store(backend: str, database):
+    if backend == "postgres":
+        return PostgresIdempotencyStore(database=database)
+
+    return InMemoryIdempotencyStore(max_size=10)
+
+
+def test_retried_chat_message_is_answered_once(client, default_user_login, fake_openai):
+    headers = {**authorization(default_user_login), "idempotency-key": "retry-1"}
+    payload = chat_payload(f"Are you there? {uuid.uuid4()}")
+
+    responses = list(
+        map(
+            lambda _: client.post(
+                "/app-api/v1/llm/chats", json=payload, headers=headers
+            ),
+            range(2),
+        )
+    )
+    reused_response = client.post(
+        "/app-api/v1/llm/chats", json=chat_payload("Something else"), headers=headers
+    )
+
+    assert list(map(lambda response: response.status_code, responses)) == [
+        HTTPStatus.CREATED,
+        HTTPStatus.CREATED,
+    ]
+    assert responses[0].json() == responses[1].json()
+    assert len(fake_openai.calls) == 1
+    assert reused_response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize("backend", ["memory", "postgres"])
+def test_concurrent_duplicates_wait_for_the_first_call(database, default_user, backend):
+    store = make_store(backend, database)
+    key = str(uuid.uuid4())
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.3)
+
+        return LLMUsage(prompt_tokens=calls, completion_tokens=0)
+
+    async def run_duplicates():
+        return await asyncio.gather(
+            *map(
+                lambda _: run_idempotently(
+                    store=store,
+                    owner_id=default_user.id,
+                    key=key,
+                    payload=LLMUsage(prompt_tokens=0, completion_tokens=0),
+                    response_type=LLMUsage,
+                    call=call,
+                ),
+                range(3),
+            )
+        )
+
+    responses = asyncio.run(run_duplicates())
+
+    assert calls == 1
+    assert responses == [LLMUsage(prompt_tokens=1, completion_tokens=0)] * 3
+
+
+@pytest.mark.parametrize("backend", ["memory", "postgres"])
+def test_failed_calls_release_their_key(database, default_user, backend):
+    store = make_store(backend, database)
+    key = str(uuid.uuid4())
+    payload = LLMUsage(prompt_tokens=0, completion_tokens=0)
+
+    async def failing_call():
+        raise RuntimeError("Provider is down")
+
+    async def call():
+        return payload
+
+    async def run(call, payload=payload):
+        return await run_idempotently(
+            store=store,
+            owner_id=default_user.id,
+            key=key,
+            payload=payload,
+            response_type=LLMUsage,
+            call=call,
+        )
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run(failing_call))
+
+    assert asyncio.run(run(call)) == payload
+    with pytest.raises(IdempotencyKeyReused):
+        asyncio.run(run(call, payload=LLMUsage(prompt_tokens=1, completion_tokens=1)))
@@ -0,0 +1,99 @@
+import uuid
+from http import HTTPStatus
+
+import pytest
+from sqlmodel import Session
+
+from buddy.llm.tests.utils import make_message
+
+
+@pytest.fixture(scope="function")
+def long_chat_room(database, chat_room):
+    with Session(database.engine) as session:
+        chat_room.add_messages(
+            messages=[
+                make_message("Question 2", offset_seconds=2),
+                make_message("Answer 2", role="assistant", offset_seconds=3),
+                make_message("Question 3", offset_seconds=4),
+            ],
+            session=session,
+        )
+
+    return chat_room
+
+
+def list_chat_messages(client, login, room_id, **params):
+    return client.get(
+        f"/app-api/v1/llm/chats/{room_id}",
+        params=params,
+        headers={"authorization": f"Bearer {login.access_token}"},
+    )
+
+
+def contents(response) -> list[str]:
+    return list(map(lambda message: message["content"], response.json()["data"]))
+
+
+def test_newest_messages_first_page(client, default_user_login, long_chat_room):
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, limit=2
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert contents(response) == ["Answer 2", "Question 3"]
+    assert response.json()["next_cursor"] == 3
+
+
+def test_paging_through_older_messages(client, default_user_login, long_chat_room):
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, limit=2, before=3
+    )
+
+    assert contents(response) == ["Hi!", "Question 2"]
+    assert response.json()["next_cursor"] == 1
+
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, limit=2, before=1
+    )
+
+    assert contents(response) == ["Hello?"]
+    assert response.json()["next_cursor"] is None
+
+
+def test_paging_through_newer_messages(client, default_user_login, long_chat_room):
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, limit=2, after=0
+    )
+
+    assert contents(response) == ["Hi!", "Question 2"]
+    assert response.json()["next_cursor"] == 2
+
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, limit=2, after=2
+    )
+
+    assert contents(response) == ["Answer 2", "Question 3"]
+    assert response.json()["next_cursor"] is None
+
+
+def test_both_cursors(client, default_user_login, long_chat_room):
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, before=3, after=1
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@pytest.mark.parametrize("limit", [0, 201])
+def test_invalid_limit(client, default_user_login, long_chat_room, limit):
+    response = list_chat_messages(
+        client, default_user_login, long_chat_room.id, limit=limit
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_room_not_found(client, default_user_login):
+    response = list_chat_messages(client, default_user_login, uuid.uuid4())
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
@@ -0,0 +1,47 @@
+from http import HTTPStatus
+
+from sqlmodel import Session
+
+from buddy.llm.tests.utils import create_room
+
+
+def list_chat_rooms(client, login, **params):
+    return client.get(
+        "/app-api/v1/llm/chats",
+        params=params,
+        headers={"authorization": f"Bearer {login.access_token}"},
+    )
+
+
+def test_list_chat_rooms_pages(client, database, default_user, default_user_login):
+    with Session(database.engine) as session:
+        rooms = list(
+            map(
+                lambda _: create_room(session=session, owner_id=default_user.id),
+                range(3),
+            )
+        )
+        room_ids = list(map(lambda room: str(room.id), reversed(rooms)))
+
+    response = list_chat_rooms(client, default_user_login, limit=2)
+    json_response = response.json()
+
+    assert response.status_code == HTTPStatus.OK
+    assert (
+        list(map(lambda room: room["room_id"], json_response["data"])) == (room_ids[:2])
+    )
+    assert json_response["data"][0]["messages_count"] == 2
+    assert json_response["next_cursor"] is not None
+
+    response = list_chat_rooms(
+        client, default_user_login, limit=2, cursor=json_response["next_cursor"]
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["data"][0]["room_id"] == room_ids[2]
+
+
+def test_invalid_cursor(client, default_user_login):
+    response = list_chat_rooms(client, default_user_login, cursor="not-a-cursor")
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
@@ -0,0 +1,134 @@
+import asyncio
+import json
+from http import HTTPStatus
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from buddy.llm.providers import (
+    AVAILABLE_MODELS_BY_TIER,
+    PROVIDERS,
+    get_model_list_available_to_user,
+    get_registered_model,
+)
+from buddy.llm.providers.provider import (
+    LLM_PROVIDER_ERRORS,
+    LLM_TIME_TO_FIRST_TOKEN,
+    LLM_TOKENS,
+    observe_latency,
+)
+from buddy.llm.schemas import LLMUsage
+from buddy.llm.tests.utils import make_message
+from buddy.money.tiers import UserTiers
+
+OPENAI_CHUNK = {
+    "id": "chunk",
+    "object": "chat.completion.chunk",
+    "created": 0,
+    "model": "gpt-4o-mini",
+}
+
+
+def test_registered_models_are_looked_up_by_tier_provider_and_key(default_user):
+    registered_model = get_registered_model(
+        user=default_user, llm_key="gemini-2.0-flash", provider="google"
+    )
+
+    assert registered_model is not None
+    assert registered_model.provider is PROVIDERS["google"]
+    assert registered_model.llm_model.key == "gemini-2.0-flash"
+    assert (
+        get_registered_model(
+            user=default_user, llm_key="gemini-2.0-flash", provider="openai"
+        )
+        is None
+    )
+    assert (
+        get_registered_model(user=default_user, llm_key="unknown", provider="google")
+        is None
+    )
+
+
+def test_available_models_are_computed_once_per_tier(default_user):
+    available_models = get_model_list_available_to_user(default_user)
+
+    assert available_models is AVAILABLE_MODELS_BY_TIER[UserTiers.FREE]
+    assert available_models is get_model_list_available_to_user(default_user)
+    assert list(map(lambda model: model.provider, available_models)) == [
+        "google",
+        "google",
+        "openai",
+        "openai",
+        "openai",
+    ]
+
+
+def test_provider_calls_observe_the_first_token_and_errors():
+    llm_model = PROVIDERS["openai"].get_all_models()[0]
+    labels = {"provider": llm_model.provider, "model": llm_model.key}
+    first_tokens = LLM_TIME_TO_FIRST_TOKEN.count(**labels)
+    errors = LLM_PROVIDER_ERRORS.value(**labels, call="stream_chat")
+
+    with pytest.raises(ValueError):
+        with observe_latency(llm_model, call="stream_chat") as observation:
+            observation.first_token()
+            observation.first_token()
+            raise ValueError
+
+    assert LLM_TIME_TO_FIRST_TOKEN.count(**labels) == first_tokens + 1
+    assert LLM_PROVIDER_ERRORS.value(**labels, call="stream_chat") == errors + 1
+
+
+def test_openai_stream_chat_reports_the_usage(monkeypatch):
+    requests: list[httpx.Request] = []
+    chunks = [
+        {"choices": [{"index": 0, "delta": {"content": "Str"}}]},
+        {"choices": [{"index": 0, "delta": {"content": "eam"}}]},
+        {"choices": [], "usage": {"prompt_tokens": 7, "completion_tokens": 2}},
+    ]
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        events = map(
+            lambda chunk: f"data: {json.dumps({**OPENAI_CHUNK, **chunk})}\n\n", chunks
+        )
+
+        return httpx.Response(
+            HTTPStatus.OK,
+            content="".join(events) + "data: [DONE]\n\n",
+            headers={"content-type": "text/event-stream"},
+        )
+
+    provider = PROVIDERS["openai"]
+    monkeypatch.setattr(
+        provider,
+        "client",
+        AsyncOpenAI(
+            api_key="unused",
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handle)),
+        ),
+    )
+    llm_model = provider.get_all_models()[0]
+    prompt_tokens = LLM_TOKENS.value(
+        provider="openai", model=llm_model.key, kind="prompt"
+    )
+
+    async def stream():
+        return [
+            delta
+            async for delta in provider.stream_chat(
+                llm_model=llm_model, messages=[make_message("Hi")]
+            )
+        ]
+
+    assert asyncio.run(stream()) == [
+        "Str",
+        "eam",
+        LLMUsage(prompt_tokens=7, completion_tokens=2),
+    ]
+    assert json.loads(requests[0].content)["stream_options"] == {"include_usage": True}
+    assert (
+        LLM_TOKENS.value(provider="openai", model=llm_model.key, kind="prompt")
+        == prompt_tokens + 7
+    )
@@ -0,0 +1,67 @@
+from http import HTTPStatus
+
+from buddy.llm.tests.utils import authorization, chat_payload
+
+# Every budget leaves room for loading the user when it isn't cached yet.
+
+
+def test_list_chat_rooms_query_budget(client, default_user_login, query_budget):
+    with query_budget(2):
+        response = client.get(
+            "/app-api/v1/llm/chats", headers=authorization(default_user_login)
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_list_chat_messages_query_budget(
+    client, default_user_login, chat_room, query_budget
+):
+    with query_budget(3):
+        response = client.get(
+            f"/app-api/v1/llm/chats/{chat_room.id}",
+            headers=authorization(default_user_login),
+        )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_create_chat_message_query_budget(
+    client, default_user_login, chat_room, fake_openai, query_budget
+):
+    with query_budget(2):
+        response = client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload("New room"),
+            headers=authorization(default_user_login),
+        )
+
+    assert response.status_code == HTTPStatus.CREATED
+
+    with query_budget(4):
+        response = client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload("Existing room", room_id=str(chat_room.id)),
+            headers=authorization(default_user_login),
+        )
+
+    assert response.status_code == HTTPStatus.CREATED
+
+
+def test_chat_jobs_query_budget(client, default_user_login, fake_openai, query_budget):
+    with query_budget(2):
+        response = client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload("Later"),
+            headers={**authorization(default_user_login), "prefer": "respond-async"},
+        )
+
+    assert response.status_code == HTTPStatus.ACCEPTED
+
+    with query_budget(2):
+        response = client.get(
+            f"/app-api/v1/llm/jobs/{response.json()['job_id']}",
+            headers=authorization(default_user_login),
+        )
+
+    assert response.status_code == HTTPStatus.OK
@@ -0,0 +1,182 @@
+import asyncio
+import uuid
+from http import HTTPStatus
+
+import pytest
+from sqlmodel import Session, delete
+
+from buddy.conf import settings
+from buddy.llm import rate_limits
+from buddy.llm.jobs import ChatJobWorker
+from buddy.llm.models import DailyTokenUsage, RateLimitBucket
+from buddy.llm.rate_limits import InMemoryRateLimiter, record_tokens_used
+from buddy.llm.schemas import LLMUsage
+from buddy.llm.tests.utils import authorization, chat_payload
+from buddy.llm.usage import get_usage_ledger
+from buddy.money.limits import TIER_LIMITS, TierLimits
+from buddy.money.tiers import UserTiers
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+
+@pytest.fixture(scope="function")
+def rate_limit_backend(request, database, default_user, monkeypatch):
+    backend = getattr(request, "param", "memory")
+    monkeypatch.setattr(settings, "rate_limit_backend", backend)
+    monkeypatch.setattr(rate_limits, "__in_memory_rate_limiter", None)
+    monkeypatch.setitem(
+        TIER_LIMITS,
+        UserTiers.FREE,
+        TierLimits(requests_per_minute=0.01, request_burst=2, daily_tokens=1000),
+    )
+    # Tokens other tests left in the ledger would land after the cleanup otherwise.
+    get_usage_ledger(database).flush()
+    with Session(database.engine) as session:
+        for model in (RateLimitBucket, DailyTokenUsage):
+            session.exec(delete(model).where(model.owner_id == default_user.id))  # type: ignore
+        session.commit()
+
+    return backend
+
+
+def post_chat_message(client, login):
+    return client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload(f"Again? {uuid.uuid4()}"),
+        headers=authorization(login),
+    )
+
+
+@pytest.mark.parametrize("rate_limit_backend", ["memory", "postgres"], indirect=True)
+def test_requests_beyond_the_burst_are_rate_limited(
+    client, default_user_login, fake_openai, rate_limit_backend
+):
+    responses = list(
+        map(lambda _: post_chat_message(client, default_user_login), range(3))
+    )
+
+    assert list(map(lambda response: response.status_code, responses)) == [
+        HTTPStatus.CREATED,
+        HTTPStatus.CREATED,
+        HTTPStatus.TOO_MANY_REQUESTS,
+    ]
+    assert responses[2].json()["detail"][0]["type"] == "rate_limited"
+    assert int(responses[2].headers["retry-after"]) > 0
+    assert len(fake_openai.calls) == 2
+
+
+@pytest.mark.parametrize("rate_limit_backend", ["memory", "postgres"], indirect=True)
+def test_daily_token_quota_is_enforced(
+    client, database, default_user, default_user_login, fake_openai, rate_limit_backend
+):
+    asyncio.run(
+        record_tokens_used(
+            database=database,
+            owner_id=default_user.id,
+            usage=LLMUsage(prompt_tokens=900, completion_tokens=85),
+        )
+    )
+
+    # The fake provider uses 15 tokens, which reaches the quota.
+    assert post_chat_message(client, default_user_login).status_code == (
+        HTTPStatus.CREATED
+    )
+    response = post_chat_message(client, default_user_login)
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert response.json()["detail"][0]["type"] == "token_quota_exceeded"
+    assert int(response.headers["retry-after"]) <= 24 * 60 * 60
+
+
+# In memory the tokens other processes used only count once a user's tokens get loaded
+# again the next day.
+@pytest.mark.parametrize("rate_limit_backend", ["postgres"], indirect=True)
+def test_daily_token_quota_counts_tokens_used_by_chat_jobs(
+    client, database, default_user_login, fake_openai, rate_limit_backend, monkeypatch
+):
+    monkeypatch.setitem(
+        TIER_LIMITS,
+        UserTiers.FREE,
+        TierLimits(requests_per_minute=0.01, request_burst=2, daily_tokens=10),
+    )
+    response = client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload(f"Later {uuid.uuid4()}"),
+        headers={**authorization(default_user_login), "prefer": "respond-async"},
+    )
+
+    assert response.status_code == HTTPStatus.ACCEPTED
+
+    # Workers run in their own processes, with their own in-memory limiter.
+    api_rate_limiter = rate_limits.get_rate_limiter(database)
+    monkeypatch.setattr(
+        rate_limits,
+        "__in_memory_rate_limiter",
+        InMemoryRateLimiter(database=database, max_users=1),
+    )
+    asyncio.run(ChatJobWorker(database=database).run_once())
+    monkeypatch.setattr(rate_limits, "__in_memory_rate_limiter", api_rate_limiter)
+
+    response = post_chat_message(client, default_user_login)
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert response.json()["detail"][0]["type"] == "token_quota_exceeded"
+
+
+@pytest.mark.parametrize("rate_limit_backend", ["memory", "postgres"], indirect=True)
+def test_idempotent_replays_are_not_rate_limited(
+    client, default_user_login, fake_openai, rate_limit_backend
+):
+    headers = {
+        **authorization(default_user_login),
+        "idempotency-key": str(uuid.uuid4()),
+    }
+    payload = chat_payload(f"Once? {uuid.uuid4()}")
+    responses = list(
+        map(
+            lambda _: client.post(
+                "/app-api/v1/llm/chats", json=payload, headers=headers
+            ),
+            range(3),
+        )
+    )
+
+    assert (
+        list(map(lambda response: response.status_code, responses))
+        == [HTTPStatus.CREATED] * 3
+    )
+    # The burst of 2 still has room for another message.
+    assert post_chat_message(client, default_user_login).status_code == (
+        HTTPStatus.CREATED
+    )
+
+
+def test_in_memory_daily_tokens_are_loaded_once_and_written_through_the_ledger(
+    database, default_user, rate_limit_backend
+):
+    day = datetime_now_with_timezone().date()
+    with Session(database.engine) as session:
+        session.add(DailyTokenUsage(owner_id=default_user.id, day=day, tokens=100))
+        session.commit()
+    rate_limiter = InMemoryRateLimiter(database=database, max_users=1)
+
+    async def use_tokens() -> list[int]:
+        tokens_used = [await rate_limiter.get_tokens_used(default_user.id, day)]
+        await rate_limiter.add_tokens_used(default_user.id, day, tokens=5)
+        with Session(database.engine) as session:
+            usage = session.get(DailyTokenUsage, (default_user.id, day))
+            assert usage is not None
+            usage.tokens = 900
+            session.add(usage)
+            session.commit()
+        tokens_used.append(await rate_limiter.get_tokens_used(default_user.id, day))
+
+        return tokens_used
+
+    assert asyncio.run(use_tokens()) == [100, 105]
+
+    get_usage_ledger(database).flush()
+    with Session(database.engine) as session:
+        usage = session.get(DailyTokenUsage, (default_user.id, day))
+
+        assert usage is not None
+        assert usage.tokens == 905
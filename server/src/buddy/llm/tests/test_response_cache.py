@@ -0,0 +1,79 @@
+import asyncio
+import uuid
+from http import HTTPStatus
+
+import pytest
+
+from buddy.conf import settings
+from buddy.llm.response_cache import (
+    RESPONSE_CACHE_LOOKUPS,
+    CachedResponse,
+    PostgresResponseCache,
+)
+from buddy.llm.schemas import LLMUsage
+from buddy.llm.tests.utils import authorization, chat_payload
+
+
+@pytest.mark.parametrize("backend", ["memory", "postgres"])
+def test_repeated_first_messages_are_cached(
+    client, default_user_login, fake_openai, monkeypatch, backend
+):
+    monkeypatch.setattr(settings, "response_cache_backend", backend)
+    message = f"How do I get started? {uuid.uuid4()}"
+    hits = RESPONSE_CACHE_LOOKUPS.value(result="hit")
+
+    responses = list(
+        map(
+            lambda content: client.post(
+                "/app-api/v1/llm/chats",
+                json=chat_payload(content),
+                headers=authorization(default_user_login),
+            ),
+            [message, f"  {message.replace(' ', '   ')} "],
+        )
+    )
+
+    assert list(map(lambda response: response.status_code, responses)) == [
+        HTTPStatus.CREATED,
+        HTTPStatus.CREATED,
+    ]
+    assert list(map(lambda response: response.json()["cached"], responses)) == [
+        False,
+        True,
+    ]
+    assert responses[1].json()["content"] == fake_openai.answer
+    assert responses[0].json()["room_id"] != responses[1].json()["room_id"]
+    assert len(fake_openai.calls) == 1
+    assert RESPONSE_CACHE_LOOKUPS.value(result="hit") == hits + 1
+
+
+def test_response_cache_is_opt_in(client, default_user_login, fake_openai):
+    message = f"Not cached {uuid.uuid4()}"
+    for _ in range(2):
+        response = client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload(message),
+            headers=authorization(default_user_login),
+        )
+
+        assert response.json()["cached"] is False
+
+    assert len(fake_openai.calls) == 2
+
+
+def test_postgres_response_cache_evicts_least_recently_used(database):
+    cache = PostgresResponseCache(database=database, max_entries=2)
+    keys = list(map(lambda _: uuid.uuid4().hex, range(3)))
+    response = CachedResponse(
+        content="Cached!", usage=LLMUsage(prompt_tokens=1, completion_tokens=2)
+    )
+
+    async def fill():
+        await cache.set(keys[0], response)
+        await cache.set(keys[1], response)
+        await cache.get(keys[0])
+        await cache.set(keys[2], response)
+
+        return await asyncio.gather(*map(cache.get, keys))
+
+    assert asyncio.run(fill()) == [response, None, response]
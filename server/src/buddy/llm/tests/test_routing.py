@@ -0,0 +1,295 @@
+import asyncio
+import time
+import uuid
+from http import HTTPStatus
+from typing import AsyncIterator
+
+import pytest
+
+from buddy.conf import settings
+from buddy.llm.context import summarize
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.routing import (
+    CircuitBreaker,
+    RouteCandidate,
+    chat_with_fallbacks,
+    get_circuit_breaker,
+    get_latency_window,
+    stream_with_fallbacks,
+)
+from buddy.llm.schemas import LLMCompletion, LLMUsage
+from buddy.llm.tests.utils import (
+    authorization,
+    chat_payload,
+    make_message,
+    parse_server_sent_events,
+)
+
+
+class FakeProvider:
+    def __init__(
+        self, name: str, delay_seconds=0.0, fails=False, fails_midway=False
+    ) -> None:
+        self.name = name
+        self.delay_seconds = delay_seconds
+        self.fails = fails
+        self.fails_midway = fails_midway
+        self.cancelled = False
+
+    def get_name(self) -> str:
+        return self.name
+
+    async def chat(self, llm_model, messages) -> LLMCompletion:
+        try:
+            await asyncio.sleep(self.delay_seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+        if self.fails:
+            raise RuntimeError(f"{self.name} is down")
+
+        return LLMCompletion(
+            message=make_message(f"Hello from {self.name}!", role="assistant"),
+            usage=LLMUsage(prompt_tokens=1, completion_tokens=1),
+        )
+
+    async def stream_chat(self, llm_model, messages) -> AsyncIterator[str | LLMUsage]:
+        if self.fails:
+            raise RuntimeError(f"{self.name} is down")
+
+        yield "Hello from "
+        if self.fails_midway:
+            raise RuntimeError(f"{self.name} went down")
+
+        yield f"{self.name}!"
+        yield LLMUsage(prompt_tokens=1, completion_tokens=1)
+
+
+@pytest.fixture(scope="function")
+def route_models():
+    # Unique keys keep latency windows and breakers apart between tests.
+    suffix = uuid.uuid4().hex
+    models = list(
+        map(
+            lambda model: model.model_copy(
+                update={"key": f"{model.key}-{suffix}", "provider": suffix}
+            ),
+            PROVIDERS["openai"].get_all_models()[:2],
+        )
+    )
+
+    return models, suffix
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+
+    time.sleep(0.05)
+    assert breaker.allow_request()
+    # Only a single trial call is let through.
+    assert not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.05)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_falls_back_when_the_first_model_fails(route_models):
+    (primary_model, fallback_model), suffix = route_models
+    route = [
+        RouteCandidate(primary_model, FakeProvider(f"{suffix}-primary", fails=True)),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    completion = asyncio.run(chat_with_fallbacks(route, [make_message("Hi")]))
+
+    assert completion.message.content == f"Hello from {suffix}-fallback!"
+    assert get_circuit_breaker(f"{suffix}-primary").state == "closed"
+
+
+def test_summaries_fall_back_when_the_first_model_fails(route_models):
+    (primary_model, fallback_model), suffix = route_models
+    route = [
+        RouteCandidate(primary_model, FakeProvider(f"{suffix}-primary", fails=True)),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    completion = asyncio.run(summarize(route, None, [make_message("Hi")]))
+
+    assert completion.message.content == f"Hello from {suffix}-fallback!"
+
+
+def test_skips_providers_with_an_open_circuit(route_models, monkeypatch):
+    (primary_model, fallback_model), suffix = route_models
+    monkeypatch.setattr(settings, "llm_circuit_breaker_failure_threshold", 1)
+    primary = FakeProvider(f"{suffix}-primary", fails=True)
+    route = [
+        RouteCandidate(primary_model, primary),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    asyncio.run(chat_with_fallbacks(route, [make_message("Hi")]))
+    primary.fails = False
+    completion = asyncio.run(chat_with_fallbacks(route, [make_message("Hi")]))
+
+    assert get_circuit_breaker(f"{suffix}-primary").state == "open"
+    assert completion.message.content == f"Hello from {suffix}-fallback!"
+
+
+async def collect_stream(route) -> tuple[RouteCandidate, list[str | LLMUsage]]:
+    candidate, stream = await stream_with_fallbacks(route, [make_message("Hi")])
+
+    return candidate, [chunk async for chunk in stream]
+
+
+def test_streams_fall_back_before_the_first_chunk(route_models, monkeypatch):
+    (primary_model, fallback_model), suffix = route_models
+    monkeypatch.setattr(settings, "llm_circuit_breaker_failure_threshold", 1)
+    route = [
+        RouteCandidate(primary_model, FakeProvider(f"{suffix}-primary", fails=True)),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    candidate, chunks = asyncio.run(collect_stream(route))
+
+    assert candidate.llm_model == fallback_model
+    assert chunks[:2] == ["Hello from ", f"{suffix}-fallback!"]
+    assert get_circuit_breaker(f"{suffix}-primary").state == "open"
+    assert get_circuit_breaker(f"{suffix}-fallback").state == "closed"
+
+
+def test_streams_skip_providers_with_an_open_circuit(route_models):
+    (primary_model, fallback_model), suffix = route_models
+    for _ in range(settings.llm_circuit_breaker_failure_threshold):
+        get_circuit_breaker(f"{suffix}-primary").record_failure()
+    primary = FakeProvider(f"{suffix}-primary")
+    route = [
+        RouteCandidate(primary_model, primary),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    candidate, _ = asyncio.run(collect_stream(route))
+
+    assert candidate.llm_model == fallback_model
+
+
+def test_streams_failing_after_the_first_chunk_are_recorded(route_models, monkeypatch):
+    (primary_model, fallback_model), suffix = route_models
+    monkeypatch.setattr(settings, "llm_circuit_breaker_failure_threshold", 1)
+    route = [
+        RouteCandidate(
+            primary_model, FakeProvider(f"{suffix}-primary", fails_midway=True)
+        ),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect_stream(route))
+
+    assert get_circuit_breaker(f"{suffix}-primary").state == "open"
+
+
+def test_hedges_once_past_the_p95(route_models, monkeypatch):
+    (primary_model, fallback_model), suffix = route_models
+    monkeypatch.setattr(settings, "llm_hedging_enabled", True)
+    monkeypatch.setattr(settings, "llm_hedging_min_samples", 1)
+    monkeypatch.setattr(settings, "llm_hedging_min_delay_seconds", 0)
+    get_latency_window(primary_model).observe(0.01)
+    primary = FakeProvider(f"{suffix}-primary", delay_seconds=5)
+    route = [
+        RouteCandidate(primary_model, primary),
+        RouteCandidate(fallback_model, FakeProvider(f"{suffix}-fallback")),
+    ]
+
+    async def chat():
+        completion = await chat_with_fallbacks(route, [make_message("Hi")])
+        # Lets the cancelled call unwind.
+        await asyncio.sleep(0)
+
+        return completion
+
+    started_at = time.monotonic()
+    completion = asyncio.run(chat())
+
+    assert time.monotonic() - started_at < 1
+    assert completion.message.content == f"Hello from {suffix}-fallback!"
+    assert primary.cancelled
+
+
+def test_create_chat_message_answers_from_fallback(
+    client, default_user_login, fake_openai, monkeypatch
+):
+    async def failing_chat(llm_model, messages):
+        raise RuntimeError("OpenAI is down")
+
+    async def google_chat(llm_model, messages):
+        message = make_message("Hello from Gemini!", role="assistant")
+
+        return LLMCompletion(
+            message=message.model_copy(
+                update={"llm_provider": "google", "llm_key": llm_model.key}
+            ),
+            usage=LLMUsage(prompt_tokens=1, completion_tokens=1),
+        )
+
+    monkeypatch.setattr(PROVIDERS["openai"], "chat", failing_chat)
+    monkeypatch.setattr(PROVIDERS["google"], "chat", google_chat)
+    monkeypatch.setattr(
+        settings, "llm_fallbacks", {"openai:gpt-4o-mini": ["google:gemini-2.0-flash"]}
+    )
+
+    try:
+        response = client.post(
+            "/app-api/v1/llm/chats",
+            json=chat_payload("Anyone there?"),
+            headers=authorization(default_user_login),
+        )
+    finally:
+        get_circuit_breaker("openai").record_success()
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()["content"] == "Hello from Gemini!"
+    assert response.json()["llm_provider"] == "google"
+    assert response.json()["llm_key"] == "gemini-2.0-flash"
+
+
+def test_stream_chat_message_answers_from_fallback(
+    client, default_user_login, fake_openai, monkeypatch
+):
+    async def google_stream_chat(llm_model, messages):
+        yield "Hello from Gemini!"
+        yield LLMUsage(prompt_tokens=1, completion_tokens=1)
+
+    monkeypatch.setattr(PROVIDERS["google"], "stream_chat", google_stream_chat)
+    monkeypatch.setattr(
+        settings, "llm_fallbacks", {"openai:gpt-4o-mini": ["google:gemini-2.0-flash"]}
+    )
+    breaker = get_circuit_breaker("openai")
+    for _ in range(settings.llm_circuit_breaker_failure_threshold):
+        breaker.record_failure()
+
+    try:
+        with client.stream(
+            "POST",
+            "/app-api/v1/llm/chats/stream",
+            json=chat_payload("Anyone streaming?"),
+            headers=authorization(default_user_login),
+        ) as response:
+            events = parse_server_sent_events(response.read().decode())
+    finally:
+        breaker.record_success()
+
+    assert fake_openai.calls == []
+    assert events[-1][1]["content"] == "Hello from Gemini!"
+    assert events[-1][1]["llm_provider"] == "google"
+    assert events[-1][1]["llm_key"] == "gemini-2.0-flash"
@@ -0,0 +1,111 @@
+import base64
+import hashlib
+
+import tiktoken
+import tiktoken.load
+import tiktoken.model
+import tiktoken.registry
+
+from buddy.llm import tokenizers
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.tests.utils import make_message
+from buddy.llm.tokenizers import (
+    TOKENS_PER_MESSAGE,
+    TOKENS_PER_REPLY,
+    count_conversation_tokens,
+    get_preloaded_encoding,
+    preload_encodings,
+)
+
+BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([byte]): byte for byte in range(256)},
+    special_tokens={},
+)
+
+
+def test_preload_encodings(monkeypatch):
+    loaded_model_keys = []
+
+    def encoding_for_model(model_key):
+        loaded_model_keys.append(model_key)
+
+        return BYTE_ENCODING
+
+    monkeypatch.setattr(tokenizers.tiktoken, "encoding_for_model", encoding_for_model)
+
+    assert get_preloaded_encoding("byte-model") is None
+
+    preload_encodings(["byte-model", "byte-model"])
+    preload_encodings(["byte-model"])
+
+    assert loaded_model_keys == ["byte-model"]
+    assert get_preloaded_encoding("byte-model") is BYTE_ENCODING
+
+
+def test_preload_encodings_reads_the_tiktoken_cache(tmp_path, monkeypatch):
+    model_keys = list(
+        map(lambda model: model.key, PROVIDERS["openai"].get_all_models())
+    )
+    encoding_names = set(map(tiktoken.model.encoding_name_for_model, model_keys))
+    bpe_file = b"\n".join(
+        map(
+            lambda byte: base64.b64encode(bytes([byte])) + f" {byte}".encode(),
+            range(256),
+        )
+    )
+
+    def cached_constructor(encoding_name):
+        url = f"https://encodings.invalid/{encoding_name}.tiktoken"
+        (tmp_path / hashlib.sha1(url.encode()).hexdigest()).write_bytes(bpe_file)
+
+        return lambda: {
+            "name": encoding_name,
+            "pat_str": r"\S+|\s+",
+            "mergeable_ranks": tiktoken.load.load_tiktoken_bpe(
+                url, expected_hash=hashlib.sha256(bpe_file).hexdigest()
+            ),
+            "special_tokens": {},
+        }
+
+    def download(blobpath):
+        raise AssertionError(f"{blobpath} should have been read from the cache")
+
+    # The encoding files are stand-ins, tiktoken reads them the way it reads the
+    # real ones the image build puts in `TIKTOKEN_CACHE_DIR`.
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tiktoken.load, "read_file", download)
+    monkeypatch.setattr(tiktoken.registry, "ENCODINGS", {})
+    monkeypatch.setattr(
+        tiktoken.registry,
+        "ENCODING_CONSTRUCTORS",
+        dict(map(lambda name: (name, cached_constructor(name)), encoding_names)),
+    )
+    monkeypatch.setattr(tokenizers, "__encodings", {})
+
+    preload_encodings(model_keys)
+
+    for model_key in model_keys:
+        encoding = get_preloaded_encoding(model_key)
+
+        assert encoding is not None
+        assert encoding.name == tiktoken.model.encoding_name_for_model(model_key)
+        assert encoding.encode_ordinary("Hi") == [ord("H"), ord("i")]
+
+
+def test_count_conversation_tokens():
+    messages = [
+        make_message("Hello there"),
+        make_message("General Kenobi", role="assistant"),
+    ]
+
+    assert count_conversation_tokens(BYTE_ENCODING, messages) == (
+        TOKENS_PER_MESSAGE
+        + len("user")
+        + len("Hello there")
+        + TOKENS_PER_MESSAGE
+        + len("assistant")
+        + len("General Kenobi")
+        + TOKENS_PER_REPLY
+    )
@@ -0,0 +1,150 @@
+import asyncio
+import uuid
+from datetime import date
+
+from sqlmodel import Session, select
+
+from buddy.database import create_async_session
+from buddy.llm.models import DailyUsageRollup, UsageLedgerEntry
+from buddy.llm.schemas import LLMModel, LLMUsage
+from buddy.llm.tests.utils import (
+    authorization,
+    chat_payload,
+    parse_server_sent_events,
+)
+from buddy.llm.usage import UsageLedger, get_usage_ledger
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+
+def make_ledger(database, max_buffer_size=100) -> UsageLedger:
+    return UsageLedger(
+        database=database,
+        flush_interval_seconds=60,
+        batch_size=2,
+        max_buffer_size=max_buffer_size,
+    )
+
+
+def make_model() -> LLMModel:
+    # Unique so rollups other tests write don't get in the way.
+    return LLMModel(
+        provider="test",
+        key=f"ledger-{uuid.uuid4()}",
+        display_name="Ledger",
+        description="Only bills",
+        prompt_usd_per_million_tokens=2,
+        completion_usd_per_million_tokens=8,
+    )
+
+
+def list_rollups(database, owner_id: int, day: date) -> list[DailyUsageRollup]:
+    async def list_for_owner() -> list[DailyUsageRollup]:
+        async with create_async_session(database) as session:
+            return list(
+                await DailyUsageRollup.list_for_owner_async(
+                    owner_id=owner_id, from_day=day, to_day=day, session=session
+                )
+            )
+
+    return asyncio.run(list_for_owner())
+
+
+def test_chat_turns_are_recorded_in_the_usage_ledger(
+    client, database, default_user_login, fake_openai
+):
+    response = client.post(
+        "/app-api/v1/llm/chats",
+        json=chat_payload(f"What does this cost? {uuid.uuid4()}"),
+        headers=authorization(default_user_login),
+    )
+    room_id = uuid.UUID(response.json()["room_id"])
+
+    get_usage_ledger(database).flush()
+
+    with Session(database.engine) as session:
+        entries = session.exec(
+            select(UsageLedgerEntry).where(UsageLedgerEntry.room_id == room_id)
+        ).all()
+
+    assert len(entries) == 1
+    assert entries[0].llm_provider == "openai"
+    assert entries[0].llm_key == "gpt-4o-mini"
+    assert entries[0].prompt_tokens == 10
+    assert entries[0].completion_tokens == 5
+    assert entries[0].cost_micro_usd > 0
+
+
+def test_streamed_chat_turns_are_recorded_with_the_reported_usage(
+    client, database, default_user_login, fake_openai
+):
+    with client.stream(
+        "POST",
+        "/app-api/v1/llm/chats/stream",
+        json=chat_payload(f"What does streaming cost? {uuid.uuid4()}"),
+        headers=authorization(default_user_login),
+    ) as response:
+        events = parse_server_sent_events(response.read().decode())
+    room_id = uuid.UUID(events[-1][1]["room_id"])
+
+    get_usage_ledger(database).flush()
+
+    with Session(database.engine) as session:
+        entries = session.exec(
+            select(UsageLedgerEntry).where(UsageLedgerEntry.room_id == room_id)
+        ).all()
+
+    assert len(entries) == 1
+    assert entries[0].prompt_tokens == 10
+    assert entries[0].completion_tokens == 5
+
+
+def test_usage_ledger_writes_batches_and_rolls_them_up_per_day(database, default_user):
+    ledger = make_ledger(database)
+    llm_model = make_model()
+    for _ in range(3):
+        ledger.record(
+            owner_id=default_user.id,
+            room_id=uuid.uuid4(),
+            llm_model=llm_model,
+            usage=LLMUsage(prompt_tokens=1000, completion_tokens=500),
+            latency_seconds=0.25,
+        )
+
+    assert ledger.flush() == 3
+    assert ledger.flush() == 0
+
+    rollups = list(
+        filter(
+            lambda rollup: rollup.llm_key == llm_model.key,
+            list_rollups(
+                database,
+                owner_id=default_user.id,
+                day=datetime_now_with_timezone().date(),
+            ),
+        )
+    )
+    ledger.close()
+
+    assert len(rollups) == 1
+    assert rollups[0].requests == 3
+    assert rollups[0].prompt_tokens == 3000
+    assert rollups[0].completion_tokens == 1500
+    assert rollups[0].latency_ms == 750
+    assert rollups[0].cost_micro_usd == 3 * 6000
+
+
+def test_usage_ledger_drops_entries_beyond_its_buffer(database, default_user):
+    ledger = make_ledger(database, max_buffer_size=1)
+    llm_model = make_model()
+    for _ in range(2):
+        ledger.record(
+            owner_id=default_user.id,
+            room_id=uuid.uuid4(),
+            llm_model=llm_model,
+            usage=LLMUsage(prompt_tokens=1, completion_tokens=1),
+            latency_seconds=0,
+        )
+
+    assert ledger.flush() == 1
+
+    ledger.close()
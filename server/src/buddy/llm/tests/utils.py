@@ -0,0 +1,50 @@
+import json
+from datetime import timedelta
+
+from sqlmodel import Session
+
+from buddy.llm.models import ChatRoom
+from buddy.llm.schemas import ChatRoomMessage, CreateChatRoomPayload
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+
+
+def authorization(login) -> dict[str, str]:
+    return {"authorization": f"Bearer {login.access_token}"}
+
+
+def chat_payload(message: str, **extra) -> dict:
+    payload = {"llm_provider": "openai", "llm_key": "gpt-4o-mini", "message": message}
+
+    return {**payload, **extra}
+
+
+def parse_server_sent_events(body: str) -> list[tuple[str, dict]]:
+    events = []
+    for raw_event in body.strip().split("\n\n"):
+        event_line, data_line = raw_event.split("\n")
+        events.append(
+            (event_line.removeprefix("event: "), json.loads(data_line[len("data: ") :]))
+        )
+
+    return events
+
+
+def make_message(content: str, role="user", offset_seconds=0) -> ChatRoomMessage:
+    return ChatRoomMessage(
+        role=role,
+        content=content,
+        llm_provider="openai",
+        llm_key="gpt-4o-mini",
+        date=datetime_now_with_timezone() + timedelta(seconds=offset_seconds),
+    )
+
+
+def create_room(session: Session, owner_id: int) -> ChatRoom:
+    return ChatRoom.create(
+        payload=CreateChatRoomPayload(
+            question=make_message("Hello?"),
+            answer=make_message("Hi!", role="assistant", offset_seconds=1),
+            asking_user_id=owner_id,
+        ),
+        session=session,
+    )
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import math
+from functools import lru_cache
+from typing import Iterable
+
+import tiktoken
+
+from buddy.llm.schemas import ChatRoomMessage
+
+# Every chat message is wrapped in a few formatting tokens and every reply is primed
+# with a few more, see the OpenAI cookbook on counting tokens for chat models.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+MESSAGE_TOKEN_COUNTS_CACHE_SIZE = 8192
+
+# Rough average for English text, good enough for budgeting but not for billing.
+ESTIMATED_BYTES_PER_TOKEN = 4
+
+__encodings: dict[str, tiktoken.Encoding] = {}
+
+
+def preload_encodings(model_keys: Iterable[str]) -> None:
+    """
+    Loads the encodings for the given models, tiktoken reads the files from
+    `TIKTOKEN_CACHE_DIR` when it is set and downloads them otherwise.
+    """
+
+    for model_key in model_keys:
+        if model_key in __encodings:
+            continue
+
+        __encodings[model_key] = tiktoken.encoding_for_model(model_key)
+
+
+def get_preloaded_encoding(model_key: str) -> tiktoken.Encoding | None:
+    # Never loads on demand, that could mean a download in the middle of a request.
+    return __encodings.get(model_key)
+
+
+def count_conversation_tokens(
+    encoding: tiktoken.Encoding, messages: list[ChatRoomMessage]
+) -> int:
+    return (
+        sum(
+            map(
+                lambda message: count_message_tokens(
+                    encoding, role=message.role, content=message.content
+                ),
+                messages,
+            )
+        )
+        + TOKENS_PER_REPLY
+    )
+
+
+@lru_cache(maxsize=MESSAGE_TOKEN_COUNTS_CACHE_SIZE)
+def count_message_tokens(encoding: tiktoken.Encoding, role: str, content: str) -> int:
+    return (
+        TOKENS_PER_MESSAGE
+        + len(encoding.encode_ordinary(role))
+        + len(encoding.encode_ordinary(content))
+    )
+
+
+def estimate_conversation_tokens(messages: list[ChatRoomMessage]) -> int:
+    return (
+        sum(
+            map(
+                lambda message: estimate_message_tokens(
+                    role=message.role, content=message.content
+                ),
+                messages,
+            )
+        )
+        + TOKENS_PER_REPLY
+    )
+
+
+@lru_cache(maxsize=MESSAGE_TOKEN_COUNTS_CACHE_SIZE)
+def estimate_message_tokens(role: str, content: str) -> int:
+    content_bytes = len(role.encode()) + len(content.encode())
+
+    return TOKENS_PER_MESSAGE + math.ceil(content_bytes / ESTIMATED_BYTES_PER_TOKEN)
+
+
+if __name__ == "__main__":
+    # Run while building the image so the encodings ship in `TIKTOKEN_CACHE_DIR`.
+    from buddy.llm.providers import PROVIDERS
+
+    preload_encodings(
+        map(lambda model: model.key, PROVIDERS["openai"].get_all_models())
+    )
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import threading
+import uuid
+from datetime import date
+
+from sqlmodel import Session
+
+from buddy.conf import settings
+from buddy.database import Databaseable
+from buddy.llm.models import DailyTokenUsage, UsageLedgerEntry
+from buddy.llm.schemas import LLMModel, LLMUsage
+from buddy.metrics import Counter, Gauge
+from buddy.utils.datetime_utils import datetime_now_with_timezone
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+USAGE_LEDGER_BUFFERED = Gauge(
+    "buddy_usage_ledger_buffered_entries",
+    "Usage ledger entries waiting to be written to the database",
+)
+USAGE_LEDGER_DROPPED = Counter(
+    "buddy_usage_ledger_dropped_entries",
+    "Usage ledger entries lost because the buffer was full",
+)
+
+
+class UsageLedger:
+    """
+    Records what every chat turn used and cost, along with the daily tokens of the
+    in-memory rate limiter. Both are buffered in memory and written in batches by a
+    background thread, so recording never waits on the database.
+    """
+
+    def __init__(
+        self,
+        database: Databaseable,
+        flush_interval_seconds: float,
+        batch_size: int,
+        max_buffer_size: int,
+    ) -> None:
+        self.database = database
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = batch_size
+        self.max_buffer_size = max_buffer_size
+        self.__entries: list[UsageLedgerEntry] = []
+        self.__tokens_used: dict[tuple[int, date], int] = {}
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__flusher = threading.Thread(
+            target=self.__flush_periodically, name="usage-ledger-flusher", daemon=True
+        )
+        self.__flusher.start()
+
+    def record(
+        self,
+        owner_id: int,
+        room_id: uuid.UUID,
+        llm_model: LLMModel,
+        usage: LLMUsage,
+        latency_seconds: float,
+    ) -> None:
+        entry = UsageLedgerEntry(
+            owner_id=owner_id,
+            room_id=room_id,
+            llm_provider=llm_model.provider,
+            llm_key=llm_model.key,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            latency_ms=round(latency_seconds * 1000),
+            cost_micro_usd=get_cost_micro_usd(llm_model=llm_model, usage=usage),
+            created_at=datetime_now_with_timezone(),
+        )
+        with self.__lock:
+            if len(self.__entries) >= self.max_buffer_size:
+                USAGE_LEDGER_DROPPED.inc()
+                return
+
+            self.__entries.append(entry)
+            USAGE_LEDGER_BUFFERED.set(len(self.__entries))
+
+    def record_tokens_used(self, owner_id: int, day: date, tokens: int) -> None:
+        with self.__lock:
+            key = (owner_id, day)
+            self.__tokens_used[key] = self.__tokens_used.get(key, 0) + tokens
+
+    def flush(self) -> int:
+        """Writes the buffered entries, returns how many were written."""
+
+        with self.__flush_lock:
+            with self.__lock:
+                entries, self.__entries = self.__entries, []
+                tokens_used, self.__tokens_used = self.__tokens_used, {}
+
+            written = 0
+            try:
+                with Session(self.database.engine) as session:
+                    DailyTokenUsage.add_many(tokens_used=tokens_used, session=session)
+                    tokens_used = {}
+                    for start in range(0, len(entries), self.batch_size):
+                        UsageLedgerEntry.insert_many(
+                            entries=entries[start : start + self.batch_size],
+                            session=session,
+                        )
+                        written = min(len(entries), start + self.batch_size)
+            except Exception:
+                logger.exception("Failed to write the usage ledger")
+                self.__requeue(entries[written:], tokens_used)
+
+            with self.__lock:
+                USAGE_LEDGER_BUFFERED.set(len(self.__entries))
+
+            return written
+
+    def close(self) -> None:
+        self.__stopped.set()
+        self.__flusher.join()
+        self.flush()
+
+    def __requeue(
+        self,
+        entries: list[UsageLedgerEntry],
+        tokens_used: dict[tuple[int, date], int],
+    ) -> None:
+        # Retried on the next flush, entries as far as they still fit in the buffer.
+        with self.__lock:
+            for key, tokens in tokens_used.items():
+                self.__tokens_used[key] = self.__tokens_used.get(key, 0) + tokens
+            kept = entries[: max(0, self.max_buffer_size - len(self.__entries))]
+            self.__entries = kept + self.__entries
+        if len(kept) < len(entries):
+            USAGE_LEDGER_DROPPED.inc(len(entries) - len(kept))
+
+    def __flush_periodically(self) -> None:
+        while not self.__stopped.wait(self.flush_interval_seconds):
+            self.flush()
+
+
+__usage_ledger: UsageLedger | None = None
+__usage_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger(database: Databaseable) -> UsageLedger:
+    global __usage_ledger
+    with __usage_ledger_lock:
+        if __usage_ledger is None:
+            __usage_ledger = UsageLedger(
+                database=database,
+                flush_interval_seconds=settings.usage_ledger_flush_interval_seconds,
+                batch_size=settings.usage_ledger_batch_size,
+                max_buffer_size=settings.usage_ledger_max_buffer_size,
+            )
+
+        return __usage_ledger
+
+
+def close_usage_ledger() -> None:
+    """Writes what is still buffered, call it before the process exits."""
+
+    global __usage_ledger
+    with __usage_ledger_lock:
+        if __usage_ledger is not None:
+            __usage_ledger.close()
+            __usage_ledger = None
+
+
+def get_cost_micro_usd(llm_model: LLMModel, usage: LLMUsage) -> int:
+    # Dollars per million tokens are micro dollars per token.
+    return round(
+        usage.prompt_tokens * llm_model.prompt_usd_per_million_tokens
+        + usage.completion_tokens * llm_model.completion_usd_per_million_tokens
+    )
@@ -1,11 +1,35 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from pydantic import ValidationError
 
 from buddy.app_api.router import app_api_router
 from buddy.exceptions import BuddyValidationError
+from buddy.health.readiness import close_readiness_monitor
 from buddy.health.router import health_router
+from buddy.llm.providers import PROVIDERS
+from buddy.llm.usage import close_usage_ledger
+from buddy.metrics.multiprocess import start_metrics_writer, stop_metrics_writer
+from buddy.metrics.router import metrics_router
+from buddy.middleware import MetricsMiddleware, QueryStatsMiddleware
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    for provider in PROVIDERS.values():
+        provider.preload()
+    start_metrics_writer()
+
+    yield
+
+    close_usage_ledger()
+    close_readiness_monitor()
+    stop_metrics_writer()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.exception_handler(ValidationError)
@@ -14,4 +38,5 @@ async def unicorn_exception_handler(_: Request, exc: ValidationError):
 
 
 app.include_router(health_router)
+app.include_router(metrics_router)
 app.include_router(app_api_router)
@@ -0,0 +1,19 @@
+from buddy.metrics.collectors import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricFamily,
+    Sample,
+    collect,
+    get_collectors,
+)
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricFamily",
+    "Sample",
+    "collect",
+    "get_collectors",
+]
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Literal, NamedTuple, Protocol
+
+LabelValues = tuple[str, ...]
+# How samples of the same series from several processes get combined.
+MultiprocessMode = Literal["sum", "max"]
+CollectorType = Literal["counter", "gauge", "histogram"]
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+__collectors: dict[str, Collectable] = {}
+
+
+class Sample(NamedTuple):
+    suffix: str
+    labels: dict[str, str]
+    value: float
+
+
+class MetricFamily(NamedTuple):
+    name: str
+    type: CollectorType
+    documentation: str
+    multiprocess_mode: MultiprocessMode
+    samples: list[Sample]
+
+
+class Collectable(Protocol):
+    name: str
+    documentation: str
+    type: CollectorType
+    label_names: tuple[str, ...]
+    multiprocess_mode: MultiprocessMode
+
+    def samples(self) -> list[Sample]: ...
+
+
+class Counter(Collectable):
+    type: Literal["counter"] = "counter"
+    multiprocess_mode: MultiprocessMode = "sum"
+
+    def __init__(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.__values: dict[LabelValues, float] = {}
+        self.__lock = threading.Lock()
+
+        register_collector(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = get_label_values(self, labels)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self.__values.get(get_label_values(self, labels), 0)
+
+    def samples(self) -> list[Sample]:
+        with self.__lock:
+            values = list(self.__values.items())
+
+        return list(
+            map(
+                lambda item: Sample(
+                    suffix="_total",
+                    labels=dict(zip(self.label_names, item[0])),
+                    value=item[1],
+                ),
+                values,
+            )
+        )
+
+
+class Gauge(Collectable):
+    type: Literal["gauge"] = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        multiprocess_mode: MultiprocessMode = "sum",
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.multiprocess_mode = multiprocess_mode
+        self.__values: dict[LabelValues, float] = {}
+        self.__lock = threading.Lock()
+
+        register_collector(self)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = get_label_values(self, labels)
+        with self.__lock:
+            self.__values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = get_label_values(self, labels)
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self.__values.get(get_label_values(self, labels), 0)
+
+    def samples(self) -> list[Sample]:
+        with self.__lock:
+            values = list(self.__values.items())
+
+        return list(
+            map(
+                lambda item: Sample(
+                    suffix="",
+                    labels=dict(zip(self.label_names, item[0])),
+                    value=item[1],
+                ),
+                values,
+            )
+        )
+
+
+class Histogram(Collectable):
+    type: Literal["histogram"] = "histogram"
+    multiprocess_mode: MultiprocessMode = "sum"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label values: the count of every bucket (the last one being +Inf)
+        # followed by the sum of all observations.
+        self.__values: dict[LabelValues, list[float]] = {}
+        self.__lock = threading.Lock()
+
+        register_collector(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = get_label_values(self, labels)
+        bucket_index = bisect.bisect_left(self.buckets, value)
+        with self.__lock:
+            values = self.__values.get(key)
+            if values is None:
+                values = [0] * (len(self.buckets) + 2)
+                self.__values[key] = values
+
+            values[bucket_index] += 1
+            values[-1] += value
+
+    def count(self, **labels: str) -> int:
+        values = self.__values.get(get_label_values(self, labels))
+        if values is None:
+            return 0
+
+        return int(sum(values[:-1]))
+
+    def samples(self) -> list[Sample]:
+        with self.__lock:
+            values = list(
+                map(lambda item: (item[0], list(item[1])), self.__values.items())
+            )
+
+        samples = []
+        for label_values, bucket_values in values:
+            labels = dict(zip(self.label_names, label_values))
+            cumulative_count = 0.0
+            for bucket, bucket_count in zip(
+                [*map(lambda bucket: str(float(bucket)), self.buckets), "+Inf"],
+                bucket_values[:-1],
+            ):
+                cumulative_count += bucket_count
+                samples.append(
+                    Sample(
+                        suffix="_bucket",
+                        labels={**labels, "le": bucket},
+                        value=cumulative_count,
+                    )
+                )
+            samples.append(
+                Sample(suffix="_count", labels=labels, value=cumulative_count)
+            )
+            samples.append(
+                Sample(suffix="_sum", labels=labels, value=bucket_values[-1])
+            )
+
+        return samples
+
+
+def get_label_values(collector: Collectable, labels: dict[str, str]) -> LabelValues:
+    assert labels.keys() == set(collector.label_names), (
+        f"{collector.name} expects the labels {collector.label_names}"
+    )
+
+    return tuple(map(lambda label_name: labels[label_name], collector.label_names))
+
+
+def register_collector(collector: Collectable) -> None:
+    assert collector.name not in __collectors, (
+        f"{collector.name} has already been registered"
+    )
+
+    __collectors[collector.name] = collector
+
+
+def get_collectors() -> list[Collectable]:
+    return list(__collectors.values())
+
+
+def collect() -> list[MetricFamily]:
+    return list(
+        map(
+            lambda collector: MetricFamily(
+                name=collector.name,
+                type=collector.type,
+                documentation=collector.documentation,
+                multiprocess_mode=collector.multiprocess_mode,
+                samples=collector.samples(),
+            ),
+            get_collectors(),
+        )
+    )
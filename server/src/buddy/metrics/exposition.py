@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import math
+
+from buddy.metrics.collectors import MetricFamily, Sample
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def render_openmetrics(families: list[MetricFamily]) -> str:
+    lines = []
+    for family in sorted(families, key=lambda family: family.name):
+        lines.append(f"# TYPE {family.name} {family.type}")
+        lines.append(f"# HELP {family.name} {escape(family.documentation)}")
+        lines.extend(map(lambda sample: render_sample(family, sample), family.samples))
+    lines.append("# EOF")
+
+    return "\n".join(lines) + "\n"
+
+
+def render_sample(family: MetricFamily, sample: Sample) -> str:
+    labels = ""
+    if len(sample.labels) > 0:
+        labels = ",".join(
+            map(
+                lambda label: f'{label[0]}="{escape(label[1])}"',
+                sample.labels.items(),
+            )
+        )
+        labels = f"{{{labels}}}"
+
+    return f"{family.name}{sample.suffix}{labels} {format_value(sample.value)}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from buddy.conf import settings
+from buddy.metrics.collectors import MetricFamily, Sample, collect
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+
+class MetricsWriter:
+    """
+    Writes this process' metrics to `directory` every `interval_seconds`, so whichever
+    process gets scraped can report every process' metrics. The directory should be
+    emptied before the first process starts.
+    """
+
+    def __init__(self, directory: str, interval_seconds: float) -> None:
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.__stopped = threading.Event()
+        self.__writer = threading.Thread(
+            target=self.__write_periodically, name="metrics-writer", daemon=True
+        )
+        self.__writer.start()
+
+    def close(self) -> None:
+        self.__stopped.set()
+        self.__writer.join()
+        self.write()
+
+    def write(self) -> None:
+        path = Path(self.directory) / f"{os.getpid()}.json"
+        temporary_path = path.with_suffix(".tmp")
+        temporary_path.write_text(
+            json.dumps(list(map(lambda family: family._asdict(), collect())))
+        )
+        # Readers only ever see complete files.
+        os.replace(temporary_path, path)
+
+    def __write_periodically(self) -> None:
+        while not self.__stopped.wait(self.interval_seconds):
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Failed to write the metrics of this process")
+
+
+__metrics_writer: MetricsWriter | None = None
+
+
+def start_metrics_writer() -> None:
+    global __metrics_writer
+    directory = settings.metrics_multiprocess_dir
+    if directory is None or __metrics_writer is not None:
+        return
+
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    __metrics_writer = MetricsWriter(
+        directory=directory,
+        interval_seconds=settings.metrics_multiprocess_write_interval_seconds,
+    )
+
+
+def stop_metrics_writer() -> None:
+    global __metrics_writer
+    if __metrics_writer is not None:
+        __metrics_writer.close()
+        __metrics_writer = None
+
+
+def collect_all_processes() -> list[MetricFamily]:
+    directory = settings.metrics_multiprocess_dir
+    if directory is None:
+        return collect()
+
+    return merge_families(
+        [(collect(), True), *read_other_processes(directory=directory)]
+    )
+
+
+def read_other_processes(directory: str) -> list[tuple[list[MetricFamily], bool]]:
+    """The families every other process wrote, and whether that process still runs."""
+
+    processes = []
+    for path in Path(directory).glob("*.json"):
+        pid = int(path.stem)
+        if pid == os.getpid():
+            continue
+
+        try:
+            families = json.loads(path.read_text())
+        except (OSError, ValueError):
+            logger.warning(f"Skipping unreadable metrics of process {pid}")
+            continue
+
+        processes.append(
+            (
+                list(
+                    map(
+                        lambda family: MetricFamily(
+                            **{
+                                **family,
+                                "samples": list(
+                                    map(
+                                        lambda sample: Sample(*sample),
+                                        family["samples"],
+                                    )
+                                ),
+                            }
+                        ),
+                        families,
+                    )
+                ),
+                is_process_alive(pid),
+            )
+        )
+
+    return processes
+
+
+def merge_families(
+    processes: list[tuple[list[MetricFamily], bool]],
+) -> list[MetricFamily]:
+    """
+    Adds up the samples of every series, or takes the highest for gauges in "max" mode.
+    Counters and histograms of exited processes still count, their gauges don't.
+    """
+
+    merged: dict[str, tuple[MetricFamily, dict[tuple, Sample]]] = {}
+    for families, alive in processes:
+        for family in families:
+            if family.type == "gauge" and not alive:
+                continue
+
+            _, samples = merged.setdefault(family.name, (family, {}))
+            for sample in family.samples:
+                key = (sample.suffix, tuple(sorted(sample.labels.items())))
+                previous = samples.get(key)
+                value = sample.value
+                if previous is not None:
+                    value = (
+                        max(previous.value, value)
+                        if family.multiprocess_mode == "max"
+                        else previous.value + value
+                    )
+                samples[key] = sample._replace(value=value)
+
+    return list(
+        map(
+            lambda item: item[0]._replace(samples=list(item[1].values())),
+            merged.values(),
+        )
+    )
+
+
+def is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Response
+
+from buddy.metrics.exposition import OPENMETRICS_CONTENT_TYPE, render_openmetrics
+from buddy.metrics.multiprocess import collect_all_processes
+from buddy.middleware import record_threadpool_usage
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    record_threadpool_usage()
+
+    return Response(
+        content=render_openmetrics(collect_all_processes()),
+        media_type=OPENMETRICS_CONTENT_TYPE,
+    )
@@ -0,0 +1,86 @@
+import json
+import os
+from http import HTTPStatus
+
+from buddy.conf import settings
+from buddy.metrics import MetricFamily, Sample
+from buddy.metrics.multiprocess import (
+    MetricsWriter,
+    collect_all_processes,
+    merge_families,
+)
+
+
+def make_family(name: str, type, value: float, multiprocess_mode="sum"):
+    return MetricFamily(
+        name=name,
+        type=type,
+        documentation="Testing",
+        multiprocess_mode=multiprocess_mode,
+        samples=[Sample(suffix="", labels={"label": "value"}, value=value)],
+    )
+
+
+def test_metrics_are_served_in_the_openmetrics_format(client):
+    client.get("/health/ping")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("application/openmetrics-text")
+    assert response.text.endswith("# EOF\n")
+    assert "# TYPE buddy_http_request_duration_seconds histogram" in response.text
+    assert (
+        'buddy_http_request_duration_seconds_bucket{method="GET",route="/health/ping",status="200",le="+Inf"}'
+        in response.text
+    )
+    assert "# TYPE buddy_llm_tokens counter" in response.text
+    assert "buddy_threadpool_max_threads " in response.text
+
+
+def test_metrics_of_several_processes_get_merged():
+    merged = merge_families(
+        [
+            (
+                [
+                    make_family("requests", "counter", 1),
+                    make_family("in_flight", "gauge", 2),
+                    make_family("queued", "gauge", 3, multiprocess_mode="max"),
+                ],
+                True,
+            ),
+            (
+                [
+                    make_family("requests", "counter", 4),
+                    make_family("in_flight", "gauge", 5),
+                    make_family("queued", "gauge", 6, multiprocess_mode="max"),
+                ],
+                True,
+            ),
+            (
+                [
+                    make_family("requests", "counter", 10),
+                    make_family("in_flight", "gauge", 100),
+                ],
+                False,
+            ),
+        ]
+    )
+    values = dict(map(lambda family: (family.name, family.samples[0].value), merged))
+
+    # Gauges of processes that exited are left out.
+    assert values == {"requests": 15, "in_flight": 7, "queued": 6}
+
+
+def test_metrics_written_by_other_processes_get_served(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_multiprocess_dir", str(tmp_path))
+    (tmp_path / f"{os.getppid()}.json").write_text(
+        json.dumps([make_family("buddy_elsewhere", "counter", 7)._asdict()])
+    )
+    MetricsWriter(directory=str(tmp_path), interval_seconds=60).close()
+
+    families = collect_all_processes()
+
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+    assert any(map(lambda family: family.name == "buddy_elsewhere", families))
+    assert any(map(lambda family: family.name == "buddy_llm_tokens", families))
@@ -0,0 +1,133 @@
+import logging
+import time
+from http import HTTPStatus
+
+from anyio.to_thread import current_default_thread_limiter
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from buddy.conf import settings
+from buddy.database import QueryStats, track_queries
+from buddy.metrics import Gauge, Histogram
+from buddy.utils.logger_utils import get_logger
+
+logger = get_logger()
+
+HTTP_REQUEST_DURATION = Histogram(
+    "buddy_http_request_duration_seconds",
+    "Time taken to answer HTTP requests, streams until their last chunk",
+    label_names=("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "buddy_http_requests_in_flight", "HTTP requests being answered"
+)
+THREADPOOL_BUSY_THREADS = Gauge(
+    "buddy_threadpool_busy_threads",
+    "Threads running sync endpoints and dependencies, as of the last request",
+)
+THREADPOOL_MAX_THREADS = Gauge(
+    "buddy_threadpool_max_threads",
+    "Threads available to sync endpoints and dependencies",
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        # Unhandled exceptions never start a response, they get turned into a 500.
+        status = HTTPStatus.INTERNAL_SERVER_ERROR.value
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        record_threadpool_usage()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # Templates rather than paths keep the amount of series bounded.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started_at,
+                method=scope["method"],
+                route=route,
+                status=str(status),
+            )
+
+
+class QueryStatsMiddleware:
+    """
+    Reports the statements every request sent in a `Server-Timing` header and in the
+    logs. Statements sent once the headers went out, while streaming or in background
+    tasks, only make it into the logs.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+
+            async def send_with_server_timing(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", format_server_timing(stats)
+                    )
+
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_server_timing)
+            finally:
+                log_query_stats(scope=scope, stats=stats)
+
+
+def format_server_timing(stats: QueryStats) -> str:
+    return ", ".join(
+        [
+            f'db;dur={stats.total_seconds * 1000:.2f};desc="{stats.count} queries"',
+            f"db-slowest;dur={stats.slowest_seconds * 1000:.2f}",
+        ]
+    )
+
+
+def log_query_stats(scope: Scope, stats: QueryStats) -> None:
+    total_ms = stats.total_seconds * 1000
+    level = logging.DEBUG
+    if total_ms >= settings.database_slow_request_ms:
+        level = logging.WARNING
+
+    logger.log(
+        level,
+        f"{scope['method']} {scope['path']} sent {stats.count} queries in {total_ms:.2f}ms",
+        extra={
+            "http_method": scope["method"],
+            "http_path": scope["path"],
+            "db_queries": stats.count,
+            "db_duration_ms": round(total_ms, 2),
+            "db_slowest_duration_ms": round(stats.slowest_seconds * 1000, 2),
+            "db_slowest_statement": stats.slowest_statement,
+        },
+    )
+
+
+def record_threadpool_usage() -> None:
+    limiter = current_default_thread_limiter()
+    THREADPOOL_BUSY_THREADS.set(limiter.borrowed_tokens)
+    THREADPOOL_MAX_THREADS.set(limiter.total_tokens)
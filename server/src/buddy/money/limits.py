@@ -0,0 +1,18 @@
+from typing import NamedTuple
+
+from buddy.money.tiers import UserTiers
+
+
+class TierLimits(NamedTuple):
+    # Chat requests refill at this rate, up to `request_burst` can be made at once.
+    requests_per_minute: float
+    request_burst: int
+    # Prompt and completion tokens, the day starts at midnight in `settings.timezone`.
+    daily_tokens: int
+
+
+TIER_LIMITS: dict[UserTiers, TierLimits] = {
+    UserTiers.FREE: TierLimits(
+        requests_per_minute=20, request_burst=10, daily_tokens=500_000
+    ),
+}
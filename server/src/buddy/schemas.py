@@ -18,3 +18,7 @@ class OKResponse(BaseModel):
 
 class CreatedResponse(BaseModel):
     detail: Literal["Created"]
+
+
+class AcceptedResponse(BaseModel):
+    detail: Literal["Accepted"]
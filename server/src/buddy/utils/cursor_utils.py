@@ -0,0 +1,21 @@
+import base64
+import json
+
+
+def encode_cursor(values: list[str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list[str] | None:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        return None
+
+    if not isinstance(values, list):
+        return None
+
+    if not all(map(lambda value: isinstance(value, str), values)):
+        return None
+
+    return values
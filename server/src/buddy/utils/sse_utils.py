@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+
+SERVER_SENT_EVENTS_MEDIA_TYPE = "text/event-stream"
+SERVER_SENT_EVENTS_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stops reverse proxies from buffering the stream until it completes.
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_server_sent_event(event: str, data: BaseModel) -> str:
+    return f"event: {event}\ndata: {data.model_dump_json()}\n\n"